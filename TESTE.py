@@ -3,11 +3,21 @@
 # Base legal: arts. 6º, 40 e 92 da Lei 14.133/2021 e art. 30 do Decreto Municipal nº 09/2024
 
 import json
-from datetime import date
+import time
 from io import BytesIO
 
 import streamlit as st
-from docx import Document
+
+from importacao_e_combinacao_tr import gerar_texto_tr
+from admissao import FilaCheia, sessao_streamlit
+from busca_trs import obter_biblioteca
+from duplicatas import agrupar_textos, trechos_da_biblioteca
+from historico import campos_alterados, obter_historico
+from rascunhos import AutoSalvamento, obter_armazem, usuario_streamlit
+from tarefas import executar_admitido, ler_modelo_no_pool, tarefa_gerar_docx_texto
+from metricas import medir_geracao
+import trafego
+from rastreamento import coletar, painel_depuracao
 
 # ==========================
 # CONFIGURAÇÃO DA PÁGINA
@@ -63,6 +73,16 @@ if rascunho_file is not None:
     except Exception as e:
         st.sidebar.error(f"Erro ao ler JSON: {e}")
 
+# Rascunho salvo no servidor: o id fica na URL (?rascunho=...), então recarregar a página
+# ou reconectar retoma o mesmo rascunho.
+armazem = obter_armazem()
+usuario = usuario_streamlit()
+if "dados" not in st.session_state and st.query_params.get("rascunho"):
+    salvo = armazem.carregar(st.query_params["rascunho"], usuario)
+    if salvo is not None:
+        st.session_state["dados"] = salvo
+        st.session_state["autosave"] = AutoSalvamento(armazem, usuario, st.query_params["rascunho"], salvo)
+
 # Inicializa estrutura de dados na sessão
 if "dados" not in st.session_state:
     st.session_state["dados"] = {
@@ -81,9 +101,32 @@ if "dados" not in st.session_state:
         "ciclo_texto": "",
         "medicao_texto": "",
         "unidades_entrega": "",
+        "clausulas_extras": [],
     }
 
 d = st.session_state["dados"]
+if "autosave" not in st.session_state:
+    st.session_state["autosave"] = AutoSalvamento(armazem, usuario, dados_salvos=d)
+autosave = st.session_state["autosave"]
+
+recentes = armazem.listar(usuario, limite=10)
+if recentes:
+    rotulos = {r["id"]: f"{r['titulo']} ({time.strftime('%d/%m %H:%M', time.localtime(r['atualizado_em']))})" for r in recentes}
+    escolhido = st.sidebar.selectbox("Rascunhos recentes", list(rotulos), format_func=rotulos.get, key="rascunho_escolhido")
+    abrir, novo = st.sidebar.columns(2)
+    if abrir.button("Abrir", key="rascunho_abrir"):
+        autosave.registrar(d, forcar=True)
+        salvo = armazem.carregar(escolhido, usuario) or {}
+        st.session_state["dados"] = salvo
+        st.session_state["autosave"] = AutoSalvamento(armazem, usuario, escolhido, salvo)
+        st.query_params["rascunho"] = escolhido
+        st.rerun()
+    if novo.button("Novo", key="rascunho_novo"):
+        autosave.registrar(d, forcar=True)
+        for chave in ("dados", "autosave"):
+            st.session_state.pop(chave, None)
+        st.query_params.pop("rascunho", None)
+        st.rerun()
 
 # Utilitário: baixar rascunho
 def baixar_json():
@@ -298,65 +341,6 @@ if etapa == "5) Critérios de medição":
         height=170,
     )
 
-# ==========================
-# FUNÇÃO – GERAR TEXTO DO TR
-# ==========================
-
-def gerar_texto_tr(d: dict) -> str:
-    obj = d.get("objeto", "").strip()
-    sub = d.get("subcategoria", "")
-
-    # Cabeçalho institucional
-    partes = [
-        "PREFEITURA MUNICIPAL DE BRASNORTE - MT",
-        "SECRETARIA MUNICIPAL DE ADMINISTRAÇÃO",
-        "",
-        "TERMO DE REFERÊNCIA",
-        "",
-        "1. DAS CONDIÇÕES GERAIS DA CONTRATAÇÃO",
-        f"\n1.1 O presente termo de referência tem por objeto o {obj.upper() if obj else '[OBJETO NÃO INFORMADO]'}, com sede localizada no município de Brasnorte-MT, em conformidade com as especificações de descrição e quantidade detalhadamente elencadas neste documento, amparada pelas disposições legais vigentes que regulam tal procedimento, visando atender as necessidades da Prefeitura Municipal de Brasnorte-MT e de suas Secretarias Municipais;",
-        "\n1.2 O objeto desta contratação não se enquadra como sendo de bem de luxo, conforme Decreto Municipal nº 03/2024;",
-        f"\n1.3 O prazo de vigência da contratação é de {d.get('vigencia_meses',12)} (doze) meses, contados da data de assinatura da ARP (Ata de Registro de Preços) ou do Contrato, na forma do art. 105 da Lei nº 14.133/2021, podendo ser prorrogado a critério da Administração Pública.",
-        ("\n1.4 O prazo de vigência poderá ser prorrogado, desde que haja interesse de ambas as partes, nos termos dos arts. 106 e 107 da Lei nº 14.133/2021." if d.get("prorrogavel", True) else ""),
-        "",
-        "2. DESCRIÇÃO DA NECESSIDADE DA CONTRATAÇÃO E FUNDAMENTAÇÃO LEGAL",
-        f"\n2.1 A presente contratação se fundamenta na necessidade institucional de garantir o atendimento contínuo e eficiente relativo a {sub.lower()} para as unidades/secretarias do Município, assegurando a continuidade dos serviços públicos e o cumprimento da missão institucional.",
-        "\n2.2 A contratação tem por finalidade atender às Secretarias Municipais, promovendo suporte às atividades administrativas, operacionais e técnicas, conforme planejamento da gestão e demanda das unidades requisitantes;",
-        "\n2.3 Justifica-se pela inexistência de estrutura própria que permita a execução direta, sendo necessária a contratação especializada para garantir eficiência, economicidade e regularidade;",
-        f"\n2.4 O procedimento adotado será a modalidade {d.get('modalidade')} com critério de julgamento {d.get('criterio').lower()}, observado o disposto na Lei nº 14.133/2021." ,
-        ("\n2.5 Será adotado o Sistema de Registro de Preços (SRP), nos termos do Decreto Federal nº 11.462/2023, proporcionando flexibilidade e economicidade." if d.get("srp", True) else ""),
-        "",
-        "3. DESCRIÇÃO DA SOLUÇÃO COMO UM TODO CONSIDERADO O CICLO DE VIDA DO OBJETO E ESPECIFICAÇÃO",
-        f"\n3.1 {d.get('solucao_texto','')}",
-        f"\n3.2 Ciclo de vida do objeto: {d.get('ciclo_texto','')} ",
-        "",
-        "4. REQUISITOS DA CONTRATAÇÃO",
-        "\n4.1 A contratada deverá atender, no mínimo, aos seguintes requisitos:" ,
-    ]
-
-    # Lista de requisitos marcados
-    for i, r in enumerate(d.get("requisitos_marcados", []), start=1):
-        partes.append(f"\n4.1.{i} {r}.")
-    if d.get("requisitos_extra"):
-        partes.append(f"\n4.2 Requisitos adicionais: {d['requisitos_extra']}")
-
-    partes += [
-        "",
-        "5. MODELO DE EXECUÇÃO CONTRATUAL",
-        "\n5.1 A execução contratual se dará mediante ordens de fornecimento/serviço emitidas pela Administração, com fiscalização designada conforme a Lei nº 14.133/2021;",
-        "\n5.2 Os pagamentos ocorrerão após aceite formal, mediante apresentação de nota fiscal e relatório de entrega/execução, em conformidade com as especificações e quantitativos contratados;",
-        "\n5.3 A gestão e a fiscalização observarão os arts. 117 a 124 da Lei nº 14.133/2021, incluindo registros de ocorrências, notificações e relatórios de acompanhamento;",
-        "",
-        "6. CRITÉRIOS DE MEDIÇÃO",
-        f"\n6.1 {d.get('medicao_texto','Medição baseada em entregas/serviços atestados pelo fiscal, com pagamento após aceite.')}",
-        "",
-        f"**Brasnorte - MT, {date.today().strftime('%d/%m/%Y')}**",
-        "\n---\n",
-        "Este documento é gerado automaticamente com base nas diretrizes legais vigentes e poderá ser personalizado conforme peculiaridades do objeto. Recomenda-se revisão da Procuradoria Jurídica e do Controle Interno.",
-    ]
-
-    return "\n".join([p for p in partes if p is not None and p != ""])
-
 # ==========================
 # ETAPA 6 – PRÉVIA E EXPORTAÇÃO
 # ==========================
@@ -367,30 +351,43 @@ if etapa == "6) Prévia e exportação":
     if not d.get("objeto"):
         st.error("Informe o objeto da contratação na etapa 1.")
     else:
+        if d.get("clausulas_extras"):
+            st.markdown("**Cláusulas inseridas da biblioteca** (item 7 do TR)")
+            for i, c in enumerate(list(d["clausulas_extras"])):
+                col_c, col_x = st.columns([6, 1])
+                col_c.caption(f"{c['origem']} — {c['texto'][:160]}")
+                if col_x.button("Remover", key=f"rem_clausula_{i}"):
+                    d["clausulas_extras"].pop(i)
+                    st.rerun()
+
         texto = gerar_texto_tr(d)
         st.markdown("### 📄 Prévia do Termo de Referência")
         st.text_area("Conteúdo gerado:", texto, height=500)
 
         # Exportar DOCX
-        def gerar_docx(texto: str) -> BytesIO:
-            doc = Document()
-            if logo:
-                # Insere logotipo no topo (se o usuário enviou). Tamanho dependerá da imagem.
-                doc.add_picture(logo)
-            for linha in texto.split("\n"):
-                doc.add_paragraph(linha)
-            buf = BytesIO()
-            doc.save(buf)
-            buf.seek(0)
-            return buf
-
-        docx_bin = gerar_docx(texto)
-        st.download_button(
-            label="📥 Baixar TR em Word (.docx)",
-            data=docx_bin,
-            file_name="Termo_de_Referencia_Brasnorte.docx",
-            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-        )
+        if st.button("📄 Gerar TR em Word", type="primary"):
+            aviso = st.empty()
+            try:
+                with st.spinner("Gerando o documento..."), coletar() as spans, medir_geracao("TESTE", "interno") as medida:
+                    docx_bin = executar_admitido(
+                        sessao_streamlit(), tarefa_gerar_docx_texto, texto, logo.getvalue() if logo else None,
+                        ao_aguardar=lambda pos: aviso.info(f"Aguardando vaga para gerar: posição {pos} na fila."),
+                    )
+                    medida["bytes"] = len(docx_bin)
+                trafego.capturar("TESTE", "assistente", dados=d, logo=logo.getvalue() if logo else None)
+                if autosave.rascunho_id:
+                    obter_historico().registrar(autosave.rascunho_id, "documento", texto.split("\n"))
+            except FilaCheia as e:
+                aviso.error(f"Servidor ocupado ({e}). Tente novamente em instantes.")
+            else:
+                aviso.empty()
+                st.download_button(
+                    label="📥 Baixar TR em Word (.docx)",
+                    data=docx_bin,
+                    file_name="Termo_de_Referencia_Brasnorte.docx",
+                    mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+                )
+                painel_depuracao(spans)
 
         # Exportar rascunho JSON desta tela
         st.download_button(
@@ -400,5 +397,115 @@ if etapa == "6) Prévia e exportação":
             mime="application/json",
         )
 
+# ==========================
+# BIBLIOTECA DE TRs ANTERIORES
+# ==========================
+st.markdown("---")
+with st.expander("🔎 Buscar cláusulas em TRs anteriores"):
+    biblioteca = obter_biblioteca()
+    novos = st.file_uploader(
+        "Adicionar TRs (.docx) à biblioteca",
+        type=["docx"],
+        accept_multiple_files=True,
+        key="biblioteca_upload",
+    )
+    for f in novos or []:
+        dados_arquivo = f.getvalue()
+        if not biblioteca.ja_indexado(dados_arquivo):
+            n = biblioteca.ingerir(f.name, dados_arquivo, ler_modelo_no_pool(dados_arquivo))
+            st.success(f"{f.name}: {n} seção(ões) indexada(s).")
+    st.caption(f"{len(biblioteca.arquivos())} TR(s) na biblioteca.")
+    if st.button("Detectar cláusulas quase duplicadas", key="biblioteca_duplicatas"):
+        trechos = trechos_da_biblioteca(biblioteca)
+        textos = dict(trechos)
+        grupos = agrupar_textos(trechos, limiar=0.8)
+        st.info(f"{len(grupos)} grupo(s) de variantes entre {len(trechos)} parágrafo(s).")
+        for grupo in grupos[:20]:
+            st.markdown(f"**{len(grupo.chaves)} variantes** (similaridade ≥ {grupo.similaridade_minima:.0%})")
+            for chave in grupo.chaves:
+                _, nome, titulo, _ = chave
+                st.caption(f"{nome} / {titulo}: {textos[chave][:200]}")
+
+    consulta = st.text_input("Buscar", placeholder="ex.: glosa botijão P13", key="biblioteca_consulta")
+    if consulta:
+        resultados = biblioteca.buscar(consulta)
+        if not resultados:
+            st.info("Nenhuma seção encontrada.")
+        for r in resultados:
+            st.markdown(f"**{r.titulo}** <span class='badge'>{r.nome}</span>", unsafe_allow_html=True)
+            st.markdown(r.trecho.replace("\n", " "))
+            if st.button("Inserir no TR", key=f"inserir_clausula_{r.id}"):
+                d.setdefault("clausulas_extras", []).append(
+                    {"titulo": r.titulo, "texto": r.texto.replace("\n", " "), "origem": f"{r.nome} – {r.titulo}"}
+                )
+                st.toast("Cláusula inserida no item 7 do TR.")
+
+# Salvamento automático: grava só os campos alterados, no máximo a cada 2 s; cada
+# gravação vira uma versão no histórico. Se algo ficar pendente (editado a menos de 2 s da
+# última gravação), o fragmento roda de novo sozinho depois do intervalo e grava, sem
+# esperar outra interação: senão, fechar a aba logo depois perderia as últimas edições.
+historico = obter_historico()
+
+
+def salvar_rascunho() -> None:
+    autosave = st.session_state["autosave"]
+    dados = st.session_state["dados"]
+    if autosave.registrar(dados):
+        historico.registrar(autosave.rascunho_id, "dados", dados)
+        if st.query_params.get("rascunho") != autosave.rascunho_id:
+            st.query_params["rascunho"] = autosave.rascunho_id
+
+
+salvar_rascunho()
+
+
+@st.fragment(run_every=autosave.intervalo if autosave.pendente else None)
+def salvamento_pendente() -> None:
+    salvar_rascunho()
+    st.caption("💾 Alterações pendentes…" if st.session_state["autosave"].pendente else "💾 Rascunho salvo no servidor.")
+
+
+with st.sidebar:
+    salvamento_pendente()
+
+if autosave.rascunho_id:
+    with st.sidebar.expander("🕘 Histórico de versões"):
+        versoes = historico.versoes(autosave.rascunho_id, "dados")
+        if versoes:
+            rotulos_v = {
+                v["versao"]: f"v{v['versao']} – {time.strftime('%d/%m %H:%M:%S', time.localtime(v['criado_em']))}"
+                for v in versoes
+            }
+            versao = st.selectbox("Versão", list(rotulos_v), format_func=rotulos_v.get, key="historico_versao")
+            antiga = historico.obter(autosave.rascunho_id, "dados", versao)
+            alterados = campos_alterados(antiga, d)
+            st.caption("Campos diferentes do atual: " + (", ".join(alterados) if alterados else "nenhum"))
+            if alterados and st.button("Restaurar esta versão", key="historico_restaurar"):
+                st.session_state["dados"] = antiga
+                if autosave.registrar(antiga, forcar=True):
+                    historico.registrar(autosave.rascunho_id, "dados", antiga)
+                st.rerun()
+            st.caption(
+                f"{len(versoes)} versão(ões), {sum(v['armazenado'] for v in versoes) / 1024:.1f} KB armazenados "
+                f"({sum(v['tamanho'] for v in versoes) / 1024:.1f} KB sem compressão)."
+            )
+        versoes_doc = historico.versoes(autosave.rascunho_id, "documento")
+        if versoes_doc:
+            st.markdown("**TR gerado** (uma versão por geração em Word)")
+            rotulos_doc = {
+                v["versao"]: f"v{v['versao']} – {time.strftime('%d/%m %H:%M:%S', time.localtime(v['criado_em']))}"
+                for v in versoes_doc
+            }
+            versao_doc = st.selectbox("Versão do TR", list(rotulos_doc), format_func=rotulos_doc.get, key="historico_documento")
+            paragrafos = historico.obter(autosave.rascunho_id, "documento", versao_doc)
+            st.caption(f"{len(paragrafos)} parágrafo(s).")
+            st.download_button(
+                "Baixar o texto desta versão (.txt)",
+                "\n".join(paragrafos),
+                file_name=f"TR_v{versao_doc}.txt",
+                mime="text/plain",
+                key="historico_documento_baixar",
+            )
+
 # Rodapé
 st.markdown("<span class='muted'>Agente de Licitações – Prefeitura de Brasnorte • Lei 14.133/2021</span>", unsafe_allow_html=True)
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+Módulo: admissao.py
+
+Controle de admissão para a geração de documentos em cada processo do servidor.
+
+- **Limite de gerações simultâneas** (``TR_MAX_GERACOES``; padrão = ``TR_WORKERS`` ou CPUs):
+  evita que muitos `Document` sejam montados ao mesmo tempo e estourem a memória.
+- **Parcela justa por sessão**: o excedente espera em filas por sessão, atendidas em
+  rodízio; uma sessão com muitos pedidos não passa na frente das outras.
+- **Posição na fila**: quem espera recebe a sua posição (1 = próximo a entrar).
+- **Rejeição antecipada**: com a fila cheia (``TR_MAX_FILA``) ou a sessão no seu limite
+  (``TR_MAX_POR_SESSAO``), o pedido é recusado na hora com `FilaCheia`.
+
+Uso:
+
+    with admitir(sessao_streamlit(), ao_aguardar=lambda pos: aviso.info(f"Posição {pos}")):
+        ...  # monta e salva o DOCX
+"""
+from __future__ import annotations
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, Optional
+
+
+class FilaCheia(Exception):
+    """Pedido recusado: fila de geração cheia ou sessão acima do seu limite."""
+
+
+class PedidoCancelado(Exception):
+    """O ticket saiu da fila (`sair`) enquanto alguém ainda aguardava por ele."""
+
+
+@dataclass(eq=False)
+class Ticket:
+    sessao: str
+    seq: int
+    admitido: bool = False
+    cancelado: bool = False
+
+
+class ControleAdmissao:
+    def __init__(self, max_simultaneos: int, max_fila: int, max_por_sessao: int):
+        self.max_simultaneos = max_simultaneos
+        self.max_fila = max_fila
+        self.max_por_sessao = max_por_sessao
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        # Uma fila por sessão; a ordem do dict é a ordem do rodízio.
+        self._filas: "OrderedDict[str, Deque[Ticket]]" = OrderedDict()
+        self._em_execucao: Dict[str, int] = {}
+        self._ativos = 0
+        self._na_fila = 0
+
+    # ---- consulta ----
+
+    @property
+    def ativos(self) -> int:
+        return self._ativos
+
+    @property
+    def na_fila(self) -> int:
+        return self._na_fila
+
+    def posicao(self, ticket: Ticket) -> int:
+        """Posição do ticket na ordem de atendimento (0 = já admitido)."""
+        with self._cond:
+            return self._posicao(ticket)
+
+    def _posicao(self, ticket: Ticket) -> int:
+        if ticket.admitido:
+            return 0
+        fila = self._filas.get(ticket.sessao)
+        if fila is None or ticket not in fila:
+            return 0
+        # Rodízio: na rodada k sai o k-ésimo ticket de cada sessão, na ordem das sessões.
+        rodada = fila.index(ticket)
+        antes = 0
+        vem_antes = True  # sessões anteriores no rodízio também são atendidas nesta rodada
+        for sessao, outra in self._filas.items():
+            if sessao == ticket.sessao:
+                antes += rodada
+                vem_antes = False
+            else:
+                antes += min(len(outra), rodada + (1 if vem_antes else 0))
+        return antes + 1
+
+    # ---- entrada e saída ----
+
+    def entrar(self, sessao: str) -> Ticket:
+        """Reserva um lugar para `sessao`; levanta FilaCheia se não houver espaço."""
+        with self._cond:
+            vaga_imediata = self._ativos < self.max_simultaneos and self._na_fila == 0
+            if not vaga_imediata and self._na_fila >= self.max_fila:
+                raise FilaCheia("fila de geração cheia")
+            da_sessao = len(self._filas.get(sessao, ())) + self._em_execucao.get(sessao, 0)
+            if da_sessao >= self.max_por_sessao:
+                raise FilaCheia("limite de gerações simultâneas desta sessão atingido")
+            ticket = Ticket(sessao=sessao, seq=next(self._seq))
+            self._filas.setdefault(sessao, deque()).append(ticket)
+            self._na_fila += 1
+            self._despachar()
+            return ticket
+
+    def aguardar(
+        self,
+        ticket: Ticket,
+        timeout: Optional[float] = None,
+        ao_aguardar: Optional[Callable[[int], None]] = None,
+    ) -> None:
+        """Bloqueia até o ticket ser admitido, chamando `ao_aguardar(posicao)` quando a
+        posição muda. Levanta TimeoutError (e libera o lugar) se `timeout` expirar e
+        PedidoCancelado se o ticket for retirado da fila por `sair` (ex.: a corrotina que
+        esperava numa thread do executor foi cancelada)."""
+        limite = None if timeout is None else time.monotonic() + timeout
+        ultima = None
+        while True:
+            with self._cond:
+                if ticket.admitido:
+                    return
+                if ticket.cancelado:
+                    raise PedidoCancelado("pedido retirado da fila")
+                posicao = self._posicao(ticket)
+                if limite is not None and time.monotonic() >= limite:
+                    self._remover(ticket)
+                    raise TimeoutError("tempo de espera por uma vaga esgotado")
+            if ao_aguardar is not None and posicao != ultima:
+                ao_aguardar(posicao)
+                ultima = posicao
+            with self._cond:
+                if not (ticket.admitido or ticket.cancelado):
+                    espera = 0.5 if limite is None else max(0.0, min(0.5, limite - time.monotonic()))
+                    self._cond.wait(espera)
+
+    def sair(self, ticket: Ticket) -> None:
+        with self._cond:
+            if ticket.admitido:
+                ticket.admitido = False
+                self._ativos -= 1
+                restante = self._em_execucao.get(ticket.sessao, 1) - 1
+                if restante:
+                    self._em_execucao[ticket.sessao] = restante
+                else:
+                    self._em_execucao.pop(ticket.sessao, None)
+            else:
+                self._remover(ticket)
+            self._despachar()
+
+    @contextmanager
+    def admitir(
+        self,
+        sessao: str,
+        timeout: Optional[float] = None,
+        ao_aguardar: Optional[Callable[[int], None]] = None,
+    ):
+        ticket = self.entrar(sessao)
+        try:
+            self.aguardar(ticket, timeout=timeout, ao_aguardar=ao_aguardar)
+            yield ticket
+        finally:
+            self.sair(ticket)
+
+    # ---- internos (chamados com o lock) ----
+
+    def _remover(self, ticket: Ticket) -> None:
+        ticket.cancelado = True
+        fila = self._filas.get(ticket.sessao)
+        if fila is not None and ticket in fila:
+            fila.remove(ticket)
+            self._na_fila -= 1
+            if not fila:
+                del self._filas[ticket.sessao]
+        self._cond.notify_all()
+
+    def _despachar(self) -> None:
+        while self._ativos < self.max_simultaneos and self._filas:
+            sessao, fila = next(iter(self._filas.items()))
+            ticket = fila.popleft()
+            self._na_fila -= 1
+            # A sessão atendida vai para o fim do rodízio.
+            del self._filas[sessao]
+            if fila:
+                self._filas[sessao] = fila
+            ticket.admitido = True
+            self._ativos += 1
+            self._em_execucao[sessao] = self._em_execucao.get(sessao, 0) + 1
+        self._cond.notify_all()
+
+
+_controle: Optional[ControleAdmissao] = None
+_controle_lock = threading.Lock()
+
+
+def obter_controle() -> ControleAdmissao:
+    """Instância única do processo, configurada pelas variáveis de ambiente."""
+    global _controle
+    with _controle_lock:
+        if _controle is None:
+            workers = int(os.environ.get("TR_WORKERS", os.cpu_count() or 2))
+            _controle = ControleAdmissao(
+                max_simultaneos=int(os.environ.get("TR_MAX_GERACOES", workers)),
+                max_fila=int(os.environ.get("TR_MAX_FILA", 32)),
+                max_por_sessao=int(os.environ.get("TR_MAX_POR_SESSAO", 2)),
+            )
+        return _controle
+
+
+def admitir(sessao: str, timeout: Optional[float] = None, ao_aguardar: Optional[Callable[[int], None]] = None):
+    """Atalho para `obter_controle().admitir(...)`."""
+    return obter_controle().admitir(sessao, timeout=timeout, ao_aguardar=ao_aguardar)
+
+
+def sessao_streamlit() -> str:
+    """Id da sessão Streamlit que está executando o script ("" fora do Streamlit)."""
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+    except ImportError:
+        return ""
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else ""
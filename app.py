@@ -0,0 +1,41 @@
+# Agente de Licitações – app multipágina
+# Reúne os geradores de TR num único servidor Streamlit: cada app vira uma página e todas
+# compartilham o motor `importacao_e_combinacao_tr.py` (templates, leitura, combinação e
+# exportação), de modo que os caches de processo atendem a todas as páginas.
+#
+# Execução: streamlit run app.py
+
+import streamlit as st
+
+import metricas
+import perfil_cpu
+import perfil_memoria
+from admissao import sessao_streamlit
+from rastreamento import administrador, depuracao_ativa
+
+# /metrics para o Prometheus local (TR_METRICAS_PORTA, padrão 9464); sobe uma vez por processo.
+metricas.iniciar_servidor()
+
+paginas = [
+    st.Page("TESTE.py", title="Assistente de TR", icon="📑", default=True),
+    st.Page("mod1.py", title="TR detalhado + modelos Word", icon="🧩"),
+    st.Page("appTR1.py", title="Combinar modelo DOCX", icon="📄"),
+    st.Page("TERMO.py", title="Gerador simples", icon="📝"),
+]
+
+pagina = st.navigation(paginas)
+sessao = sessao_streamlit() or "local"
+
+# Perfil de CPU sob demanda (?perfil=1, ou armado pelo painel de administração): só o
+# rerun desta sessão e os jobs que ela envia ao pool passam pelo cProfile. O painel de
+# administração aparece com ?debug=1, mas só para quem está em TR_PERFIL_ADMIN.
+with perfil_cpu.capturar_rerun(sessao, pagina.title):
+    pagina.run()
+perfil_cpu.painel(sessao, admin=depuracao_ativa() and administrador())
+
+# Perfil de memória (TR_PERFIL_MEMORIA=1): mede o que a sessão retém ao fim de cada rerun;
+# com ?debug=1, mostra o relatório na barra lateral aos administradores (TR_PERFIL_ADMIN).
+if perfil_memoria.ativo():
+    perfil_memoria.registrar_sessao(sessao, st.session_state)
+    if depuracao_ativa() and administrador():
+        perfil_memoria.painel(sessao)
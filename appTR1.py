@@ -1,348 +1,44 @@
 # -*- coding: utf-8 -*-
 """
-Módulo: importacao_e_combinacao_tr.py
+App: appTR1.py
 
-Objetivo
---------
-1) **Ler modelos DOCX** como os enviados (ex.: "TR - SERVIÇOS POSTAIS - CORREIOS.docx"),
-   mesmo quando os títulos NÃO estão com estilos de Heading, mas sim com **numeração manual**
-   (1., 1.1, 2., 3. etc.).
-2) **Construir seções** preservando a ordem dos elementos (parágrafos e tabelas) do DOCX.
-3) **Combinar** o conteúdo importado com o **template interno** do app, com três modos:
-   - "modelo": usa somente o que veio do DOCX;
-   - "template": usa somente o template interno;
-   - **"complementar" (recomendado)**: usa o conteúdo do DOCX como base e **insere as seções
-     que estiverem faltando** a partir do template interno (respeitando a numeração).
-4) **Gerar o DOCX final** (opcionalmente já com cabeçalho e rodapé com imagens fornecidas).
+Monta o Termo de Referência a partir de um modelo DOCX com numeração manual, completando
+as seções ausentes com o template interno, e gera o DOCX final com cabeçalho e rodapé.
 
-Este arquivo foi escrito para ser facilmente integrado ao Streamlit do seu app. Basta:
-- importar as funções no seu `app.py`/`appTR.py`;
-- chamar `ler_modelo_docx()` quando o usuário fizer upload do modelo;
-- escolher o modo de combinação na UI e chamar `combinar_secoes()`;
-- por fim, chamar `gerar_docx()` para baixar o arquivo final.
-
-Requisitos:
-    python-docx
-
-Imagens de cabeçalho/rodapé (se desejar):
-    /mnt/data/logo-prefeitura.png
-    /mnt/data/rodapé.png
+A leitura, a combinação e a exportação ficam no motor compartilhado
+`importacao_e_combinacao_tr.py` (o mesmo usado pelas demais páginas de `app.py`).
 """
 from __future__ import annotations
-import re
-from dataclasses import dataclass, field
-from typing import List, Tuple, Dict, Optional
-
-from docx import Document
-from docx.oxml.table import CT_Tbl
-from docx.oxml.text.paragraph import CT_P
-from docx.shared import Inches
-
-# ==========================
-# Estruturas de dados
-# ==========================
-
-@dataclass
-class Elemento:
-    tipo: str  # 'p' ou 'table'
-    payload: object  # texto (str) quando 'p'; tabela (python-docx table) quando 'table'
-
-@dataclass
-class Secao:
-    titulo: str
-    numero: Optional[str]  # ex.: '1', '1.1', '2'
-    elementos: List[Elemento] = field(default_factory=list)
-
-# ==========================
-# Utilitários de parsing
-# ==========================
-
-_regex_inicio_secao = re.compile(r"^(?P<num>\d+(?:\.\d+)*)\s*[-–—)]?\s+", re.UNICODE)
-
-def _iter_elementos_em_ordem(doc: Document):
-    """Itera parágrafos e tabelas na ordem em que aparecem no corpo do documento.
-    Retorna tuplas (tipo, objeto), onde tipo ∈ {"p", "table"}.
-    """
-    body = doc.element.body
-    for child in body.iterchildren():
-        if isinstance(child, CT_P):
-            yield ("p", child)
-        elif isinstance(child, CT_Tbl):
-            yield ("table", child)
-
-
-def _wrap_paragraph(doc: Document, ct_p: CT_P):
-    # Constrói um objeto Paragraph python-docx a partir do CT_P bruto
-    return doc.paragraphs[0]._parent._paragraphs._p_to_paragraph(ct_p)
-
-
-def _wrap_table(doc: Document, ct_tbl: CT_Tbl):
-    # Constrói um objeto Table python-docx a partir do CT_Tbl bruto
-    return doc._part._element_to_table(ct_tbl)
-
-
-def _tenta_numero_secao(texto: str) -> Tuple[Optional[str], Optional[str]]:
-    """Se o parágrafo parecer início de seção numérica, retorna (numero, titulo_completo).
-    Caso contrário, (None, None).
-    """
-    raw = texto.strip()
-    if not raw:
-        return None, None
-    m = _regex_inicio_secao.match(raw)
-    if m:
-        numero = m.group("num")
-        return numero, raw
-    return None, None
-
-# ==========================
-# Leitura de DOCX em seções
-# ==========================
-
-def ler_modelo_docx(file_path_or_bytes) -> List[Secao]:
-    """Lê um DOCX e segmenta em seções por **numeração manual** (1., 1.1, 2., ...).
-    Preserva parágrafos e tabelas na ordem.
-
-    Retorna: lista de Secao, cada uma com `titulo`, `numero` (se detectado) e `elementos`.
-    """
-    doc = Document(file_path_or_bytes)
-    secoes: List[Secao] = []
-    secao_atual: Optional[Secao] = None
-
-    # Precisamos recriar objetos python-docx a partir de CT_P/CT_Tbl preservando ordem.
-    for tipo, child in _iter_elementos_em_ordem(doc):
-        if tipo == "p":
-            p = _wrap_paragraph(doc, child)
-            texto = p.text.strip()
-            numero, titulo = _tenta_numero_secao(texto)
-            if numero is not None:
-                # Fechar seção anterior
-                if secao_atual is not None:
-                    secoes.append(secao_atual)
-                secao_atual = Secao(titulo=titulo, numero=numero, elementos=[])
-            else:
-                if secao_atual is None:
-                    # Conteúdo prévio sem numeração: cria uma seção 0.
-                    secao_atual = Secao(titulo="0. PREÂMBULO", numero="0", elementos=[])
-                secao_atual.elementos.append(Elemento("p", texto))
-        else:  # table
-            tbl = _wrap_table(doc, child)
-            if secao_atual is None:
-                secao_atual = Secao(titulo="0. PREÂMBULO", numero="0", elementos=[])
-            secao_atual.elementos.append(Elemento("table", tbl))
-
-    if secao_atual is not None:
-        secoes.append(secao_atual)
-
-    return secoes
-
-# ==========================
-# Template interno (exemplo)
-# ==========================
-
-def template_interno_padrao() -> List[Secao]:
-    """Retorna seções do template interno. Aqui estão as 6 seções básicas
-    (ajuste conforme seu template real). Cada seção entra com um parágrafo
-    placeholder para que possam ser mescladas.
-    """
-    def s(num, titulo, texto):
-        return Secao(titulo=f"{num} {titulo}", numero=str(num).split()[0], elementos=[Elemento("p", texto)])
-
-    return [
-        Secao(titulo="1. DAS CONDIÇÕES GERAIS DA CONTRATAÇÃO", numero="1", elementos=[Elemento("p", "(Template interno) Detalhe completo da seção 1...")]),
-        Secao(titulo="2. DESCRIÇÃO DA NECESSIDADE DA CONTRATAÇÃO E FUNDAMENTAÇÃO LEGAL", numero="2", elementos=[Elemento("p", "(Template interno) Detalhe completo da seção 2...")]),
-        Secao(titulo="3. DESCRIÇÃO DA SOLUÇÃO COMO UM TODO CONSIDERADO O CICLO DE VIDA DO OBJETO E ESPECIFICAÇÃO DOS SERVIÇOS", numero="3", elementos=[Elemento("p", "(Template interno) Detalhe completo da seção 3...")]),
-        Secao(titulo="4. REQUISITOS DA CONTRATAÇÃO", numero="4", elementos=[Elemento("p", "(Template interno) Detalhe completo da seção 4...")]),
-        Secao(titulo="5. MODELO DE EXECUÇÃO CONTRATUAL", numero="5", elementos=[Elemento("p", "(Template interno) Detalhe completo da seção 5...")]),
-        Secao(titulo="6. CRITÉRIOS DE MEDIÇÃO", numero="6", elementos=[Elemento("p", "(Template interno) Detalhe completo da seção 6...")]),
-    ]
-
-# ==========================
-# Combinação de seções
-# ==========================
-
-def _index_por_numero(secoes: List[Secao]) -> Dict[str, Secao]:
-    idx: Dict[str, Secao] = {}
-    for s in secoes:
-        chave = s.numero if s.numero is not None else s.titulo.strip().lower()
-        idx[chave] = s
-    return idx
-
-
-def _ordenar_chaves_numericas(chaves: List[str]) -> List[str]:
-    def keyfn(k: str):
-        try:
-            partes = [int(x) for x in k.split('.')]
-            return partes
-        except Exception:
-            return [10**6]  # empurra não-numéricos para o fim
-    return sorted(chaves, key=keyfn)
-
-
-def combinar_secoes(
-    secoes_modelo: List[Secao],
-    secoes_template: List[Secao],
-    modo: str = "complementar"
-) -> List[Secao]:
-    """Combina seções do DOCX de modelo com o template interno.
-
-    modo:
-      - 'modelo'       -> retorna somente `secoes_modelo`.
-      - 'template'     -> retorna somente `secoes_template`.
-      - 'complementar' -> base = modelo; se uma numeração do template **não existir** no modelo,
-                          a seção do template é **inserida** (na ordem numérica).
-    """
-    if modo == "modelo":
-        return secoes_modelo
-    if modo == "template":
-        return secoes_template
-
-    # complementar
-    idx_modelo = _index_por_numero(secoes_modelo)
-    idx_template = _index_por_numero(secoes_template)
-
-    # chaves numéricas presentes nas duas bases
-    todas_chaves = set(idx_modelo.keys()) | set(idx_template.keys())
-    chaves_ordenadas = _ordenar_chaves_numericas(list(todas_chaves))
-
-    resultado: List[Secao] = []
-    for chave in chaves_ordenadas:
-        if chave in idx_modelo:
-            resultado.append(idx_modelo[chave])
-        else:
-            # chave só existe no template -> inserir
-            resultado.append(idx_template[chave])
-    return resultado
-
-# ==========================
-# Geração do DOCX final
-# ==========================
-
-def _add_header_image_if_exists(doc: Document, path: Optional[str]):
-    if not path:
-        return
-    try:
-        section = doc.sections[0]
-        header = section.header
-        paragraph = header.paragraphs[0] if header.paragraphs else header.add_paragraph()
-        run = paragraph.add_run()
-        # Ajuste a largura conforme necessário
-        run.add_picture(path, width=Inches(6.0))
-    except Exception:
-        pass
-
-
-def _add_footer_image_if_exists(doc: Document, path: Optional[str]):
-    if not path:
-        return
-    try:
-        section = doc.sections[0]
-        footer = section.footer
-        paragraph = footer.paragraphs[0] if footer.paragraphs else footer.add_paragraph()
-        run = paragraph.add_run()
-        run.add_picture(path, width=Inches(6.0))
-    except Exception:
-        pass
-
-
-def gerar_docx(
-    secoes: List[Secao],
-    caminho_saida: str,
-    header_img: Optional[str] = None,
-    footer_img: Optional[str] = None,
-) -> str:
-    """Gera um DOCX novo a partir das `secoes` combinadas.
-    - Recria parágrafos como texto.
-    - Para tabelas, replica o conteúdo (linhas/células) simples.
-    Retorna o caminho do arquivo gerado.
-    """
-    doc = Document()
-
-    _add_header_image_if_exists(doc, header_img)
-    _add_footer_image_if_exists(doc, footer_img)
-
-    for s in secoes:
-        # Título da seção
-        doc.add_paragraph(s.titulo)
-        # Conteúdo
-        for el in s.elementos:
-            if el.tipo == "p":
-                texto = str(el.payload).strip()
-                if texto:
-                    doc.add_paragraph(texto)
-            elif el.tipo == "table":
-                # Copiar estrutura básica da tabela
-                try:
-                    src_tbl = el.payload
-                    rows = len(src_tbl.rows)
-                    cols = len(src_tbl.columns)
-                    if rows > 0 and cols > 0:
-                        new_tbl = doc.add_table(rows=rows, cols=cols)
-                        for r in range(rows):
-                            for c in range(cols):
-                                new_tbl.cell(r, c).text = src_tbl.cell(r, c).text
-                except Exception:
-                    # fallback: ignorar tabela se der erro
-                    pass
-        # espaço entre seções
-        doc.add_paragraph("")
-
-    doc.save(caminho_saida)
-    return caminho_saida
-
-# ==========================
-# Exemplo de uso (Streamlit)
-# ==========================
-
-"""
-# No seu app Streamlit:
-
-import streamlit as st
-from io import BytesIO
-
-st.subheader("Monte o TR a partir de um modelo DOCX + template interno")
-modelo = st.file_uploader("Envie o modelo DOCX (opcional)", type=["docx"])
-modo = st.selectbox(
-    "Como combinar?",
-    ["complementar", "modelo", "template"],
-    index=0,
-    help=(
-        "complementar: usa o conteúdo do DOCX e preenche seções ausentes com o template interno;\n"
-        "modelo: usa só o DOCX;\n"
-        "template: usa só o template interno."
-    ),
+import os
+
+from importacao_e_combinacao_tr import (  # noqa: F401  (reexportados para compatibilidade)
+    Elemento,
+    Secao,
+    combinar_secoes,
+    gerar_docx,
+    ler_modelo_docx,
+    template_interno_padrao,
+)
+from arvore_secoes import ArvoreSecoes
+from diff_secoes import diff_secoes, html_lado_a_lado, resumo
+from plano_tr import plano_em_cache
+from metricas import medir_geracao
+import trafego
+from rastreamento import coletar, painel_depuracao
+from gerenciador_jobs import empacotar_zip, gerar_lote, obter_gerenciador
+from admissao import FilaCheia, sessao_streamlit
+from tarefas import (
+    executar_admitido,
+    ler_modelo_no_pool,
+    tarefa_combinar_e_gerar,
+    tarefa_combinar_fontes_e_gerar,
 )
 
-if st.button("Gerar DOCX"):
-    secoes_template = template_interno_padrao()
-    secoes_modelo = []
-    if modelo is not None:
-        secoes_modelo = ler_modelo_docx(modelo)
-
-    secoes_final = combinar_secoes(secoes_modelo, secoes_template, modo=modo)
-
-    buffer = BytesIO()
-    # ajuste os caminhos de cabeçalho/rodapé se desejar
-    caminho_temp = "/mnt/data/TR_final.docx"
-    gerar_docx(
-        secoes_final,
-        caminho_temp,
-        header_img="/mnt/data/logo-prefeitura.png",
-        footer_img="/mnt/data/rodapé.png",
-    )
-
-    with open(caminho_temp, "rb") as f:
-        st.download_button(
-            label="Baixar TR final (DOCX)",
-            data=f.read(),
-            file_name="TR_final.docx",
-            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-        )
-"""
 # ==============================================
 # appTR.py — Integração direta (pronto para uso)
 # ==============================================
 # Copie este trecho para o arquivo principal do seu app Streamlit (ex.: appTR.py)
-# ou substitua o conteúdo existente. Ele utiliza o módulo acima.
+# ou substitua o conteúdo existente. Ele utiliza o motor importado acima.
 
 if __name__ == "__main__":
     try:
@@ -372,6 +68,11 @@ if __name__ == "__main__":
             gerar_agora = st.checkbox("Gerar automaticamente ao carregar", value=False)
 
         st.markdown("---")
+        renumerar = st.checkbox(
+            "Renumerar seções e remissões após combinar",
+            value=False,
+            help="Refaz a numeração (1, 2, 2.1, ...) e corrige referências como 'conforme item 5.2'.",
+        )
         c1, c2, c3, c4 = st.columns([1,1,1,1])
         with c1:
             header_on = st.checkbox("Incluir cabeçalho", value=True)
@@ -383,13 +84,19 @@ if __name__ == "__main__":
             footer_path = st.text_input("Caminho da imagem do rodapé", value="/mnt/data/rodapé.png")
 
         st.markdown("---")
-        prev, gerar = st.columns([1,1])
+        prev, comparar, gerar = st.columns([1,1,1])
         with prev:
             if st.button("Pré-visualizar seções do modelo"):
                 if uploaded:
                     try:
-                        secoes_modelo = ler_modelo_docx(uploaded)
+                        secoes_modelo = ler_modelo_no_pool(uploaded)
                         st.success(f"Seções detectadas no modelo: {len(secoes_modelo)}")
+                        duplicadas = ArvoreSecoes(secoes_modelo, avisar=False).duplicadas
+                        if duplicadas:
+                            st.warning(
+                                "Numeração repetida no modelo: " + ", ".join(sorted(set(duplicadas)))
+                                + ". As repetições serão mantidas logo após a primeira ocorrência."
+                            )
                         for s in secoes_modelo:
                             st.markdown(f"**{s.titulo}** — {len(s.elementos)} elemento(s)")
                     except Exception as e:
@@ -397,31 +104,183 @@ if __name__ == "__main__":
                 else:
                     st.warning("Envie um arquivo DOCX para visualizar as seções.")
 
+        with comparar:
+            comparar_clicked = st.button("Comparar modelo × TR gerado")
         with gerar:
             clicked = st.button("Gerar DOCX final")
 
+        # Diff estrutural: seções alinhadas por número/título e parágrafos lado a lado.
+        if comparar_clicked:
+            if uploaded:
+                try:
+                    secoes_modelo = ler_modelo_no_pool(uploaded)
+                    secoes_tr = plano_em_cache(uploaded.getvalue(), modo, renumerar).renderizar()
+                    st.session_state["diff_tr"] = diff_secoes(secoes_modelo, secoes_tr)
+                except Exception as e:
+                    st.error(f"Erro ao comparar: {e}")
+            else:
+                st.warning("Envie um arquivo DOCX para comparar.")
+        if st.session_state.get("diff_tr") is not None:
+            diffs = st.session_state["diff_tr"]
+            contagem = resumo(diffs)
+            st.info(
+                f"{contagem['igual']} seção(ões) iguais, {contagem['alterada']} alterada(s), "
+                f"{contagem['adicionada']} só no TR gerado (template), {contagem['removida']} só no modelo."
+            )
+            incluir_iguais = st.checkbox("Mostrar também as seções iguais", key="diff_iguais")
+            st.markdown(html_lado_a_lado(diffs, incluir_iguais=incluir_iguais), unsafe_allow_html=True)
+
         if (gerar_agora and uploaded) or clicked:
             try:
-                secoes_template = template_interno_padrao()
-                secoes_modelo = ler_modelo_docx(uploaded) if uploaded else []
-                secoes_final = combinar_secoes(secoes_modelo, secoes_template, modo=modo)
-
-                out_path = "/mnt/data/TR_final.docx"
                 hpath = header_path if header_on else None
                 fpath = footer_path if footer_on else None
-                gerar_docx(secoes_final, out_path, header_img=hpath, footer_img=fpath)
-
-                with open(out_path, "rb") as f:
-                    st.download_button(
-                        "Baixar TR_final.docx",
-                        f.read(),
-                        file_name="TR_final.docx",
-                        mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+                aviso = st.empty()
+                with st.spinner("Gerando o documento..."), coletar() as spans, \
+                        medir_geracao("appTR1", "importado" if uploaded else "interno", modo) as medida:
+                    docx_bytes = executar_admitido(
+                        sessao_streamlit(),
+                        tarefa_combinar_e_gerar,
+                        uploaded.getvalue() if uploaded else None,
+                        modo,
+                        hpath,
+                        fpath,
+                        renumerar,
+                        ao_aguardar=lambda pos: aviso.info(f"Aguardando vaga para gerar: posição {pos} na fila."),
                     )
+                    medida["bytes"] = len(docx_bytes)
+                trafego.capturar("appTR1", "combinar", modelo=uploaded.getvalue() if uploaded else None, modo=modo,
+                                 renumerar=renumerar, cabecalho=hpath, rodape=fpath)
+                aviso.empty()
+
+                st.download_button(
+                    "Baixar TR_final.docx",
+                    docx_bytes,
+                    file_name="TR_final.docx",
+                    mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+                )
                 st.success("Documento gerado com sucesso!")
+                painel_depuracao(spans)
+            except FilaCheia as e:
+                st.error(f"Servidor ocupado ({e}). Tente novamente em instantes.")
             except Exception as e:
                 st.error(f"Falha ao gerar o DOCX: {e}")
 
+        # Várias fontes: cada seção vem da fonte de maior prioridade que a tiver,
+        # salvo as seções fixadas explicitamente numa fonte.
+        st.markdown("---")
+        st.subheader("Combinar várias fontes")
+        fontes_up = st.file_uploader(
+            "Modelos (DOCX) de origem",
+            type=["docx"],
+            accept_multiple_files=True,
+            key="fontes_modelos",
+            help="Ex.: o TR do ano passado e um modelo aprovado pelo TCE.",
+        )
+        fontes = [("template", None, st.number_input("Prioridade do template interno", value=0, step=1, key="prio_template"))]
+        for f in fontes_up or []:
+            fontes.append((f.name, f.getvalue(), st.number_input(f"Prioridade de {f.name}", value=1, step=1, key=f"prio_{f.name}")))
+        regras_txt = st.text_area(
+            "Seções fixadas (uma por linha: número = fonte)",
+            placeholder="4 = TR 2024.docx\n6 = Modelo TCE.docx",
+            help="A seção e todas as suas subseções vêm da fonte indicada. Use 'template' para o template interno.",
+        )
+        substituicoes = {}
+        for linha in regras_txt.splitlines():
+            if "=" in linha:
+                numero, nome = linha.split("=", 1)
+                substituicoes[numero.strip().rstrip(".")] = nome.strip()
+        if st.button("Gerar DOCX combinado", disabled=not fontes_up):
+            try:
+                aviso = st.empty()
+                with st.spinner("Combinando as fontes..."), coletar() as spans, medir_geracao("appTR1", "fontes") as medida:
+                    docx_bytes = executar_admitido(
+                        sessao_streamlit(),
+                        tarefa_combinar_fontes_e_gerar,
+                        [(nome, dados, int(prioridade)) for nome, dados, prioridade in fontes],
+                        substituicoes,
+                        header_path if header_on else None,
+                        footer_path if footer_on else None,
+                        renumerar,
+                        ao_aguardar=lambda pos: aviso.info(f"Aguardando vaga para gerar: posição {pos} na fila."),
+                    )
+                    medida["bytes"] = len(docx_bytes)
+                trafego.capturar("appTR1", "fontes", fontes=[(nome, dados, int(prioridade)) for nome, dados, prioridade in fontes],
+                                 substituicoes=substituicoes, renumerar=renumerar,
+                                 cabecalho=header_path if header_on else None, rodape=footer_path if footer_on else None)
+                aviso.empty()
+                st.download_button(
+                    "Baixar TR_combinado.docx",
+                    docx_bytes,
+                    file_name="TR_combinado.docx",
+                    mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+                )
+                painel_depuracao(spans)
+            except FilaCheia as e:
+                st.error(f"Servidor ocupado ({e}). Tente novamente em instantes.")
+            except Exception as e:
+                st.error(f"Falha ao combinar as fontes: {e}")
+
+        # Geração em lote: roda no gerenciador de jobs, em segundo plano.
+        st.markdown("---")
+        st.subheader("Geração em lote (segundo plano)")
+        gerenciador = obter_gerenciador()
+        lote = st.file_uploader(
+            "Modelos (DOCX) do lote",
+            type=["docx"],
+            accept_multiple_files=True,
+            key="lote_modelos",
+            help="Cada modelo gera um TR, com o mesmo modo de combinação e as mesmas imagens.",
+        )
+        if st.button("Iniciar lote", disabled=not lote):
+            itens = [
+                {"nome": f"{os.path.splitext(f.name)[0]} - TR.docx", "modelo": f.getvalue(), "modo": modo}
+                for f in lote
+            ]
+            job_id = gerenciador.submeter(
+                gerar_lote,
+                itens,
+                header_path if header_on else None,
+                footer_path if footer_on else None,
+                sessao_streamlit(),
+                descricao=f"{len(itens)} modelo(s) — modo {modo}",
+            )
+            st.session_state.setdefault("jobs_lote", []).append(job_id)
+
+        @st.fragment(run_every=1.0)
+        def painel_lote():
+            for job_id in list(st.session_state.get("jobs_lote", [])):
+                info = gerenciador.progresso(job_id)
+                if info is None:
+                    st.session_state["jobs_lote"].remove(job_id)
+                    continue
+                rotulo = f"{info['descricao']} — {info['etapa']}"
+                if info["item"]:
+                    rotulo += f" ({info['item']})"
+                st.progress(info["fracao"], text=rotulo)
+                if info["estado"] in ("pendente", "executando"):
+                    if st.button("Cancelar", key=f"cancelar_{job_id}"):
+                        gerenciador.cancelar(job_id)
+                elif info["estado"] == "concluido":
+                    st.download_button(
+                        "Baixar lote (.zip)",
+                        empacotar_zip(gerenciador.resultado(job_id)),
+                        file_name="TRs_lote.zip",
+                        mime="application/zip",
+                        key=f"baixar_{job_id}",
+                    )
+                elif info["estado"] == "erro":
+                    st.error(f"Falha no lote: {info['erro']}")
+                else:
+                    st.warning("Lote cancelado.")
+                if info["estado"] not in ("pendente", "executando"):
+                    if st.button("Remover da lista", key=f"remover_{job_id}"):
+                        gerenciador.descartar(job_id)
+                        st.session_state["jobs_lote"].remove(job_id)
+                        st.rerun(scope="fragment")
+
+        if st.session_state.get("jobs_lote"):
+            painel_lote()
+
         with st.expander("Requisitos (requirements.txt)"):
             st.code(
                 """
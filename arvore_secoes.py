@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+"""
+Módulo: arvore_secoes.py
+
+Árvore de seções indexada pelo **caminho numérico** ("4.2.3" -> 4 → 2 → 3), usada pela
+combinação de modelos em `importacao_e_combinacao_tr.py`.
+
+- **Busca** em O(profundidade): cada nível é um dict `parte -> nó`.
+- **Subárvore**: `subarvore("4")` devolve tudo o que está sob 4 (4.1, 4.1.1, 4.2, ...).
+- **Inserção ciente de duplicatas**: um número repetido não sobrescreve o anterior; a
+  seção extra fica guardada no mesmo nó, é registrada em `duplicadas` e gera um aviso
+  `NumeracaoDuplicada`.
+- **Ordem**: os filhos mantêm a ordem de inserção e só são ordenados (uma vez) se o
+  modelo vier fora de ordem; modelos já ordenados nunca são reordenados.
+- Seções sem numeração ficam à parte, na ordem de chegada, e saem no final.
+
+`mesclar_arvores(base, complemento)` faz a combinação "complementar" por subseção num
+único percurso simultâneo das duas árvores.
+
+`renumerar_secoes(secoes)` refaz a numeração depois de uma combinação (1, 2, 2.1, ...) e
+corrige as remissões no texto ("conforme item 5.2") a partir de um índice de referências.
+"""
+from __future__ import annotations
+import re
+import warnings
+from dataclasses import dataclass, replace
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from importacao_e_combinacao_tr import Secao
+
+
+class NumeracaoDuplicada(UserWarning):
+    """O modelo tem duas seções com o mesmo número."""
+
+
+def caminho_numerico(numero: Optional[str]) -> Optional[Tuple[int, ...]]:
+    """'4.2.3' -> (4, 2, 3); None para números ausentes ou não numéricos."""
+    if not numero:
+        return None
+    try:
+        return tuple(int(parte) for parte in numero.split("."))
+    except ValueError:
+        return None
+
+# ==========================
+# Nó
+# ==========================
+
+class NoSecao:
+    __slots__ = ("parte", "secao", "duplicadas", "filhos", "_ordenado")
+
+    def __init__(self, parte: int):
+        self.parte = parte
+        self.secao: Optional[Secao] = None  # None: nó só de passagem (ex.: há 4.1 mas não 4)
+        self.duplicadas: List[Secao] = []
+        self.filhos: Dict[int, NoSecao] = {}
+        self._ordenado = True
+
+    def filho(self, parte: int) -> NoSecao:
+        no = self.filhos.get(parte)
+        if no is None:
+            if self.filhos and parte < next(reversed(self.filhos)):
+                self._ordenado = False
+            no = self.filhos[parte] = NoSecao(parte)
+        return no
+
+    def filhos_em_ordem(self) -> List[NoSecao]:
+        if not self._ordenado:
+            self.filhos = dict(sorted(self.filhos.items()))
+            self._ordenado = True
+        return list(self.filhos.values())
+
+    def secoes_do_no(self) -> List[Secao]:
+        return ([self.secao] if self.secao is not None else []) + self.duplicadas
+
+# ==========================
+# Árvore
+# ==========================
+
+class ArvoreSecoes:
+    def __init__(self, secoes: Optional[List[Secao]] = None, avisar: bool = True):
+        self.raiz = NoSecao(0)
+        self.sem_numero: Dict[str, List[Secao]] = {}  # título normalizado -> seções
+        self.duplicadas: List[str] = []
+        self.avisar = avisar
+        for secao in secoes or []:
+            self.inserir(secao)
+
+    def inserir(self, secao: Secao) -> bool:
+        """Insere a seção; retorna False se o número (ou título, sem número) já existia."""
+        caminho = caminho_numerico(secao.numero)
+        if caminho is None:
+            chave = secao.titulo.strip().lower()
+            mesmas = self.sem_numero.setdefault(chave, [])
+            mesmas.append(secao)
+            if len(mesmas) > 1:
+                self._registrar_duplicada(secao.numero or secao.titulo.strip())
+                return False
+            return True
+
+        no = self.raiz
+        for parte in caminho:
+            no = no.filho(parte)
+        if no.secao is None:
+            no.secao = secao
+            return True
+        no.duplicadas.append(secao)
+        self._registrar_duplicada(secao.numero)
+        return False
+
+    def _registrar_duplicada(self, numero: str) -> None:
+        self.duplicadas.append(numero)
+        if self.avisar:
+            warnings.warn(
+                f"Seção {numero!r} aparece mais de uma vez no modelo; as repetições foram mantidas após a primeira.",
+                NumeracaoDuplicada,
+                stacklevel=3,
+            )
+
+    def no(self, numero: str) -> Optional[NoSecao]:
+        caminho = caminho_numerico(numero)
+        if caminho is None:
+            return None
+        no = self.raiz
+        for parte in caminho:
+            no = no.filhos.get(parte)
+            if no is None:
+                return None
+        return no
+
+    def obter(self, numero: str) -> Optional[Secao]:
+        """Seção com o número dado (a primeira, se houver repetições)."""
+        no = self.no(numero)
+        if no is not None:
+            return no.secao
+        mesmas = self.sem_numero.get((numero or "").strip().lower())
+        return mesmas[0] if mesmas else None
+
+    def __contains__(self, numero: str) -> bool:
+        return self.obter(numero) is not None
+
+    def subarvore(self, numero: str, incluir_raiz: bool = False) -> List[Secao]:
+        """Seções sob `numero` em ordem numérica (ex.: "4" -> 4.1, 4.1.1, 4.2 ...)."""
+        no = self.no(numero)
+        if no is None:
+            return []
+        resultado = no.secoes_do_no() if incluir_raiz else []
+        for filho in no.filhos_em_ordem():
+            resultado.extend(_percorrer(filho))
+        return resultado
+
+    def secoes(self) -> List[Secao]:
+        """Todas as seções em ordem numérica; as sem número vão no final."""
+        resultado: List[Secao] = []
+        for filho in self.raiz.filhos_em_ordem():
+            resultado.extend(_percorrer(filho))
+        for mesmas in self.sem_numero.values():
+            resultado.extend(mesmas)
+        return resultado
+
+
+def _percorrer(no: NoSecao) -> Iterator[Secao]:
+    # Pré-ordem iterativa: a própria seção, as repetições e então os filhos.
+    pilha = [no]
+    while pilha:
+        atual = pilha.pop()
+        yield from atual.secoes_do_no()
+        pilha.extend(reversed(atual.filhos_em_ordem()))
+
+# ==========================
+# Combinação por subseção
+# ==========================
+
+def mesclar_arvores(base: ArvoreSecoes, complemento: ArvoreSecoes) -> List[Secao]:
+    """Combinação "complementar": tudo o que está em `base`, mais as seções e subseções
+    de `complemento` cujo número não existe em `base`, cada uma na sua posição numérica.
+
+    Percorre as duas árvores juntas, nível a nível, intercalando os filhos já ordenados
+    (sem reordenar chaves): custo linear no total de nós.
+    """
+    resultado: List[Secao] = []
+    _mesclar_filhos(base.raiz, complemento.raiz, resultado)
+    for mesmas in base.sem_numero.values():
+        resultado.extend(mesmas)
+    for chave, mesmas in complemento.sem_numero.items():
+        if chave not in base.sem_numero:
+            resultado.extend(mesmas)
+    return resultado
+
+
+def _mesclar_filhos(no_base: Optional[NoSecao], no_comp: Optional[NoSecao], resultado: List[Secao]) -> None:
+    filhos_base = no_base.filhos_em_ordem() if no_base is not None else []
+    filhos_comp = no_comp.filhos_em_ordem() if no_comp is not None else []
+    i = j = 0
+    while i < len(filhos_base) or j < len(filhos_comp):
+        b = filhos_base[i] if i < len(filhos_base) else None
+        c = filhos_comp[j] if j < len(filhos_comp) else None
+        if c is None or (b is not None and b.parte < c.parte):
+            resultado.extend(_percorrer(b))
+            i += 1
+        elif b is None or c.parte < b.parte:
+            resultado.extend(_percorrer(c))
+            j += 1
+        else:
+            # Mesmo número nos dois: vale a base; o complemento só preenche lacunas.
+            resultado.extend(b.secoes_do_no() if b.secao is not None else c.secoes_do_no())
+            _mesclar_filhos(b, c, resultado)
+            i += 1
+            j += 1
+
+# ==========================
+# Renumeração e remissões
+# ==========================
+
+# Remissões como "item 5.2", "subitens 4.1 e 4.2", "cláusula 7", "seções 2, 3 ou 5".
+# Depois de ",", "e", "ou" ou "a", só conta um número com cara de seção: com ponto ("4.2")
+# ou seguido de pontuação, fim do texto ou outra continuação. Em "item 3 e 4 unidades" o
+# "4" é quantidade, não remissão; "item 3 e item 4" é casado como duas remissões.
+_CONTINUACAO = (
+    r"\s*(?:,|e|ou|a)\s*"
+    r"(?:\d+(?:\.\d+)+|\d+(?=\s*(?:[,;:)\]]|\.(?!\d)|$)|\s*(?:,|e|ou|a)\s*\d))"
+)
+_regex_referencia = re.compile(
+    r"\b(?:sub)?(?:itens|item|seção|seções|secao|secoes|cláusulas?|clausulas?|tópicos?|topicos?)\s+"
+    r"(?P<nums>\d+(?:\.\d+)*(?:" + _CONTINUACAO + r")*)",
+    re.IGNORECASE | re.UNICODE,
+)
+_regex_numero = re.compile(r"\d+(?:\.\d+)*")
+
+
+@dataclass(frozen=True)
+class Referencia:
+    secao: int  # índice da seção na lista
+    elemento: int  # índice do parágrafo na seção
+    inicio: int
+    fim: int
+    numero: str
+
+
+def indexar_referencias(secoes: List[Secao]) -> List[Referencia]:
+    """Localiza uma única vez todas as remissões numéricas nos parágrafos.
+
+    O índice depende só do texto: pode ser guardado e reaproveitado em várias
+    renumerações da mesma lista de seções.
+    """
+    indice: List[Referencia] = []
+    for i, secao in enumerate(secoes):
+        for j, elemento in enumerate(secao.elementos):
+            if elemento.tipo != "p" or not isinstance(elemento.payload, str):
+                continue
+            for m in _regex_referencia.finditer(elemento.payload):
+                base = m.start("nums")
+                for n in _regex_numero.finditer(m.group("nums")):
+                    indice.append(Referencia(i, j, base + n.start(), base + n.end(), n.group()))
+    return indice
+
+
+def novos_numeros(secoes: List[Secao]) -> Tuple[List[Optional[str]], Dict[str, str]]:
+    """Numeração sequencial pela profundidade de cada seção, num único percurso.
+
+    Retorna (novo número por posição, mapa número antigo -> novo). O preâmbulo ("0") e
+    as seções sem número ficam como estão; com números repetidos, as remissões passam a
+    apontar para a primeira ocorrência.
+    """
+    por_posicao: List[Optional[str]] = []
+    mapa: Dict[str, str] = {}
+    contadores: List[int] = []
+    for secao in secoes:
+        caminho = caminho_numerico(secao.numero)
+        if caminho is None or caminho == (0,):
+            por_posicao.append(secao.numero)
+            continue
+        profundidade = len(caminho)
+        if len(contadores) >= profundidade:
+            del contadores[profundidade:]
+            contadores[-1] += 1
+        else:
+            contadores.extend([1] * (profundidade - len(contadores)))
+        novo = ".".join(str(c) for c in contadores)
+        por_posicao.append(novo)
+        mapa.setdefault(secao.numero, novo)
+    return por_posicao, mapa
+
+
+def renumerar_secoes(secoes: List[Secao], indice: Optional[List[Referencia]] = None) -> List[Secao]:
+    """Devolve novas seções com números, títulos e remissões no texto atualizados.
+
+    As seções de entrada não são alteradas (podem vir de caches compartilhados). Só os
+    parágrafos que aparecem no índice de referências são reescritos.
+    """
+    if indice is None:
+        indice = indexar_referencias(secoes)
+    por_posicao, mapa = novos_numeros(secoes)
+
+    # Remissões que mudam, agrupadas por seção e parágrafo, na ordem do texto.
+    alteracoes: Dict[int, Dict[int, List[Referencia]]] = {}
+    for ref in indice:
+        if mapa.get(ref.numero, ref.numero) != ref.numero:
+            alteracoes.setdefault(ref.secao, {}).setdefault(ref.elemento, []).append(ref)
+
+    resultado: List[Secao] = []
+    for i, secao in enumerate(secoes):
+        elementos = secao.elementos
+        if i in alteracoes:
+            elementos = list(elementos)
+            for j, refs in alteracoes[i].items():
+                texto = elementos[j].payload
+                partes, pos = [], 0
+                for ref in refs:
+                    partes.append(texto[pos:ref.inicio])
+                    partes.append(mapa[ref.numero])
+                    pos = ref.fim
+                partes.append(texto[pos:])
+                elementos[j] = replace(elementos[j], payload="".join(partes))
+
+        novo = por_posicao[i]
+        titulo = secao.titulo
+        if novo != secao.numero and secao.numero and titulo.startswith(secao.numero):
+            titulo = novo + titulo[len(secao.numero):]
+        if novo == secao.numero and elementos is secao.elementos:
+            resultado.append(secao)
+        else:
+            resultado.append(replace(secao, numero=novo, titulo=titulo, elementos=elementos))
+    return resultado
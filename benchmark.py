@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+Módulo: benchmark.py
+
+Benchmark do motor com modelos sintéticos de 10, 100, 1.000 e 10.000 parágrafos.
+
+Cada modelo tem numeração manual (1., 1.1, ...), títulos com estilo "Heading", tabelas e
+parágrafos com muitos runs (negrito/itálico alternados) e placeholders. Para cada tamanho
+são medidos:
+
+- ``ler_modelo_docx`` e ``ler_modelo_docx_headings`` (as duas variantes de leitura);
+- ``combinar_secoes`` com o template interno (modo complementar);
+- ``aplicar_placeholders`` (sobre as seções combinadas);
+- ``gerar_docx``, ``gerar_docx_blocos`` e ``gerar_docx_texto``.
+
+Para cada medição: mediana e mínimo do tempo de relógio em ``repeticoes`` execuções, pico
+de memória Python (tracemalloc, numa execução à parte para não distorcer o tempo; a árvore
+XML do lxml, alocada em C, não entra) e tamanho da saída (bytes do DOCX ou nº de itens). O resultado vai para um JSON com a revisão do git, que pode ser comparado com
+outro:
+
+    python benchmark.py                       # grava benchmark_<revisao>.json
+    python benchmark.py --tamanhos 10 100 --repeticoes 3
+    python benchmark.py --comparar antes.json depois.json
+"""
+from __future__ import annotations
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from io import BytesIO
+from typing import Callable, Dict, List, Optional, Tuple
+
+from docx import Document
+
+from importacao_e_combinacao_tr import (
+    aplicar_placeholders_secoes,
+    combinar_secoes,
+    gerar_docx,
+    gerar_docx_blocos,
+    gerar_docx_texto,
+    ler_modelo_docx,
+    ler_modelo_docx_headings,
+    template_interno_padrao,
+)
+
+TAMANHOS_PADRAO = (10, 100, 1_000, 10_000)
+
+_PALAVRAS = (
+    "fornecimento contratada contratante prazo entrega medição pagamento fiscalização "
+    "garantia proposta preço unidade quantidade vigência sanção obrigação execução "
+    "requisitos especificação item lote termo referência município secretaria"
+).split()
+
+CTX_PADRAO = {
+    "OBJETO": "fornecimento de gás liquefeito de petróleo (GLP)",
+    "MUNICIPIO": "Brasnorte-MT",
+    "SECRETARIA": "Secretaria Municipal de Administração",
+    "VIGENCIA": "12 (doze) meses",
+}
+
+# ==========================
+# Modelos sintéticos
+# ==========================
+
+def _frase(gerador: random.Random, palavras: int) -> str:
+    return " ".join(gerador.choice(_PALAVRAS) for _ in range(palavras))
+
+
+def gerar_modelo_sintetico(paragrafos: int, semente: int = 42) -> bytes:
+    """DOCX com cerca de `paragrafos` parágrafos: seções numeradas com estilo Heading a
+    cada ~20 parágrafos, subseções a cada ~5, uma tabela por seção e runs formatados."""
+    gerador = random.Random(semente)
+    doc = Document()
+    secao = subsecao = 0
+    escritos = 0
+    while escritos < paragrafos:
+        if escritos % 20 == 0:
+            secao += 1
+            subsecao = 0
+            doc.add_paragraph(f"{secao}. SEÇÃO {_frase(gerador, 3).upper()}", style="Heading 1")
+            tabela = doc.add_table(rows=4, cols=3)
+            for linha in tabela.rows:
+                for celula in linha.cells:
+                    celula.text = _frase(gerador, 3)
+        elif escritos % 5 == 0:
+            subsecao += 1
+            doc.add_paragraph(f"{secao}.{subsecao} {_frase(gerador, 4).capitalize()}", style="Heading 2")
+        else:
+            p = doc.add_paragraph()
+            for i in range(gerador.randint(6, 14)):
+                run = p.add_run(_frase(gerador, gerador.randint(2, 6)) + " ")
+                run.bold = i % 3 == 0
+                run.italic = i % 4 == 1
+            p.add_run("conforme {{OBJETO}} em {{MUNICIPIO}}.")
+        escritos += 1
+    buffer = BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+# ==========================
+# Medição
+# ==========================
+
+def _tamanho(valor) -> Optional[int]:
+    if isinstance(valor, BytesIO):
+        return valor.getbuffer().nbytes
+    if isinstance(valor, (list, tuple)):
+        return len(valor)
+    return None
+
+
+def medir(fn: Callable[[], object], repeticoes: int) -> Dict[str, object]:
+    """Mediana/mínimo do tempo (s), pico de memória (bytes) e tamanho da saída de `fn()`."""
+    tempos = []
+    saida = None
+    for _ in range(repeticoes):
+        gc.collect()
+        inicio = time.perf_counter()
+        saida = fn()
+        tempos.append(time.perf_counter() - inicio)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "tempo_mediana_s": round(statistics.median(tempos), 6),
+        "tempo_min_s": round(min(tempos), 6),
+        "memoria_pico_bytes": pico,
+        "saida": _tamanho(saida),
+    }
+
+
+def _casos(dados: bytes) -> List[Tuple[str, Callable[[], object]]]:
+    secoes = ler_modelo_docx(BytesIO(dados))
+    template = template_interno_padrao()
+    combinadas = combinar_secoes(secoes, template, modo="complementar")
+    com_ctx = aplicar_placeholders_secoes(combinadas, CTX_PADRAO)
+    blocos = [
+        (s.titulo, "\n\n".join(str(el.payload) for el in s.elementos if el.tipo == "p"))
+        for s in com_ctx
+    ]
+    texto = "\n".join(linha for s in com_ctx for linha in [s.titulo] + [str(el.payload) for el in s.elementos if el.tipo == "p"])
+
+    def exportar_secoes():
+        buffer = BytesIO()
+        gerar_docx(com_ctx, buffer)
+        return buffer
+
+    return [
+        ("ler_modelo_docx", lambda: ler_modelo_docx(BytesIO(dados))),
+        ("ler_modelo_docx_headings", lambda: ler_modelo_docx_headings(BytesIO(dados))),
+        ("combinar_secoes", lambda: combinar_secoes(secoes, template, modo="complementar")),
+        ("aplicar_placeholders", lambda: aplicar_placeholders_secoes(combinadas, CTX_PADRAO)),
+        ("gerar_docx", exportar_secoes),
+        ("gerar_docx_blocos", lambda: gerar_docx_blocos(blocos, CTX_PADRAO, logo_path=None, rodape_path=None)),
+        ("gerar_docx_texto", lambda: gerar_docx_texto(texto)),
+    ]
+
+
+def _repeticoes_para(paragrafos: int, repeticoes: int) -> int:
+    # Os modelos grandes levam segundos por execução; 3 medições bastam para a mediana.
+    return min(repeticoes, 3) if paragrafos >= 10_000 else repeticoes
+
+
+def executar(tamanhos=TAMANHOS_PADRAO, repeticoes: int = 5, semente: int = 42, saida=sys.stderr) -> List[dict]:
+    resultados = []
+    for paragrafos in tamanhos:
+        dados = gerar_modelo_sintetico(paragrafos, semente)
+        n = _repeticoes_para(paragrafos, repeticoes)
+        for nome, fn in _casos(dados):
+            medida = medir(fn, n)
+            resultados.append({"caso": nome, "paragrafos": paragrafos, "entrada_bytes": len(dados),
+                               "repeticoes": n, **medida})
+            print(f"{nome:<26} {paragrafos:>6} par.  {medida['tempo_mediana_s'] * 1000:>10.1f} ms  "
+                  f"{medida['memoria_pico_bytes'] / 2**20:>8.1f} MiB", file=saida)
+    return resultados
+
+
+def _revisao() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconhecida"
+
+
+def comparar(antes: dict, depois: dict) -> List[str]:
+    """Linhas com a razão depois/antes do tempo (mediana) e da memória por caso e tamanho."""
+    base = {(r["caso"], r["paragrafos"]): r for r in antes["resultados"]}
+    linhas = [f"{'caso':<26} {'par.':>6} {'tempo':>8} {'memória':>8}   ({antes['revisao']} -> {depois['revisao']})"]
+    for r in depois["resultados"]:
+        a = base.get((r["caso"], r["paragrafos"]))
+        if a is None:
+            continue
+        tempo = r["tempo_mediana_s"] / a["tempo_mediana_s"] if a["tempo_mediana_s"] else float("nan")
+        memoria = r["memoria_pico_bytes"] / a["memoria_pico_bytes"] if a["memoria_pico_bytes"] else float("nan")
+        linhas.append(f"{r['caso']:<26} {r['paragrafos']:>6} {tempo:>7.2f}x {memoria:>7.2f}x")
+    return linhas
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark de leitura, combinação e exportação de TRs.")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=list(TAMANHOS_PADRAO))
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--saida", help="arquivo JSON (padrão: benchmark_<revisão>.json)")
+    parser.add_argument("--comparar", nargs=2, metavar=("ANTES", "DEPOIS"))
+    args = parser.parse_args(argv)
+
+    if args.comparar:
+        with open(args.comparar[0], encoding="utf-8") as fa, open(args.comparar[1], encoding="utf-8") as fd:
+            print("\n".join(comparar(json.load(fa), json.load(fd))))
+        return
+
+    # Um span por chamada no log distorceria as medições.
+    logging.getLogger("tr.rastreamento").setLevel(logging.WARNING)
+    revisao = _revisao()
+    relatorio = {
+        "revisao": revisao,
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "semente": args.semente,
+        "resultados": executar(args.tamanhos, args.repeticoes, args.semente),
+    }
+    caminho = args.saida or f"benchmark_{revisao}.json"
+    with open(caminho, "w", encoding="utf-8") as f:
+        json.dump(relatorio, f, ensure_ascii=False, indent=1)
+    print(f"Resultados gravados em {caminho}")
+
+
+if __name__ == "__main__":
+    main()
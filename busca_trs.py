@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Módulo: busca_trs.py
+
+Índice de busca textual sobre a biblioteca de TRs anteriores, em SQLite FTS5.
+
+- Cada DOCX é lido por `ler_modelo_docx` (numeração manual) e cada seção vira uma linha
+  do índice (título, texto dos parágrafos e das tabelas, arquivo de origem).
+- A ingestão é **incremental por hash** do arquivo: reenviar um TR já indexado não custa nada.
+- O tokenizador ``unicode61 remove_diacritics 2`` ignora acentos e caixa, então
+  "botijao" encontra "botijão" e "medicao" encontra "MEDIÇÃO".
+- `buscar("glosa botijão P13")` devolve as seções ordenadas por relevância (BM25, com
+  peso maior para o título) e um trecho com os termos destacados.
+
+Configuração: ``TR_BIBLIOTECA_DB`` (padrão: ``biblioteca_trs.sqlite3`` na pasta do app).
+"""
+from __future__ import annotations
+import hashlib
+import os
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Tuple
+
+from importacao_e_combinacao_tr import Secao, ler_modelo_em_cache, linhas_tabela
+
+CAMINHO_PADRAO = os.environ.get(
+    "TR_BIBLIOTECA_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "biblioteca_trs.sqlite3")
+)
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS arquivos (
+    hash TEXT PRIMARY KEY,
+    nome TEXT NOT NULL,
+    secoes INTEGER NOT NULL,
+    ingerido_em REAL NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS secoes_fts USING fts5(
+    titulo,
+    texto,
+    nome UNINDEXED,
+    numero UNINDEXED,
+    hash UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+);
+"""
+
+_regex_termo = re.compile(r"\w+", re.UNICODE)
+
+
+@dataclass
+class ResultadoBusca:
+    id: int
+    titulo: str
+    numero: Optional[str]
+    nome: str  # arquivo de origem
+    trecho: str  # com os termos entre ** **
+    texto: str
+    relevancia: float  # BM25 (menor = mais relevante)
+
+
+def texto_da_secao(secao: Secao) -> str:
+    """Parágrafos e tabelas (células separadas por " | ") de uma seção, em texto corrido."""
+    linhas = []
+    for el in secao.elementos:
+        if el.tipo == "p":
+            linhas.append(str(el.payload))
+        else:
+            linhas.extend(" | ".join(linha) for linha in linhas_tabela(el.payload))
+    return "\n".join(l for l in linhas if l.strip())
+
+
+def _consulta_fts(consulta: str, operador: str) -> str:
+    # Cada termo entre aspas (nada de sintaxe FTS vinda do usuário) e como prefixo.
+    termos = _regex_termo.findall(consulta)
+    return f" {operador} ".join(f'"{t}"*' for t in termos)
+
+
+class BibliotecaTR:
+    def __init__(self, caminho: str = CAMINHO_PADRAO):
+        self.caminho = caminho
+        with self._conectar() as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.executescript(_ESQUEMA)
+
+    @contextmanager
+    def _conectar(self) -> Iterator[sqlite3.Connection]:
+        # Uma conexão por operação: o Streamlit atende cada rerun numa thread diferente.
+        con = sqlite3.connect(self.caminho, timeout=10)
+        try:
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    # ---- ingestão ----
+
+    def ja_indexado(self, dados: bytes) -> bool:
+        with self._conectar() as con:
+            return con.execute(
+                "SELECT 1 FROM arquivos WHERE hash = ?", (hashlib.sha256(dados).hexdigest(),)
+            ).fetchone() is not None
+
+    def ingerir(self, nome: str, dados: bytes, secoes: Optional[List[Secao]] = None) -> int:
+        """Indexa as seções do DOCX `dados`. Retorna quantas seções entraram (0 se o
+        arquivo já estava indexado). `secoes` evita reler o arquivo quando já foi lido."""
+        chave = hashlib.sha256(dados).hexdigest()
+        with self._conectar() as con:
+            if con.execute("SELECT 1 FROM arquivos WHERE hash = ?", (chave,)).fetchone():
+                return 0
+        if secoes is None:
+            secoes = ler_modelo_em_cache(dados)
+        linhas = [
+            (s.titulo, texto_da_secao(s), nome, s.numero, chave)
+            for s in secoes
+        ]
+        with self._conectar() as con:
+            if con.execute("SELECT 1 FROM arquivos WHERE hash = ?", (chave,)).fetchone():
+                return 0
+            con.executemany(
+                "INSERT INTO secoes_fts (titulo, texto, nome, numero, hash) VALUES (?, ?, ?, ?, ?)", linhas
+            )
+            con.execute(
+                "INSERT INTO arquivos (hash, nome, secoes, ingerido_em) VALUES (?, ?, ?, ?)",
+                (chave, nome, len(linhas), time.time()),
+            )
+        return len(linhas)
+
+    def ingerir_pasta(self, pasta: str) -> int:
+        """Indexa todos os .docx de `pasta` (recursivo). Retorna o total de seções novas."""
+        total = 0
+        for raiz, _, arquivos in os.walk(pasta):
+            for nome in sorted(arquivos):
+                if nome.lower().endswith(".docx") and not nome.startswith("~$"):
+                    with open(os.path.join(raiz, nome), "rb") as f:
+                        total += self.ingerir(nome, f.read())
+        return total
+
+    def remover(self, hash_arquivo: str) -> None:
+        with self._conectar() as con:
+            con.execute("DELETE FROM secoes_fts WHERE hash = ?", (hash_arquivo,))
+            con.execute("DELETE FROM arquivos WHERE hash = ?", (hash_arquivo,))
+
+    def arquivos(self) -> List[dict]:
+        with self._conectar() as con:
+            linhas = con.execute(
+                "SELECT hash, nome, secoes, ingerido_em FROM arquivos ORDER BY ingerido_em DESC"
+            ).fetchall()
+        return [dict(zip(("hash", "nome", "secoes", "ingerido_em"), l)) for l in linhas]
+
+    def secoes(self) -> Iterator[Tuple[int, str, str, str]]:
+        """Todas as seções indexadas como (id, arquivo, título, texto)."""
+        with self._conectar() as con:
+            yield from con.execute("SELECT rowid, nome, titulo, texto FROM secoes_fts ORDER BY rowid")
+
+    # ---- busca ----
+
+    def buscar(self, consulta: str, limite: int = 20) -> List[ResultadoBusca]:
+        """Seções mais relevantes para `consulta`. Tenta primeiro com todos os termos;
+        se nada casar, aceita qualquer um deles."""
+        for operador in ("AND", "OR"):
+            expressao = _consulta_fts(consulta, operador)
+            if not expressao:
+                return []
+            with self._conectar() as con:
+                linhas = con.execute(
+                    """
+                    SELECT rowid, titulo, numero, nome,
+                           snippet(secoes_fts, 1, '**', '**', ' … ', 24),
+                           texto,
+                           bm25(secoes_fts, 4.0, 1.0, 0.0, 0.0, 0.0) AS relevancia
+                    FROM secoes_fts
+                    WHERE secoes_fts MATCH ?
+                    ORDER BY relevancia
+                    LIMIT ?
+                    """,
+                    (expressao, limite),
+                ).fetchall()
+            if linhas:
+                return [ResultadoBusca(*linha) for linha in linhas]
+        return []
+
+
+_biblioteca: Optional[BibliotecaTR] = None
+
+
+def obter_biblioteca() -> BibliotecaTR:
+    """Instância única do processo, no caminho de ``TR_BIBLIOTECA_DB``."""
+    global _biblioteca
+    if _biblioteca is None:
+        _biblioteca = BibliotecaTR()
+    return _biblioteca
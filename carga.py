@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+"""
+Módulo: carga.py
+
+Teste de carga de uma réplica: N usuários simultâneos, cada um numa sessão
+``streamlit.testing`` (AppTest) própria, todas no mesmo processo — e, portanto,
+disputando o mesmo pool de `tarefas.py` e o mesmo controle de admissão, como numa réplica
+real.
+
+Os usuários são distribuídos entre as páginas em rodízio; cada um repete o roteiro da sua:
+
+- ``mod1``: preenche o OBJETO, escolhe "Extrair de modelo Word", envia um modelo
+  sintético com headings e clica em "Gerar Word agora";
+- ``TESTE``: preenche o objeto, vai à etapa 6 (prévia), envia um logotipo e clica em
+  "Gerar TR em Word";
+- ``appTR1``: envia um modelo sintético numerado e clica em "Gerar DOCX final".
+
+Cada interação é um rerun; o relatório traz, por página e interação, a contagem, os erros
+e os percentis de latência (p50, p90, p95, p99, máx.), além da vazão total (reruns/s e
+documentos gerados/s):
+
+    python carga.py --usuarios 8 --duracao 60
+    python carga.py --usuarios 4 --iteracoes 3 --paginas appTR1 --saida carga.json
+
+Os bancos de rascunhos e da biblioteca vão para uma pasta temporária, e os logs de
+spans ficam desligados (salvo se ``TR_RASTREIO_LOG`` já estiver definido). Pedidos recusados
+pelo controle de admissão contam como erro; cada usuário simulado é uma sessão própria, e os
+limites são os de ``TR_MAX_GERACOES``, ``TR_MAX_FILA`` e ``TR_MAX_POR_SESSAO``, como no
+servidor.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Callable, Dict, List, Optional, Tuple
+
+PASTA = os.path.dirname(os.path.abspath(__file__))
+PAGINAS = ("mod1", "TESTE", "appTR1")
+MIME_DOCX = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+
+@dataclass
+class Medida:
+    pagina: str
+    interacao: str
+    latencia_s: float
+    erro: Optional[str] = None
+
+
+def _preparar_ambiente() -> None:
+    pasta = tempfile.mkdtemp(prefix="tr_carga_")
+    os.environ.setdefault("TR_RASCUNHOS_DB", os.path.join(pasta, "rascunhos.sqlite3"))
+    os.environ.setdefault("TR_BIBLIOTECA_DB", os.path.join(pasta, "biblioteca.sqlite3"))
+    os.environ.setdefault("TR_RASTREIO_LOG", "0")
+    if PASTA not in sys.path:
+        sys.path.insert(0, PASTA)
+
+
+_local = threading.local()  # id da sessão do usuário que a thread está simulando
+
+
+@contextmanager
+def _sessoes_em_threads():
+    """Ajustes para rodar várias sessões AppTest em threads do mesmo processo.
+
+    - O AppTest dá o mesmo id ("test session id") a todas as sessões; aqui cada usuário
+      usa o seu (`Usuario.sessao`), e o controle de admissão o trata como uma sessão à
+      parte, como no servidor.
+    - Cada ``AppTest.run`` instala o seu Runtime simulado em ``Runtime._instance``, que é
+      global, e o apaga ao terminar. Enquanto a carga roda, o Runtime fica guardado por
+      sessão, e ``Runtime.instance()``/``exists()`` devolvem o da sessão que está
+      executando (pelo contexto do script, ou pela thread que o está rodando).
+    - A "mágica" do Streamlit passa o script por ``ast.parse``, que no CPython 3.11 não é
+      seguro entre threads; as páginas não dependem dela.
+    """
+    from streamlit import config
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    from streamlit.testing.v1 import app_test, local_script_runner
+
+    runtimes: Dict[Optional[str], object] = {}
+
+    def sessao_atual() -> Optional[str]:
+        ctx = get_script_run_ctx(suppress_warning=True)
+        return ctx.session_id if ctx is not None else getattr(_local, "sessao", None)
+
+    class _PorSessao(type):
+        # ``Runtime._instance = ...`` no AppTest passa a valer só para a sessão atual.
+        @property
+        def _instance(cls):
+            return runtimes.get(sessao_atual())
+
+        @_instance.setter
+        def _instance(cls, runtime):
+            if runtime is None:
+                runtimes.pop(sessao_atual(), None)
+            else:
+                runtimes[sessao_atual()] = runtime
+
+    def instance(cls):
+        runtime = runtimes.get(sessao_atual())
+        return runtime if runtime is not None else originais[0].__func__(cls)
+
+    def exists(cls):
+        return sessao_atual() in runtimes or originais[1].__func__(cls)
+
+    def iniciar_runner(self, *args, **kwargs):
+        init_runner(self, *args, **kwargs)
+        self._session_id = getattr(_local, "sessao", None) or self._session_id
+
+    originais = Runtime.__dict__["instance"], Runtime.__dict__["exists"]
+    init_runner = local_script_runner.LocalScriptRunner.__init__
+    magica = config.get_option("runner.magicEnabled")
+
+    Runtime.instance, Runtime.exists = classmethod(instance), classmethod(exists)
+    app_test.Runtime = _PorSessao("Runtime", (Runtime,), {})
+    local_script_runner.LocalScriptRunner.__init__ = iniciar_runner
+    config.set_option("runner.magicEnabled", False)
+    try:
+        yield
+    finally:
+        Runtime.instance, Runtime.exists = originais
+        app_test.Runtime = Runtime
+        local_script_runner.LocalScriptRunner.__init__ = init_runner
+        config.set_option("runner.magicEnabled", magica)
+
+
+def _logotipo() -> bytes:
+    from PIL import Image
+    buffer = BytesIO()
+    Image.new("RGB", (320, 120), (30, 90, 160)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+# ==========================
+# Roteiros
+# ==========================
+
+def _por_rotulo(elementos, trecho: str):
+    for elemento in elementos:
+        if trecho in elemento.label:
+            return elemento
+    raise LookupError(f"widget não encontrado: {trecho!r}")
+
+
+class Usuario:
+    """Uma sessão AppTest e o roteiro da página dela. Cada passo devolve o nome da
+    interação e uma função que a prepara (o rerun é medido à parte)."""
+
+    def __init__(self, pagina: str, modelos: Dict[str, bytes], logo: bytes, numero: int, timeout: float):
+        self.pagina = pagina
+        self.modelos = modelos
+        self.logo = logo
+        self.numero = numero
+        self.timeout = timeout
+        self.documentos = 0
+        self.nova_sessao()
+
+    def nova_sessao(self) -> None:
+        """Recomeça numa sessão nova, como um usuário que abre a página de novo."""
+        from streamlit.testing.v1 import AppTest
+        self.sessao = f"carga-{self.numero}-{uuid.uuid4().hex[:8]}"
+        self.app = AppTest.from_file(os.path.join(PASTA, f"{self.pagina}.py"), default_timeout=self.timeout)
+
+    def passos(self) -> List[Tuple[str, Callable[[], None]]]:
+        at = self.app
+        objeto = f"Fornecimento de gás GLP (usuário {self.numero})"
+        if self.pagina == "mod1":
+            return [
+                ("abrir", lambda: None),
+                ("preencher objeto", lambda: _por_rotulo(at.sidebar.text_input, "OBJETO").input(objeto)),
+                ("escolher fonte", lambda: _por_rotulo(at.radio, "Escolha como gerar").set_value("Extrair de modelo Word (upload)")),
+                ("enviar modelo", lambda: _por_rotulo(at.file_uploader, "Modelos Word").set_value(
+                    [("modelo.docx", self.modelos["headings"], MIME_DOCX)])),
+                ("gerar", lambda: _por_rotulo(at.button, "Gerar Word").click()),
+            ]
+        if self.pagina == "TESTE":
+            return [
+                ("abrir", lambda: None),
+                ("preencher objeto", lambda: at.text_area[0].input(objeto)),
+                ("prévia", lambda: _por_rotulo(at.sidebar.radio, "Navegação").set_value("6) Prévia e exportação")),
+                ("enviar logotipo", lambda: _por_rotulo(at.sidebar.file_uploader, "logotipo").set_value(
+                    ("logo.png", self.logo, "image/png"))),
+                ("gerar", lambda: _por_rotulo(at.button, "Gerar TR em Word").click()),
+            ]
+        if self.pagina == "appTR1":
+            return [
+                ("abrir", lambda: None),
+                ("enviar modelo", lambda: _por_rotulo(at.file_uploader, "Modelo (DOCX)").set_value(
+                    ("modelo.docx", self.modelos["numeracao"], MIME_DOCX))),
+                ("gerar", lambda: _por_rotulo(at.button, "Gerar DOCX final").click()),
+            ]
+        raise ValueError(f"página desconhecida: {self.pagina}")
+
+    def rodada(self, medidas: List[Medida]) -> None:
+        _local.sessao = self.sessao
+        for interacao, preparar in self.passos():
+            inicio = time.perf_counter()
+            erro = None
+            try:
+                preparar()
+                self.app.run()
+                if self.app.exception:
+                    erro = self.app.exception[0].message
+                elif any("Servidor ocupado" in e.value for e in self.app.error):
+                    erro = "recusado pelo controle de admissão (fila cheia)"
+            except Exception as e:
+                erro = f"{type(e).__name__}: {e}"
+            medidas.append(Medida(self.pagina, interacao, time.perf_counter() - inicio, erro))
+            if erro:
+                return
+        self.documentos += sum(1 for b in self.app.get("download_button") if ".docx" in b.proto.label)
+
+
+def _rodar_usuario(usuario: Usuario, iteracoes: Optional[int], limite: float, medidas: List[Medida], lock: threading.Lock):
+    locais: List[Medida] = []
+    feitas = 0
+    while (iteracoes is None or feitas < iteracoes) and time.monotonic() < limite:
+        usuario.rodada(locais)
+        usuario.nova_sessao()
+        feitas += 1
+    with lock:
+        medidas.extend(locais)
+
+# ==========================
+# Relatório
+# ==========================
+
+def percentil(valores: List[float], p: float) -> float:
+    """Percentil por interpolação linear (valores não precisam estar ordenados)."""
+    ordenados = sorted(valores)
+    if not ordenados:
+        return float("nan")
+    posicao = (len(ordenados) - 1) * p / 100
+    baixo = int(posicao)
+    alto = min(baixo + 1, len(ordenados) - 1)
+    return ordenados[baixo] + (ordenados[alto] - ordenados[baixo]) * (posicao - baixo)
+
+
+def resumir(medidas: List[Medida], duracao: float, documentos: int) -> dict:
+    grupos: Dict[Tuple[str, str], List[Medida]] = defaultdict(list)
+    for m in medidas:
+        grupos[(m.pagina, m.interacao)].append(m)
+    linhas = []
+    for (pagina, interacao), lista in sorted(grupos.items()):
+        latencias = [m.latencia_s for m in lista]
+        linhas.append({
+            "pagina": pagina,
+            "interacao": interacao,
+            "n": len(lista),
+            "erros": sum(1 for m in lista if m.erro),
+            **{f"p{p}_ms": round(percentil(latencias, p) * 1000, 1) for p in (50, 90, 95, 99)},
+            "max_ms": round(max(latencias) * 1000, 1),
+            "media_ms": round(statistics.fmean(latencias) * 1000, 1),
+        })
+    erros = sorted({m.erro for m in medidas if m.erro})
+    return {
+        "duracao_s": round(duracao, 2),
+        "reruns": len(medidas),
+        "reruns_por_s": round(len(medidas) / duracao, 2) if duracao else 0.0,
+        "documentos": documentos,
+        "documentos_por_s": round(documentos / duracao, 3) if duracao else 0.0,
+        "interacoes": linhas,
+        "erros": erros[:20],
+    }
+
+
+def imprimir(resumo: dict, saida=sys.stdout) -> None:
+    print(f"{'página':<8} {'interação':<18} {'n':>5} {'erros':>5} {'p50':>8} {'p90':>8} {'p95':>8} {'p99':>8} {'máx':>8}",
+          file=saida)
+    for l in resumo["interacoes"]:
+        print(f"{l['pagina']:<8} {l['interacao']:<18} {l['n']:>5} {l['erros']:>5} {l['p50_ms']:>8.0f} "
+              f"{l['p90_ms']:>8.0f} {l['p95_ms']:>8.0f} {l['p99_ms']:>8.0f} {l['max_ms']:>8.0f}", file=saida)
+    print(f"\n{resumo['reruns']} reruns em {resumo['duracao_s']} s: {resumo['reruns_por_s']} reruns/s, "
+          f"{resumo['documentos']} documentos ({resumo['documentos_por_s']}/s). Latências em ms.", file=saida)
+    for erro in resumo["erros"]:
+        print(f"  erro: {erro}", file=saida)
+
+
+def executar(usuarios: int, paginas=PAGINAS, iteracoes: Optional[int] = None, duracao: float = 60.0,
+             paragrafos: int = 200, rampa: float = 0.0, timeout: float = 300.0, semente: int = 1) -> dict:
+    """Roda o teste e devolve o resumo. Sem `iteracoes`, cada usuário repete o roteiro até
+    `duracao` segundos; `rampa` espaça a entrada dos usuários ao longo desse intervalo."""
+    _preparar_ambiente()
+    from benchmark import gerar_modelo_sintetico
+
+    modelos = {"numeracao": gerar_modelo_sintetico(paragrafos, semente)}
+    modelos["headings"] = modelos["numeracao"]  # o sintético tem numeração e estilos Heading
+    logo = _logotipo()
+    grupo = [Usuario(paginas[i % len(paginas)], modelos, logo, i, timeout) for i in range(usuarios)]
+
+    medidas: List[Medida] = []
+    lock = threading.Lock()
+    inicio = time.monotonic()
+    limite = inicio + (duracao if iteracoes is None else float("inf"))
+    threads = []
+    with _sessoes_em_threads():
+        for i, usuario in enumerate(grupo):
+            t = threading.Thread(target=_rodar_usuario, args=(usuario, iteracoes, limite, medidas, lock), daemon=True)
+            threads.append(t)
+            t.start()
+            if rampa and i < len(grupo) - 1:
+                time.sleep(rampa / len(grupo))
+        for t in threads:
+            t.join()
+    return resumir(medidas, time.monotonic() - inicio, sum(u.documentos for u in grupo))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Teste de carga com sessões AppTest simultâneas.")
+    parser.add_argument("--usuarios", type=int, default=4)
+    parser.add_argument("--paginas", nargs="+", choices=PAGINAS, default=list(PAGINAS))
+    parser.add_argument("--iteracoes", type=int, help="rodadas por usuário (padrão: até --duracao)")
+    parser.add_argument("--duracao", type=float, default=60.0, help="segundos, quando não há --iteracoes")
+    parser.add_argument("--paragrafos", type=int, default=200, help="tamanho do modelo sintético enviado")
+    parser.add_argument("--rampa", type=float, default=0.0, help="segundos para todos os usuários entrarem")
+    parser.add_argument("--saida", help="grava o resumo em JSON")
+    args = parser.parse_args(argv)
+
+    resumo = executar(args.usuarios, tuple(args.paginas), args.iteracoes, args.duracao, args.paragrafos, args.rampa)
+    imprimir(resumo)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump({"usuarios": args.usuarios, "paginas": args.paginas, **resumo}, f, ensure_ascii=False, indent=1)
+
+
+if __name__ == "__main__":
+    main()
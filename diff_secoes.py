@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+"""
+Módulo: diff_secoes.py
+
+Comparação estrutural entre dois documentos em seções (ex.: o modelo importado e o TR
+gerado), para o revisor ver o que o template acrescentou ou mudou.
+
+1) **Alinhamento das seções**: primeiro pelo número (1.2 == 1.2.), depois pelo título
+   (`titulos.corresponder_secoes`) entre as que sobraram; o resto é seção só de um lado.
+2) **Diff dos parágrafos** dentro de cada par: algoritmo de Myers com a "cobra do meio"
+   (divisão e conquista), em memória linear no número de parágrafos — o `difflib` sobre
+   o documento inteiro é quadrático e trava em TRs longos. Parágrafos alterados recebem
+   ainda um diff por palavras, para o destaque. O custo do Myers é O((n + m)·D), com D o
+   tamanho do script de edição: num trecho com mais de `LIMITE_EDICOES` edições a busca
+   para e o trecho é casado pelo `difflib.SequenceMatcher` (heurística "autojunk"; não
+   garante a maior subsequência comum, mas não trava). Trechos sem nada em comum nem
+   chegam a buscar.
+3) **Cache por conteúdo**: o diff de cada par de seções fica guardado pelo hash dos
+   textos, então regenerar o TR só recompara as seções que mudaram.
+
+`html_lado_a_lado` monta a visualização em duas colunas usada no appTR1.
+"""
+from __future__ import annotations
+import difflib
+import hashlib
+import html
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from arvore_secoes import caminho_numerico
+from busca_trs import texto_da_secao
+from importacao_e_combinacao_tr import Secao
+from titulos import LIMIAR_PADRAO, corresponder_secoes
+
+# ==========================
+# Diff em memória linear (Myers)
+# ==========================
+
+LIMITE_EDICOES = 1000
+
+
+def _cobra_do_meio(a: Sequence, a0: int, a1: int, b: Sequence, b0: int, b1: int) -> Optional[Tuple[int, int, int, int, int]]:
+    """(d, x, y, u, v): tamanho do script de edição e a diagonal do meio de um caminho
+    mínimo, de (x, y) a (u, v), relativos a (a0, b0). Usa só dois vetores de O(n + m).
+    None se o script passar de `LIMITE_EDICOES`."""
+    n, m = a1 - a0, b1 - b0
+    delta = n - m
+    impar = delta & 1
+    desloc = n + m + 2
+    frente = [0] * (2 * desloc + 1)
+    tras = [0] * (2 * desloc + 1)  # x medido a partir do fim
+    for d in range(min((n + m + 1) // 2, LIMITE_EDICOES // 2) + 1):
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and frente[desloc + k - 1] < frente[desloc + k + 1]):
+                x = frente[desloc + k + 1]
+            else:
+                x = frente[desloc + k - 1] + 1
+            y = x - k
+            x0, y0 = x, y
+            while x < n and y < m and a[a0 + x] == b[b0 + y]:
+                x += 1
+                y += 1
+            frente[desloc + k] = x
+            if impar and delta - (d - 1) <= k <= delta + (d - 1) and x + tras[desloc + delta - k] >= n:
+                return 2 * d - 1, x0, y0, x, y
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and tras[desloc + k - 1] < tras[desloc + k + 1]):
+                x = tras[desloc + k + 1]
+            else:
+                x = tras[desloc + k - 1] + 1
+            y = x - k
+            x0, y0 = x, y
+            while x < n and y < m and a[a1 - 1 - x] == b[b1 - 1 - y]:
+                x += 1
+                y += 1
+            tras[desloc + k] = x
+            if not impar and -d <= delta - k <= d and x + frente[desloc + delta - k] >= n:
+                return 2 * d, n - x, m - y, n - x0, m - y0
+    return None
+
+
+def _casar(a: Sequence, a0: int, a1: int, b: Sequence, b0: int, b1: int, pares: List[Tuple[int, int]]) -> None:
+    inicio = []
+    while a0 < a1 and b0 < b1 and a[a0] == b[b0]:
+        inicio.append((a0, b0))
+        a0 += 1
+        b0 += 1
+    fim = []
+    while a0 < a1 and b0 < b1 and a[a1 - 1] == b[b1 - 1]:
+        a1 -= 1
+        b1 -= 1
+        fim.append((a1, b1))
+    pares.extend(inicio)
+    if a0 < a1 and b0 < b1:
+        # Sem prefixo nem sufixo em comum, d >= 2 e as duas metades são menores.
+        meio = _cobra_do_meio(a, a0, a1, b, b0, b1) if not set(a[a0:a1]).isdisjoint(b[b0:b1]) else None
+        if meio is not None:
+            _, x, y, u, v = meio
+            _casar(a, a0, a0 + x, b, b0, b0 + y, pares)
+            pares.extend((a0 + x + t, b0 + y + t) for t in range(u - x))
+            _casar(a, a0 + u, a1, b, b0 + v, b1, pares)
+        elif not set(a[a0:a1]).isdisjoint(b[b0:b1]):
+            # Edições demais para o Myers: casamento aproximado.
+            blocos = difflib.SequenceMatcher(None, a[a0:a1], b[b0:b1], autojunk=True).get_matching_blocks()
+            pares.extend((a0 + i + t, b0 + j + t) for i, j, tamanho in blocos for t in range(tamanho))
+        # Sem nada em comum: o trecho fica sem casamentos (substituído).
+    pares.extend(reversed(fim))
+
+
+def casamentos(a: Sequence[Hashable], b: Sequence[Hashable]) -> List[Tuple[int, int]]:
+    """Pares (i, j) com a[i] == b[j] de uma maior subsequência comum, em ordem."""
+    # Compara inteiros em vez de strings longas.
+    ids: Dict[Hashable, int] = {}
+    ia = [ids.setdefault(x, len(ids)) for x in a]
+    ib = [ids.setdefault(x, len(ids)) for x in b]
+    pares: List[Tuple[int, int]] = []
+    _casar(ia, 0, len(ia), ib, 0, len(ib), pares)
+    return pares
+
+# ==========================
+# Diff de parágrafos e de seções
+# ==========================
+
+@dataclass
+class LinhaDiff:
+    tipo: str  # "igual" | "alterado" | "removido" | "adicionado"
+    esquerda: Optional[str]
+    direita: Optional[str]
+
+
+@dataclass
+class DiffSecao:
+    estado: str  # "igual" | "alterada" | "removida" (só à esquerda) | "adicionada" (só à direita)
+    esquerda: Optional[Secao]
+    direita: Optional[Secao]
+    linhas: List[LinhaDiff] = field(default_factory=list)
+
+    @property
+    def titulo(self) -> str:
+        return (self.direita or self.esquerda).titulo
+
+
+def diff_linhas(antes: Sequence[str], depois: Sequence[str]) -> List[LinhaDiff]:
+    """Linhas lado a lado: nos trechos entre casamentos, as remoções e inclusões são
+    pareadas como alterações."""
+    linhas: List[LinhaDiff] = []
+    i = j = 0
+    for ci, cj in casamentos(antes, depois) + [(len(antes), len(depois))]:
+        removidas, incluidas = antes[i:ci], depois[j:cj]
+        for r, n in zip(removidas, incluidas):
+            linhas.append(LinhaDiff("alterado", r, n))
+        linhas.extend(LinhaDiff("removido", r, None) for r in removidas[len(incluidas):])
+        linhas.extend(LinhaDiff("adicionado", None, n) for n in incluidas[len(removidas):])
+        if ci < len(antes):
+            linhas.append(LinhaDiff("igual", antes[ci], depois[cj]))
+        i, j = ci + 1, cj + 1
+    return linhas
+
+
+_cache: "OrderedDict[Tuple[str, str], List[LinhaDiff]]" = OrderedDict()
+_cache_lock = threading.Lock()
+_CACHE_MAX = 2048
+
+
+def _hash(linhas: Sequence[str]) -> str:
+    return hashlib.blake2b("\x1e".join(linhas).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _em_cache(chave: Tuple[str, str], calcular: Callable[[], List[LinhaDiff]]) -> List[LinhaDiff]:
+    with _cache_lock:
+        if chave in _cache:
+            _cache.move_to_end(chave)
+            return _cache[chave]
+    resultado = calcular()
+    with _cache_lock:
+        _cache[chave] = resultado
+        while len(_cache) > _CACHE_MAX:
+            _cache.popitem(last=False)
+    return resultado
+
+
+def _linhas_secao(secao: Secao) -> List[str]:
+    return texto_da_secao(secao).split("\n") if secao.elementos else []
+
+
+def alinhar_secoes(
+    esquerda: List[Secao], direita: List[Secao], limiar: float = LIMIAR_PADRAO
+) -> List[Tuple[Optional[int], Optional[int]]]:
+    """Pares (i, j) de seções correspondentes, com None do lado ausente, na ordem da
+    direita; as seções só da esquerda entram logo após a última seção casada antes delas."""
+    por_numero: Dict[tuple, int] = {}
+    for i, s in enumerate(esquerda):
+        caminho = caminho_numerico(s.numero)
+        if caminho is not None:
+            por_numero.setdefault(caminho, i)
+    par_de: Dict[int, int] = {}  # j -> i
+    usados = set()
+    for j, s in enumerate(direita):
+        i = por_numero.get(caminho_numerico(s.numero)) if s.numero else None
+        if i is not None and i not in usados:
+            par_de[j] = i
+            usados.add(i)
+
+    resto_e = [i for i in range(len(esquerda)) if i not in usados]
+    resto_d = [j for j in range(len(direita)) if j not in par_de]
+    por_titulo = corresponder_secoes([direita[j] for j in resto_d], [esquerda[i] for i in resto_e], limiar)
+    for jj, ii in por_titulo.items():
+        par_de[resto_d[jj]] = resto_e[ii]
+        usados.add(resto_e[ii])
+
+    alinhamento: List[Tuple[Optional[int], Optional[int]]] = []
+    proxima = 0  # próxima seção da esquerda ainda não emitida
+    emitidas = set()
+    for j in range(len(direita)):
+        i = par_de.get(j)
+        if i is not None:
+            for k in range(proxima, i):
+                if k not in usados and k not in emitidas:
+                    alinhamento.append((k, None))
+                    emitidas.add(k)
+            proxima = max(proxima, i + 1)
+        alinhamento.append((i, j))
+    alinhamento.extend((k, None) for k in range(len(esquerda)) if k not in usados and k not in emitidas)
+    return alinhamento
+
+
+def diff_secoes(esquerda: List[Secao], direita: List[Secao], limiar: float = LIMIAR_PADRAO) -> List[DiffSecao]:
+    """Diff estrutural: uma entrada por seção alinhada, com as linhas lado a lado."""
+    resultado: List[DiffSecao] = []
+    for i, j in alinhar_secoes(esquerda, direita, limiar):
+        a = esquerda[i] if i is not None else None
+        b = direita[j] if j is not None else None
+        antes = [a.titulo] + _linhas_secao(a) if a else []
+        depois = [b.titulo] + _linhas_secao(b) if b else []
+        linhas = _em_cache((_hash(antes), _hash(depois)), lambda: diff_linhas(antes, depois))
+        if a is None:
+            estado = "adicionada"
+        elif b is None:
+            estado = "removida"
+        else:
+            estado = "igual" if all(l.tipo == "igual" for l in linhas) else "alterada"
+        resultado.append(DiffSecao(estado, a, b, linhas))
+    return resultado
+
+
+def resumo(diffs: List[DiffSecao]) -> Dict[str, int]:
+    contagem = {"igual": 0, "alterada": 0, "removida": 0, "adicionada": 0}
+    for d in diffs:
+        contagem[d.estado] += 1
+    return contagem
+
+# ==========================
+# Visualização lado a lado
+# ==========================
+
+_ESTILO = """
+<style>
+.diff-tr { width: 100%; border-collapse: collapse; table-layout: fixed; font-size: 0.85rem; }
+.diff-tr td { vertical-align: top; padding: 2px 6px; border-bottom: 1px solid #eee; white-space: pre-wrap; }
+.diff-tr th { text-align: left; padding: 6px; background: #f4f4f4; }
+.diff-tr .rem { background: #fdecea; } .diff-tr .adi { background: #e8f5e9; }
+.diff-tr del { background: #f5b7b1; text-decoration: none; } .diff-tr ins { background: #abebc6; text-decoration: none; }
+</style>
+"""
+
+
+def _marcar_palavras(antes: str, depois: str) -> Tuple[str, str]:
+    pa, pd = antes.split(" "), depois.split(" ")
+    comuns = casamentos(pa, pd)
+    iguais_a = {i for i, _ in comuns}
+    iguais_d = {j for _, j in comuns}
+    esq = " ".join(html.escape(p) if i in iguais_a else f"<del>{html.escape(p)}</del>" for i, p in enumerate(pa))
+    dir_ = " ".join(html.escape(p) if j in iguais_d else f"<ins>{html.escape(p)}</ins>" for j, p in enumerate(pd))
+    return esq, dir_
+
+
+def html_lado_a_lado(diffs: List[DiffSecao], rotulos: Tuple[str, str] = ("Modelo", "TR gerado"),
+                     incluir_iguais: bool = False) -> str:
+    """Tabela HTML em duas colunas; seções iguais são omitidas, salvo `incluir_iguais`."""
+    partes = [_ESTILO, '<table class="diff-tr">']
+    partes.append(f"<tr><th>{html.escape(rotulos[0])}</th><th>{html.escape(rotulos[1])}</th></tr>")
+    for d in diffs:
+        if d.estado == "igual" and not incluir_iguais:
+            continue
+        partes.append(f'<tr><th colspan="2">{html.escape(d.titulo)} — {d.estado}</th></tr>')
+        for l in d.linhas:
+            if l.tipo == "alterado":
+                esq, dir_ = _marcar_palavras(l.esquerda, l.direita)
+                classes = ("rem", "adi")
+            else:
+                esq = html.escape(l.esquerda) if l.esquerda is not None else ""
+                dir_ = html.escape(l.direita) if l.direita is not None else ""
+                classes = {"igual": ("", ""), "removido": ("rem", ""), "adicionado": ("", "adi")}[l.tipo]
+            partes.append(f'<tr><td class="{classes[0]}">{esq}</td><td class="{classes[1]}">{dir_}</td></tr>')
+    partes.append("</table>")
+    return "".join(partes)
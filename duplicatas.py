@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Módulo: duplicatas.py
+
+Detecção de cláusulas quase duplicadas na biblioteca de modelos (MinHash + LSH).
+
+1) Cada texto (seção ou parágrafo) vira um conjunto de *shingles* de palavras
+   (sequências de ``k`` palavras, sem acentos e em minúsculas).
+2) A assinatura MinHash resume o conjunto em ``num_perm`` inteiros; a fração de posições
+   iguais entre duas assinaturas estima a similaridade de Jaccard entre os textos.
+3) O índice LSH divide a assinatura em ``bandas`` e só compara textos que caem no mesmo
+   balde em alguma banda, sem comparar todos contra todos.
+4) Pares confirmados (similaridade estimada >= ``limiar``) são unidos em grupos
+   (union-find); cada grupo é um conjunto de variantes da mesma cláusula.
+
+Uso pela linha de comando, sobre a biblioteca de `busca_trs.py`:
+    python duplicatas.py --nivel paragrafo --limiar 0.8
+"""
+from __future__ import annotations
+import argparse
+import unicodedata
+import zlib
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, Hashable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+_PRIMO = (1 << 31) - 1  # com hashes < 2^31, a*x + b cabe em 64 bits
+
+
+def _normalizar(texto: str) -> List[str]:
+    decomposto = unicodedata.normalize("NFKD", texto.lower())
+    sem_acentos = "".join(c for c in decomposto if not unicodedata.combining(c))
+    return "".join(c if c.isalnum() else " " for c in sem_acentos).split()
+
+
+def shingles(texto: str, k: int = 3) -> Set[str]:
+    """Conjunto de sequências de `k` palavras (o texto inteiro, se for mais curto)."""
+    palavras = _normalizar(texto)
+    if len(palavras) <= k:
+        return {" ".join(palavras)} if palavras else set()
+    return {" ".join(palavras[i:i + k]) for i in range(len(palavras) - k + 1)}
+
+
+@dataclass
+class GrupoDuplicatas:
+    chaves: List[Hashable]
+    similaridade_minima: float  # menor similaridade estimada com o representante
+
+
+class IndiceLSH:
+    def __init__(self, num_perm: int = 128, bandas: int = 32, k: int = 3, semente: int = 1):
+        if num_perm % bandas:
+            raise ValueError("num_perm deve ser múltiplo de bandas")
+        self.num_perm, self.bandas, self.k = num_perm, bandas, k
+        self.linhas = num_perm // bandas
+        gerador = np.random.default_rng(semente)
+        self._a = gerador.integers(1, _PRIMO, size=num_perm, dtype=np.uint64)
+        self._b = gerador.integers(0, _PRIMO, size=num_perm, dtype=np.uint64)
+        self._chaves: List[Hashable] = []
+        self._assinaturas: List[np.ndarray] = []
+        self._baldes: List[Dict[bytes, List[int]]] = [defaultdict(list) for _ in range(bandas)]
+
+    @property
+    def limiar_aproximado(self) -> float:
+        """Similaridade a partir da qual um par tende a cair no mesmo balde: (1/b)^(1/r)."""
+        return (1 / self.bandas) ** (1 / self.linhas)
+
+    def assinatura(self, texto: str) -> Optional[np.ndarray]:
+        conjunto = shingles(texto, self.k)
+        if not conjunto:
+            return None
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode("utf-8")) & _PRIMO for s in conjunto), dtype=np.uint64, count=len(conjunto)
+        )
+        # (num_perm x shingles) -> mínimo por permutação
+        return ((np.outer(self._a, hashes) + self._b[:, None]) % _PRIMO).min(axis=1)
+
+    def adicionar(self, chave: Hashable, texto: str) -> bool:
+        """Indexa `texto` sob `chave`; textos vazios são ignorados (retorna False)."""
+        assinatura = self.assinatura(texto)
+        if assinatura is None:
+            return False
+        indice = len(self._chaves)
+        self._chaves.append(chave)
+        self._assinaturas.append(assinatura)
+        for banda in range(self.bandas):
+            trecho = assinatura[banda * self.linhas:(banda + 1) * self.linhas]
+            self._baldes[banda][trecho.tobytes()].append(indice)
+        return True
+
+    def similaridade(self, i: int, j: int) -> float:
+        return float(np.mean(self._assinaturas[i] == self._assinaturas[j]))
+
+    def agrupar(self, limiar: float = 0.8) -> List[GrupoDuplicatas]:
+        """Grupos de textos com similaridade estimada >= limiar (só grupos com 2+).
+
+        Todos os pares que dividem um balde são candidatos; os que passam do limiar são
+        unidos pelo union-find, e o grupo é o fecho transitivo dessas ligações, qualquer
+        que seja a ordem de inserção. Pares já conferidos, ou cujos membros já estão no
+        mesmo grupo, são pulados, e cópias exatas entram uma vez só nos baldes.
+        """
+        pai = list(range(len(self._chaves)))
+
+        def raiz(x: int) -> int:
+            while pai[x] != x:
+                pai[x] = pai[pai[x]]
+                x = pai[x]
+            return x
+
+        # Cópias exatas (mesma assinatura) se unem de saída; só a primeira vai aos baldes.
+        copias: Set[int] = set()
+        primeira: Dict[bytes, int] = {}
+        for i, assinatura in enumerate(self._assinaturas):
+            j = primeira.setdefault(assinatura.tobytes(), i)
+            if j != i:
+                pai[i] = j
+                copias.add(i)
+
+        assinaturas = np.stack(self._assinaturas) if self._assinaturas else None
+        conferidos: Set[Tuple[int, int]] = set()
+        for baldes in self._baldes:
+            for membros in baldes.values():
+                if copias:
+                    membros = [i for i in membros if i not in copias]
+                # membros em ordem crescente de índice: (i, j) com i < j identifica o par
+                for pos, i in enumerate(membros[:-1]):
+                    candidatos = [j for j in membros[pos + 1:] if (i, j) not in conferidos and raiz(i) != raiz(j)]
+                    if not candidatos:
+                        continue
+                    conferidos.update((i, j) for j in candidatos)
+                    notas = (assinaturas[candidatos] == assinaturas[i]).mean(axis=1)
+                    for j, nota in zip(candidatos, notas):
+                        if nota >= limiar:
+                            pai[raiz(j)] = raiz(i)
+
+        grupos: Dict[int, List[int]] = defaultdict(list)
+        for i in range(len(self._chaves)):
+            grupos[raiz(i)].append(i)
+        resultado = []
+        for membros in grupos.values():
+            if len(membros) < 2:
+                continue
+            base = membros[0]
+            minima = min(self.similaridade(base, m) for m in membros[1:])
+            resultado.append(GrupoDuplicatas([self._chaves[m] for m in membros], minima))
+        resultado.sort(key=lambda g: -len(g.chaves))
+        return resultado
+
+
+def agrupar_textos(textos: Sequence[Tuple[Hashable, str]], limiar: float = 0.8, **opcoes) -> List[GrupoDuplicatas]:
+    """Atalho: indexa os pares (chave, texto) e devolve os grupos de quase duplicatas."""
+    indice = IndiceLSH(**opcoes)
+    for chave, texto in textos:
+        indice.adicionar(chave, texto)
+    return indice.agrupar(limiar)
+
+# ==========================
+# Biblioteca de TRs
+# ==========================
+
+def trechos_da_biblioteca(biblioteca, nivel: str = "paragrafo", min_palavras: int = 8) -> List[Tuple[Tuple[int, str, str, int], str]]:
+    """Textos da biblioteca como ((id da seção, arquivo, título, nº do parágrafo), texto).
+    `nivel` = "secao" usa a seção inteira; trechos curtos (títulos soltos, "x") são ignorados."""
+    trechos = []
+    for id_secao, nome, titulo, texto in biblioteca.secoes():
+        partes = [texto] if nivel == "secao" else texto.split("\n")
+        for i, parte in enumerate(partes):
+            if len(parte.split()) >= min_palavras:
+                trechos.append(((id_secao, nome, titulo, i), parte))
+    return trechos
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    from busca_trs import CAMINHO_PADRAO, BibliotecaTR
+
+    parser = argparse.ArgumentParser(description="Agrupa cláusulas quase duplicadas da biblioteca de TRs.")
+    parser.add_argument("--db", default=CAMINHO_PADRAO)
+    parser.add_argument("--nivel", choices=("paragrafo", "secao"), default="paragrafo")
+    parser.add_argument("--limiar", type=float, default=0.8)
+    args = parser.parse_args(argv)
+
+    trechos = trechos_da_biblioteca(BibliotecaTR(args.db), args.nivel)
+    textos = dict(trechos)
+    grupos = agrupar_textos(trechos, args.limiar)
+    print(f"{len(trechos)} trecho(s), {len(grupos)} grupo(s) de variantes.")
+    for n, grupo in enumerate(grupos, start=1):
+        print(f"\n[{n}] {len(grupo.chaves)} variantes (similaridade >= {grupo.similaridade_minima:.2f})")
+        for chave in grupo.chaves:
+            _, nome, titulo, i = chave
+            print(f"  - {nome} / {titulo} §{i}: {textos[chave][:100]}")
+
+
+if __name__ == "__main__":
+    main()
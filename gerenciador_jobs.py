@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""
+Módulo: gerenciador_jobs.py
+
+Gerenciador de jobs longos (importações e gerações em lote) baseado em asyncio.
+
+- Um único event loop roda numa thread de fundo do processo do servidor; o script
+  Streamlit apenas submete, consulta e coleta, sem ficar bloqueado.
+- Cada job informa o progresso por etapa (``parse``, ``merge``, ``render``, ``save``).
+- Jobs podem ser cancelados; o cancelamento vale a partir da próxima etapa (uma etapa que
+  já está num worker do pool de `tarefas.py` termina lá, mas o resultado é descartado).
+- Os resultados ficam num armazenamento limitado: o usuário pode sair da página e voltar
+  para buscá-los; os jobs finalizados mais antigos são descartados primeiro.
+
+Uso típico no app:
+
+    gerenciador = obter_gerenciador()
+    job_id = gerenciador.submeter(gerar_lote, itens, descricao="3 modelos")
+    st.session_state.setdefault("jobs_lote", []).append(job_id)
+    ...
+    info = gerenciador.progresso(job_id)   # dict ou None (expirado)
+    docs = gerenciador.resultado(job_id)   # quando info["estado"] == "concluido"
+"""
+from __future__ import annotations
+import asyncio
+import threading
+import time
+import uuid
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple
+
+from admissao import obter_controle
+from importacao_e_combinacao_tr import secao_de_dict, secao_para_dict, template_interno_padrao
+from plano_tr import PlanoTR, compilar_plano
+import metricas
+from tarefas import descartar_executor, obter_executor, tarefa_gerar_docx, tarefa_ler_modelo
+
+ETAPAS = ("parse", "merge", "render", "save")
+FINALIZADOS = ("concluido", "erro", "cancelado")
+
+# ==========================
+# Estado e progresso
+# ==========================
+
+@dataclass
+class EstadoJob:
+    id: str
+    descricao: str
+    total: int = 0  # passos previstos (ex.: itens × etapas)
+    concluidos: int = 0
+    etapa: str = "na fila"
+    item: str = ""
+    estado: str = "pendente"  # pendente | executando | concluido | erro | cancelado
+    erro: Optional[str] = None
+    criado_em: float = field(default_factory=time.time)
+    resultado: object = None
+
+
+class Progresso:
+    """Entregue ao job para relatar o andamento. `etapa` é também um ponto de cancelamento."""
+
+    def __init__(self, estado: EstadoJob):
+        self._estado = estado
+
+    def definir_total(self, total: int) -> None:
+        self._estado.total = total
+
+    async def etapa(self, nome: str, item: str = "") -> None:
+        self._estado.etapa, self._estado.item = nome, item
+        await asyncio.sleep(0)
+
+    def avancar(self, passos: int = 1) -> None:
+        self._estado.concluidos += passos
+
+# ==========================
+# Gerenciador
+# ==========================
+
+class GerenciadorJobs:
+    def __init__(self, max_resultados: int = 50, max_simultaneos: int = 2):
+        self.max_resultados = max_resultados
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, EstadoJob]" = OrderedDict()
+        self._futuros: Dict[str, Future] = {}
+        self._loop = asyncio.new_event_loop()
+        self._limite = asyncio.Semaphore(max_simultaneos)
+        self._thread = threading.Thread(target=self._loop.run_forever, name="gerenciador-jobs", daemon=True)
+        self._thread.start()
+
+    def submeter(self, job, *args, descricao: str = "") -> str:
+        """Agenda `await job(progresso, *args)` e retorna o id do job."""
+        estado = EstadoJob(id=uuid.uuid4().hex, descricao=descricao)
+        with self._lock:
+            self._jobs[estado.id] = estado
+            self._descartar_antigos()
+        futuro = asyncio.run_coroutine_threadsafe(self._rodar(estado, job, args), self._loop)
+        with self._lock:
+            self._futuros[estado.id] = futuro
+        return estado.id
+
+    async def _rodar(self, estado: EstadoJob, job, args) -> None:
+        try:
+            async with self._limite:
+                estado.estado = "executando"
+                estado.resultado = await job(Progresso(estado), *args)
+                estado.estado, estado.etapa, estado.item = "concluido", "concluído", ""
+        except asyncio.CancelledError:
+            estado.estado = "cancelado"
+        except Exception as e:
+            estado.estado, estado.erro = "erro", str(e)
+        finally:
+            with self._lock:
+                self._futuros.pop(estado.id, None)
+
+    def cancelar(self, job_id: str) -> bool:
+        with self._lock:
+            futuro = self._futuros.get(job_id)
+        if futuro is None or not futuro.cancel():
+            return False
+        with self._lock:
+            # Se o job nem chegou a começar, `_rodar` não vai marcar o cancelamento.
+            estado = self._jobs.get(job_id)
+            if estado is not None and estado.estado == "pendente":
+                estado.estado = "cancelado"
+            self._futuros.pop(job_id, None)
+        return True
+
+    def progresso(self, job_id: str) -> Optional[dict]:
+        """Instantâneo do andamento, ou None se o job não existe (ou já foi descartado)."""
+        with self._lock:
+            estado = self._jobs.get(job_id)
+        if estado is None:
+            return None
+        fracao = estado.concluidos / estado.total if estado.total else 0.0
+        return {
+            "id": estado.id,
+            "descricao": estado.descricao,
+            "estado": estado.estado,
+            "etapa": estado.etapa,
+            "item": estado.item,
+            "concluidos": estado.concluidos,
+            "total": estado.total,
+            "fracao": 1.0 if estado.estado == "concluido" else min(fracao, 1.0),
+            "erro": estado.erro,
+        }
+
+    def resultado(self, job_id: str):
+        """Resultado de um job concluído (None se ainda não terminou ou não existe)."""
+        with self._lock:
+            estado = self._jobs.get(job_id)
+        if estado is None or estado.estado != "concluido":
+            return None
+        return estado.resultado
+
+    def descartar(self, job_id: str) -> None:
+        self.cancelar(job_id)
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def _descartar_antigos(self) -> None:
+        # Chamado com o lock: remove os finalizados mais antigos além do limite.
+        excesso = len(self._jobs) - self.max_resultados
+        if excesso <= 0:
+            return
+        for job_id in [j for j, e in self._jobs.items() if e.estado in FINALIZADOS][:excesso]:
+            del self._jobs[job_id]
+
+
+_gerenciador: Optional[GerenciadorJobs] = None
+_gerenciador_lock = threading.Lock()
+
+
+def obter_gerenciador() -> GerenciadorJobs:
+    """Instância única do processo (compartilhada por todas as sessões)."""
+    global _gerenciador
+    with _gerenciador_lock:
+        if _gerenciador is None:
+            _gerenciador = GerenciadorJobs()
+        return _gerenciador
+
+# ==========================
+# Jobs prontos
+# ==========================
+
+async def gerar_lote(
+    progresso: Progresso,
+    itens: List[dict],
+    header_img: Optional[str] = None,
+    footer_img: Optional[str] = None,
+    sessao: str = "lote",
+) -> Dict[str, bytes]:
+    """Gera um TR por item. Cada item: {"nome", "modelo": bytes|None, "modo", "ctx"}.
+    Retorna {nome: bytes do DOCX}.
+
+    Itens com o mesmo modelo e modo compartilham um único plano compilado (`plano_tr`):
+    leitura e combinação são feitas uma vez e cada item só aplica o seu ctx.
+
+    A montagem de cada DOCX passa pelo controle de admissão em nome de `sessao`; se o
+    pedido for recusado (fila cheia), o job termina com erro."""
+    loop = asyncio.get_running_loop()
+    # Na primeira chamada o pool sobe os workers; isso não pode bloquear o event loop.
+    pool = await loop.run_in_executor(None, obter_executor)
+
+    async def no_pool(fn, *args):
+        try:
+            return await loop.run_in_executor(pool, fn, *args)
+        except BrokenProcessPool:
+            # Worker morto: este lote falha, mas os próximos jobs usam um pool novo.
+            descartar_executor(pool)
+            raise
+
+    progresso.definir_total(len(itens) * len(ETAPAS))
+    documentos: Dict[str, bytes] = {}
+    planos: Dict[Tuple[Optional[bytes], str], PlanoTR] = {}
+    for item in itens:
+        nome = item["nome"]
+        dados = item.get("modelo")
+        chave = (dados, item.get("modo", "complementar"))
+
+        await progresso.etapa("parse", nome)
+        if chave not in planos and dados:
+            inicio = time.perf_counter()
+            secoes_modelo = await no_pool(tarefa_ler_modelo, dados)
+            metricas.observar_leitura("numeracao", time.perf_counter() - inicio)
+        else:
+            secoes_modelo = []
+        progresso.avancar()
+
+        await progresso.etapa("merge", nome)
+        if chave not in planos:
+            planos[chave] = compilar_plano(
+                [secao_de_dict(s) for s in secoes_modelo],
+                template_interno_padrao(),
+                modo=chave[1],
+            )
+        progresso.avancar()
+
+        await progresso.etapa("render", nome)
+        secoes = planos[chave].renderizar(item.get("ctx"))
+        progresso.avancar()
+
+        await progresso.etapa("save", nome)
+        controle = obter_controle()
+        with metricas.medir_geracao("lote", "importado" if dados else "interno", chave[1]) as medida:
+            ticket = controle.entrar(sessao)
+            try:
+                # Se o job for cancelado aqui, `sair` retira o ticket e a thread que
+                # aguarda termina com PedidoCancelado em vez de esperar para sempre.
+                await loop.run_in_executor(None, controle.aguardar, ticket)
+                documentos[nome] = await no_pool(
+                    tarefa_gerar_docx, [secao_para_dict(s) for s in secoes], header_img, footer_img,
+                )
+                medida["bytes"] = len(documentos[nome])
+            finally:
+                controle.sair(ticket)
+        progresso.avancar()
+    return documentos
+
+
+def empacotar_zip(documentos: Dict[str, bytes]) -> bytes:
+    """Junta os documentos de um lote num único .zip para download."""
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        for nome, dados in documentos.items():
+            zf.writestr(nome, dados)
+    return buffer.getvalue()
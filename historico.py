@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+Módulo: historico.py
+
+Histórico de versões dos rascunhos, no mesmo banco SQLite de `rascunhos.py`.
+
+Cada rascunho tem uma ou mais **trilhas** versionadas: ``"dados"`` (os campos do
+assistente) e ``"documento"`` (o TR gerado, como lista de parágrafos ou de seções
+serializadas com `secao_para_dict`). Em cada trilha:
+
+- a versão é gravada como **delta** da anterior: o JSON canônico é quebrado em tokens
+  (palavras, espaços e quebras de linha) e o delta guarda só as faixas copiadas da versão
+  anterior e os tokens novos, comprimido com zlib;
+- a cada ``snapshot_a_cada`` versões grava-se uma **cópia completa** (também comprimida),
+  então reconstruir qualquer versão aplica no máximo ``snapshot_a_cada - 1`` deltas;
+- versões idênticas à anterior não são gravadas.
+"""
+from __future__ import annotations
+import difflib
+import json
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from rascunhos import CAMINHO_PADRAO
+
+SNAPSHOT_A_CADA = 20
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS versoes (
+    rascunho_id TEXT NOT NULL,
+    trilha TEXT NOT NULL,
+    versao INTEGER NOT NULL,
+    tipo TEXT NOT NULL,  -- 'completa' | 'delta'
+    conteudo BLOB NOT NULL,  -- zlib(JSON)
+    tamanho INTEGER NOT NULL,  -- bytes do JSON completo desta versão
+    criado_em REAL NOT NULL,
+    PRIMARY KEY (rascunho_id, trilha, versao)
+) WITHOUT ROWID;
+"""
+
+_regex_token = re.compile(r"\n| +|[^\n ]+")
+
+
+def _texto(obj) -> str:
+    # JSON canônico, um item por linha: pequenas edições mudam poucos tokens.
+    return json.dumps(obj, ensure_ascii=False, sort_keys=True, indent=1)
+
+
+def _tokens(texto: str) -> List[str]:
+    return _regex_token.findall(texto)
+
+
+def calcular_delta(anterior: List[str], atual: List[str]) -> list:
+    """Operações que levam `anterior` a `atual`: [inicio, fim] copia tokens da versão
+    anterior; uma string insere texto novo."""
+    # Edições costumam ser localizadas: o começo e o fim em comum saem direto, em tempo
+    # linear, e só o miolo passa pelo SequenceMatcher.
+    limite = min(len(anterior), len(atual))
+    ini = 0
+    while ini < limite and anterior[ini] == atual[ini]:
+        ini += 1
+    fim = 0
+    while fim < limite - ini and anterior[-1 - fim] == atual[-1 - fim]:
+        fim += 1
+
+    ops: list = [[0, ini]] if ini else []
+    miolo_a, miolo_b = anterior[ini:len(anterior) - fim], atual[ini:len(atual) - fim]
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, miolo_a, miolo_b).get_opcodes():
+        if tag == "equal":
+            ops.append([ini + i1, ini + i2])
+        elif tag in ("replace", "insert"):
+            ops.append("".join(miolo_b[j1:j2]))
+    if fim:
+        ops.append([len(anterior) - fim, len(anterior)])
+    return ops
+
+
+def aplicar_delta(anterior: List[str], ops: list) -> str:
+    partes = []
+    for op in ops:
+        partes.append("".join(anterior[op[0]:op[1]]) if isinstance(op, list) else op)
+    return "".join(partes)
+
+
+class HistoricoVersoes:
+    def __init__(self, caminho: str = CAMINHO_PADRAO, snapshot_a_cada: int = SNAPSHOT_A_CADA):
+        self.caminho = caminho
+        self.snapshot_a_cada = snapshot_a_cada
+        # Texto da última versão de cada trilha, para não reconstruí-lo a cada gravação.
+        self._ultimas: "OrderedDict[Tuple[str, str], Tuple[int, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        with self._conectar() as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.executescript(_ESQUEMA)
+
+    @contextmanager
+    def _conectar(self) -> Iterator[sqlite3.Connection]:
+        con = sqlite3.connect(self.caminho, timeout=10)
+        try:
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    def _texto_da_versao(self, rascunho_id: str, trilha: str, versao: int) -> Optional[str]:
+        # A última versão conhecida fica em memória; se outra aba (ou réplica) gravou
+        # depois dela, o texto é reconstruído do banco.
+        if not versao:
+            return None
+        chave = (rascunho_id, trilha)
+        with self._lock:
+            if self._ultimas.get(chave, (None,))[0] == versao:
+                self._ultimas.move_to_end(chave)
+                return self._ultimas[chave][1]
+        return self._reconstruir(rascunho_id, trilha, versao)
+
+    def _guardar_ultima(self, rascunho_id: str, trilha: str, versao: int, texto: str) -> None:
+        with self._lock:
+            self._ultimas[(rascunho_id, trilha)] = (versao, texto)
+            while len(self._ultimas) > 128:
+                self._ultimas.popitem(last=False)
+
+    def registrar(self, rascunho_id: str, trilha: str, obj) -> Optional[int]:
+        """Grava uma nova versão de `obj` (serializável em JSON). Retorna o número da
+        versão, ou None se nada mudou desde a anterior.
+
+        A leitura da última versão e a gravação da nova são uma transação só (``BEGIN
+        IMMEDIATE``): com duas abas no mesmo rascunho, a segunda espera a primeira e
+        calcula o delta sobre a versão que ela gravou."""
+        texto = _texto(obj)
+        with self._conectar() as con:
+            con.execute("BEGIN IMMEDIATE")
+            versao = con.execute(
+                "SELECT MAX(versao) FROM versoes WHERE rascunho_id = ? AND trilha = ?", (rascunho_id, trilha)
+            ).fetchone()[0] or 0
+            anterior = self._texto_da_versao(rascunho_id, trilha, versao)
+            if anterior == texto:
+                return None
+            versao += 1
+            if anterior is None or (versao - 1) % self.snapshot_a_cada == 0:
+                tipo, conteudo = "completa", texto
+            else:
+                tipo, conteudo = "delta", json.dumps(calcular_delta(_tokens(anterior), _tokens(texto)), ensure_ascii=False)
+            con.execute(
+                "INSERT INTO versoes (rascunho_id, trilha, versao, tipo, conteudo, tamanho, criado_em) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (rascunho_id, trilha, versao, tipo, zlib.compress(conteudo.encode("utf-8")),
+                 len(texto.encode("utf-8")), time.time()),
+            )
+        self._guardar_ultima(rascunho_id, trilha, versao, texto)
+        return versao
+
+    def _reconstruir(self, rascunho_id: str, trilha: str, versao: int) -> str:
+        with self._conectar() as con:
+            base = con.execute(
+                "SELECT MAX(versao) FROM versoes WHERE rascunho_id = ? AND trilha = ? AND versao <= ? AND tipo = 'completa'",
+                (rascunho_id, trilha, versao),
+            ).fetchone()[0]
+            if base is None:
+                raise KeyError((rascunho_id, trilha, versao))
+            linhas = con.execute(
+                "SELECT versao, tipo, conteudo FROM versoes "
+                "WHERE rascunho_id = ? AND trilha = ? AND versao BETWEEN ? AND ? ORDER BY versao",
+                (rascunho_id, trilha, base, versao),
+            ).fetchall()
+        if not linhas or linhas[-1][0] != versao:
+            raise KeyError((rascunho_id, trilha, versao))
+        texto = ""
+        for _, tipo, conteudo in linhas:
+            dados = zlib.decompress(conteudo).decode("utf-8")
+            texto = dados if tipo == "completa" else aplicar_delta(_tokens(texto), json.loads(dados))
+        return texto
+
+    def obter(self, rascunho_id: str, trilha: str, versao: int):
+        """Conteúdo da versão pedida (KeyError se ela não existe)."""
+        return json.loads(self._reconstruir(rascunho_id, trilha, versao))
+
+    def versoes(self, rascunho_id: str, trilha: str) -> List[dict]:
+        """[{"versao", "tipo", "tamanho", "armazenado", "criado_em"}], da mais nova para a mais antiga."""
+        with self._conectar() as con:
+            linhas = con.execute(
+                "SELECT versao, tipo, tamanho, LENGTH(conteudo), criado_em FROM versoes "
+                "WHERE rascunho_id = ? AND trilha = ? ORDER BY versao DESC",
+                (rascunho_id, trilha),
+            ).fetchall()
+        return [dict(zip(("versao", "tipo", "tamanho", "armazenado", "criado_em"), l)) for l in linhas]
+
+
+def campos_alterados(antes: Dict[str, object], depois: Dict[str, object]) -> List[str]:
+    """Campos de `dados` que diferem entre duas versões."""
+    return sorted(k for k in set(antes) | set(depois) if antes.get(k) != depois.get(k))
+
+
+_historico: Optional[HistoricoVersoes] = None
+
+
+def obter_historico() -> HistoricoVersoes:
+    """Instância única do processo, no banco dos rascunhos."""
+    global _historico
+    if _historico is None:
+        _historico = HistoricoVersoes()
+    return _historico
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Módulo: imagens.py
+
+Pré-processamento das imagens inseridas nos DOCX (logotipo enviado, cabeçalho, rodapé).
+
+Uma foto de celular com vários MB entrava no documento na resolução original, e cada
+DOCX gerado carregava (e salvava, e baixava) esses MB. `preparar_imagem`:
+
+1. aplica a orientação EXIF e reduz a imagem ao tamanho impresso na DPI alvo
+   (``TR_IMAGEM_DPI``, padrão 200): 6 polegadas viram no máximo 1200 px de largura;
+2. recomprime: PNG otimizado para imagens com transparência ou poucas cores (logotipos),
+   JPEG (``TR_IMAGEM_QUALIDADE``, padrão 85) quando ele sai bem menor (fotos);
+3. remove os metadados (EXIF, perfil ICC, textos) e grava a DPI, para que o tamanho
+   "natural" da imagem no Word seja o tamanho impresso.
+
+O resultado fica em cache pelo hash do conteúdo (e dos parâmetros), no processo: o mesmo
+logotipo em várias gerações é processado uma vez. Sem Pillow, ou se a imagem não puder ser
+lida, os bytes originais são devolvidos como estão.
+"""
+from __future__ import annotations
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from typing import Optional, Tuple
+
+DPI_ALVO = int(os.environ.get("TR_IMAGEM_DPI", 200))
+QUALIDADE_JPEG = int(os.environ.get("TR_IMAGEM_QUALIDADE", 85))
+LARGURA_UTIL_POL = 6.0  # largura útil da página A4/Carta com as margens padrão do python-docx
+_DPI_PADRAO = 72  # o que o python-docx assume quando a imagem não informa
+_CACHE_MAX = 64
+
+_cache: "OrderedDict[Tuple[str, Optional[float], int, int], bytes]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _chave(dados: bytes, largura_pol: Optional[float]) -> Tuple[str, Optional[float], int, int]:
+    return hashlib.blake2b(dados, digest_size=16).hexdigest(), largura_pol, DPI_ALVO, QUALIDADE_JPEG
+
+
+def preparar_imagem(dados: bytes, largura_pol: Optional[float] = None) -> bytes:
+    """Imagem pronta para o DOCX, com no máximo `largura_pol` polegadas a `DPI_ALVO`.
+
+    Sem `largura_pol`, vale a largura natural da imagem, limitada a `LARGURA_UTIL_POL`."""
+    chave = _chave(dados, largura_pol)
+    with _cache_lock:
+        if chave in _cache:
+            _cache.move_to_end(chave)
+            return _cache[chave]
+    try:
+        resultado = _processar(dados, largura_pol)
+    except Exception:
+        resultado = dados
+    with _cache_lock:
+        _cache[chave] = resultado
+        while len(_cache) > _CACHE_MAX:
+            _cache.popitem(last=False)
+    return resultado
+
+
+def largura_natural_pol(dados: bytes) -> float:
+    """Largura, em polegadas, com que o Word mostraria a imagem sem `width`."""
+    from PIL import Image
+
+    with Image.open(BytesIO(dados)) as img:
+        dpi = img.info.get("dpi", (_DPI_PADRAO,))[0] or _DPI_PADRAO
+        return img.width / float(dpi)
+
+
+def _processar(dados: bytes, largura_pol: Optional[float]) -> bytes:
+    from PIL import Image, ImageOps
+
+    with Image.open(BytesIO(dados)) as original:
+        formato = original.format
+        dpi_original = float(original.info.get("dpi", (_DPI_PADRAO,))[0] or _DPI_PADRAO)
+        orientacao = original.getexif().get(0x0112, 1)  # tag EXIF "Orientation"
+        img = ImageOps.exif_transpose(original)
+        img.load()
+
+    if largura_pol is None:
+        largura_pol = min(img.width / dpi_original, LARGURA_UTIL_POL)
+    limite_px = max(1, round(largura_pol * DPI_ALVO))
+    reduzida = img.width > limite_px
+    if reduzida:
+        altura = max(1, round(img.height * limite_px / img.width))
+        img = img.resize((limite_px, altura), Image.LANCZOS)
+        dpi = DPI_ALVO
+    else:
+        # Pequena o bastante: mantém os pixels e o tamanho natural que já tinha.
+        dpi = dpi_original
+    img.info = {}  # sem EXIF, ICC nem textos na regravação
+
+    saida = _recomprimir(img, formato, dpi)
+    if not reduzida and orientacao == 1 and len(saida) >= len(dados):
+        # Nada a ganhar (ex.: PNG já otimizado); os bytes originais servem.
+        return dados
+    return saida
+
+
+def _recomprimir(img, formato: Optional[str], dpi: float) -> bytes:
+    transparente = img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info)
+    if img.mode not in ("RGB", "RGBA", "L", "LA", "P"):
+        img = img.convert("RGBA" if transparente else "RGB")
+
+    png = BytesIO()
+    img.save(png, format="PNG", optimize=True, dpi=(dpi, dpi))
+    if transparente:
+        return png.getvalue()
+
+    jpeg = BytesIO()
+    img.convert("L" if img.mode in ("L", "LA") else "RGB").save(
+        jpeg, format="JPEG", quality=QUALIDADE_JPEG, optimize=True, progressive=True, dpi=(round(dpi), round(dpi))
+    )
+    # Fotos (ou o que já era JPEG) vão em JPEG; logotipos só se o JPEG for bem menor,
+    # porque os artefatos aparecem nas bordas de texto e traços.
+    if formato in ("JPEG", "MPO") or jpeg.tell() < png.tell() / 2:
+        return jpeg.getvalue()
+    return png.getvalue()
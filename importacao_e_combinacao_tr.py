@@ -0,0 +1,958 @@
+# -*- coding: utf-8 -*-
+"""
+Módulo: importacao_e_combinacao_tr.py
+
+Motor compartilhado pelos apps de Termo de Referência (TERMO.py, TESTE.py, mod1.py,
+appTR1.py e o app multipágina `app.py`). Concentra num único lugar:
+
+1) **Templates**: o template interno por seções (`template_interno_padrao`), o template
+   detalhado com placeholders (`template_interno`), o texto do assistente (`gerar_texto_tr`)
+   e o texto do gerador simples (`texto_termo`).
+2) **Leitura de modelos DOCX**, tanto por **numeração manual** (1., 1.1, 2. ...) em
+   `ler_modelo_docx` quanto por estilos **Heading** em `ler_modelo_docx_headings`.
+3) **Combinação** do conteúdo importado com o template interno (`combinar_secoes`),
+   nos modos "modelo", "template" e "complementar", e de várias fontes com prioridade
+   (`combinar_fontes`).
+4) **Exportação** para DOCX (`gerar_docx`, `gerar_docx_blocos`, `gerar_docx_texto`).
+
+Como todos os apps importam este módulo, os caches de processo abaixo (modelos lidos por
+conteúdo e imagens de cabeçalho/rodapé) servem a todas as páginas e sessões do mesmo servidor.
+Os resultados em cache são compartilhados: trate-os como somente leitura (exceto as
+leituras de modelo, que devolvem `Secao` novas a cada chamada, com tabelas como listas).
+
+Requisitos:
+    python-docx
+    Pillow (opcional: redução e recompressão das imagens, ver imagens.py)
+    numpy (planilha de itens, ver itens_tr.py)
+
+Imagens de cabeçalho/rodapé (se desejar):
+    /mnt/data/logo-prefeitura.png
+    /mnt/data/rodapé.png
+"""
+from __future__ import annotations
+import hashlib
+import heapq
+import os
+import re
+import threading
+from collections import OrderedDict, namedtuple
+from dataclasses import dataclass, field
+from datetime import date
+from functools import lru_cache
+from io import BytesIO
+from typing import List, Tuple, Dict, Optional
+
+from docx import Document
+from docx.oxml.table import CT_Tbl
+from docx.oxml.text.paragraph import CT_P
+from docx.shared import Inches
+from docx.table import Table
+from docx.text.paragraph import Paragraph
+
+from arvore_secoes import ArvoreSecoes, caminho_numerico, mesclar_arvores
+from imagens import largura_natural_pol, preparar_imagem
+from rastreamento import rastreado, span
+from titulos import LIMIAR_PADRAO, corresponder_secoes
+
+# Caminhos padrão das imagens de cabeçalho e rodapé (pré-carregadas no ambiente)
+LOGO_PATH = "/mnt/data/logo-prefeitura.png"
+RODAPE_PATH = "/mnt/data/rodapé.png"
+
+# ==========================
+# Estruturas de dados
+# ==========================
+
+@dataclass
+class Elemento:
+    tipo: str  # 'p' ou 'table'
+    payload: object  # texto (str) quando 'p'; tabela (python-docx Table ou lista de linhas) quando 'table'
+
+@dataclass
+class Secao:
+    titulo: str
+    numero: Optional[str]  # ex.: '1', '1.1', '2'
+    elementos: List[Elemento] = field(default_factory=list)
+
+# ==========================
+# Utilitários de parsing
+# ==========================
+
+_regex_inicio_secao = re.compile(r"^(?P<num>\d+(?:\.\d+)*)\.?\s*[-–—)]?\s+", re.UNICODE)
+
+def _iter_elementos_em_ordem(doc: Document):
+    """Itera parágrafos e tabelas na ordem em que aparecem no corpo do documento.
+    Retorna tuplas (tipo, objeto), onde tipo ∈ {"p", "table"}.
+    """
+    body = doc.element.body
+    for child in body.iterchildren():
+        if isinstance(child, CT_P):
+            yield ("p", child)
+        elif isinstance(child, CT_Tbl):
+            yield ("table", child)
+
+
+def _wrap_paragraph(doc: Document, ct_p: CT_P):
+    # Constrói um objeto Paragraph python-docx a partir do CT_P bruto
+    return Paragraph(ct_p, doc._body)
+
+
+def _wrap_table(doc: Document, ct_tbl: CT_Tbl):
+    # Constrói um objeto Table python-docx a partir do CT_Tbl bruto
+    return Table(ct_tbl, doc._body)
+
+
+def _tenta_numero_secao(texto: str) -> Tuple[Optional[str], Optional[str]]:
+    """Se o parágrafo parecer início de seção numérica, retorna (numero, titulo_completo).
+    Caso contrário, (None, None).
+    """
+    raw = texto.strip()
+    if not raw:
+        return None, None
+    m = _regex_inicio_secao.match(raw)
+    if m:
+        numero = m.group("num")
+        return numero, raw
+    return None, None
+
+# ==========================
+# Leitura de DOCX em seções
+# ==========================
+
+@rastreado(medir=lambda secoes, *_: {"secoes": len(secoes), "elementos": sum(len(s.elementos) for s in secoes)})
+def ler_modelo_docx(file_path_or_bytes) -> List[Secao]:
+    """Lê um DOCX e segmenta em seções por **numeração manual** (1., 1.1, 2., ...).
+    Preserva parágrafos e tabelas na ordem.
+
+    Retorna: lista de Secao, cada uma com `titulo`, `numero` (se detectado) e `elementos`.
+    """
+    doc = Document(file_path_or_bytes)
+    secoes: List[Secao] = []
+    secao_atual: Optional[Secao] = None
+
+    # Precisamos recriar objetos python-docx a partir de CT_P/CT_Tbl preservando ordem.
+    for tipo, child in _iter_elementos_em_ordem(doc):
+        if tipo == "p":
+            p = _wrap_paragraph(doc, child)
+            texto = p.text.strip()
+            numero, titulo = _tenta_numero_secao(texto)
+            if numero is not None:
+                # Fechar seção anterior
+                if secao_atual is not None:
+                    secoes.append(secao_atual)
+                secao_atual = Secao(titulo=titulo, numero=numero, elementos=[])
+            else:
+                if secao_atual is None:
+                    # Conteúdo prévio sem numeração: cria uma seção 0.
+                    secao_atual = Secao(titulo="0. PREÂMBULO", numero="0", elementos=[])
+                secao_atual.elementos.append(Elemento("p", texto))
+        else:  # table
+            tbl = _wrap_table(doc, child)
+            if secao_atual is None:
+                secao_atual = Secao(titulo="0. PREÂMBULO", numero="0", elementos=[])
+            secao_atual.elementos.append(Elemento("table", tbl))
+
+    if secao_atual is not None:
+        secoes.append(secao_atual)
+
+    return secoes
+
+
+def ler_modelo_docx_headings(file) -> List[Tuple[str, str]]:
+    """Lê um arquivo .docx de modelo e retorna uma lista de (heading, texto_acumulado).
+    Considera como heading qualquer parágrafo com estilo 'Heading X'.
+    """
+    doc = Document(file)
+    blocos = []
+    titulo_atual = None
+    buffer = []
+    for p in doc.paragraphs:
+        style_name = (p.style.name if p.style else "")
+        texto = p.text.strip()
+        if style_name and style_name.lower().startswith("heading") and texto:
+            # Fecha bloco anterior
+            if titulo_atual is not None:
+                blocos.append((titulo_atual, "\n".join(buffer).strip()))
+                buffer = []
+            titulo_atual = texto
+        else:
+            if texto:
+                buffer.append(texto)
+    # Último bloco
+    if titulo_atual is not None:
+        blocos.append((titulo_atual, "\n".join(buffer).strip()))
+    return blocos
+
+# ==========================
+# Caches de processo
+# ==========================
+
+_LEITORES = {
+    "numeracao": ler_modelo_docx,
+    "headings": ler_modelo_docx_headings,
+}
+
+
+_CacheInfo = namedtuple("_CacheInfo", "hits misses maxsize currsize")
+
+
+class _CacheLeituras:
+    """LRU das leituras de modelo, pela chave (hash do conteúdo, variante).
+
+    Guarda só a forma serializável (`secao_para_dict`, tabelas como listas de linhas):
+    um `Secao` recém-lido ainda tem `Table`s do python-docx, que prendem a árvore XML do
+    documento inteiro. A cada acerto as `Secao` são recriadas, então quem as recebe pode
+    alterá-las à vontade. `cache_info()` imita o do `lru_cache` (lido por `metricas.py`)."""
+
+    def __init__(self, maximo: int):
+        self.maximo = maximo
+        self._itens: "OrderedDict[Tuple[bytes, str], tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._acertos = 0
+        self._faltas = 0
+
+    def __call__(self, dados: bytes, variante: str) -> list:
+        chave = (hashlib.blake2b(dados, digest_size=16).digest(), variante)
+        with self._lock:
+            serializado = self._itens.get(chave)
+            if serializado is not None:
+                self._itens.move_to_end(chave)
+                self._acertos += 1
+            else:
+                self._faltas += 1
+        if serializado is None:
+            lidas = _LEITORES[variante](BytesIO(dados))
+            serializado = tuple(lidas) if variante == "headings" else tuple(secao_para_dict(s) for s in lidas)
+            with self._lock:
+                self._itens[chave] = serializado
+                while len(self._itens) > self.maximo:
+                    self._itens.popitem(last=False)
+        if variante == "headings":
+            return list(serializado)  # tuplas de str: imutáveis
+        secoes = [secao_de_dict(s) for s in serializado]
+        for secao in secoes:
+            for el in secao.elementos:
+                if el.tipo == "table":
+                    el.payload = [list(linha) for linha in el.payload]  # não expõe as listas do cache
+        return secoes
+
+    def cache_info(self) -> _CacheInfo:
+        with self._lock:
+            return _CacheInfo(self._acertos, self._faltas, self.maximo, len(self._itens))
+
+    def cache_clear(self) -> None:
+        with self._lock:
+            self._itens.clear()
+            self._acertos = self._faltas = 0
+
+
+_ler_modelo_cache = _CacheLeituras(maximo=32)
+
+
+def ler_modelo_em_cache(arquivo, variante: str = "numeracao") -> list:
+    """Lê um modelo DOCX reaproveitando o resultado quando o mesmo conteúdo já foi lido
+    por qualquer sessão/página deste processo.
+
+    `arquivo` pode ser um caminho, bytes ou um objeto com `getvalue()`/`read()`
+    (ex.: `UploadedFile` do Streamlit). `variante` ∈ {"numeracao", "headings"}.
+    """
+    if isinstance(arquivo, (bytes, bytearray)):
+        dados = bytes(arquivo)
+    elif hasattr(arquivo, "getvalue"):
+        dados = arquivo.getvalue()
+    elif hasattr(arquivo, "read"):
+        dados = arquivo.read()
+    else:
+        with open(arquivo, "rb") as f:
+            dados = f.read()
+    return _ler_modelo_cache(dados, variante)
+
+
+@lru_cache(maxsize=16)
+def _ler_imagem_cache(path: str, mtime: float) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def ler_imagem(path: Optional[str]) -> Optional[bytes]:
+    """Bytes da imagem em `path` (cacheados por caminho e data de modificação),
+    ou None se o caminho não foi informado ou não existe."""
+    if not path or not os.path.exists(path):
+        return None
+    return _ler_imagem_cache(path, os.path.getmtime(path))
+
+
+@lru_cache(maxsize=16)
+def _imagem_preparada_cache(path: str, mtime: float, largura_pol: float) -> bytes:
+    return preparar_imagem(_ler_imagem_cache(path, mtime), largura_pol)
+
+
+def imagem_preparada(path: Optional[str], largura_pol: float) -> Optional[bytes]:
+    """Como `ler_imagem`, mas já reduzida e recomprimida para `largura_pol` polegadas.
+
+    Os bytes codificados ficam em cache por caminho, data de modificação e largura: num
+    lote, o timbre é lido e codificado uma vez por processo e todos os documentos recebem
+    o mesmo objeto `bytes`."""
+    if not path or not os.path.exists(path):
+        return None
+    return _imagem_preparada_cache(path, os.path.getmtime(path), largura_pol)
+
+# ==========================
+# Forma serializável (JSON / entre processos)
+# ==========================
+
+def linhas_tabela(payload) -> List[List[str]]:
+    """Texto das células de uma tabela, linha a linha. Aceita tanto uma tabela
+    python-docx quanto a forma já serializada (lista de linhas)."""
+    if isinstance(payload, list):
+        return [[str(c) for c in linha] for linha in payload]
+    return [[cell.text for cell in row.cells] for row in payload.rows]
+
+
+def secao_para_dict(secao: Secao) -> dict:
+    """Converte uma Secao em dict serializável (tabelas viram listas de linhas)."""
+    elementos = []
+    for el in secao.elementos:
+        payload = linhas_tabela(el.payload) if el.tipo == "table" else str(el.payload)
+        elementos.append({"tipo": el.tipo, "payload": payload})
+    return {"titulo": secao.titulo, "numero": secao.numero, "elementos": elementos}
+
+
+def secao_de_dict(dados: dict) -> Secao:
+    """Inverso de `secao_para_dict`."""
+    elementos = [Elemento(e["tipo"], e["payload"]) for e in dados.get("elementos", [])]
+    return Secao(titulo=dados["titulo"], numero=dados.get("numero"), elementos=elementos)
+
+# ==========================
+# Placeholders
+# ==========================
+
+def aplicar_placeholders(texto: str, context: Dict[str, str]) -> str:
+    for k, v in context.items():
+        texto = texto.replace(f"{{{{{k}}}}}", v)
+    return texto
+
+# Texto pré-tokenizado: índices pares são literais, ímpares são chaves do ctx.
+Partes = Tuple[str, ...]
+
+_regex_placeholder = re.compile(r"\{\{([^{}]+?)\}\}")
+
+
+def compilar_texto(texto: str) -> Partes:
+    """'Objeto: {{OBJETO}}.' -> ('Objeto: ', 'OBJETO', '.')"""
+    return tuple(_regex_placeholder.split(texto))
+
+
+def renderizar_texto(partes: Partes, ctx: Dict[str, str]) -> str:
+    """Inverso de `compilar_texto` com os valores do ctx; chaves ausentes continuam
+    visíveis como {{CHAVE}}, como em `aplicar_placeholders`."""
+    if len(partes) == 1:
+        return partes[0]
+    return "".join(
+        parte if i % 2 == 0 else (ctx[parte] if parte in ctx else f"{{{{{parte}}}}}")
+        for i, parte in enumerate(partes)
+    )
+
+
+@rastreado("aplicar_placeholders", medir=lambda secoes, *_: {"secoes": len(secoes)})
+def aplicar_placeholders_secoes(secoes: List[Secao], ctx: Dict[str, str]) -> List[Secao]:
+    """Cópia das `secoes` com os placeholders {{CHAVE}} de `ctx` aplicados aos títulos,
+    parágrafos e células de tabelas já serializadas (listas de linhas)."""
+    if not ctx:
+        return list(secoes)
+    resultado: List[Secao] = []
+    for s in secoes:
+        elementos = []
+        for el in s.elementos:
+            if el.tipo == "p":
+                elementos.append(Elemento("p", aplicar_placeholders(str(el.payload), ctx)))
+            elif isinstance(el.payload, list):
+                linhas = [[aplicar_placeholders(c, ctx) for c in linha] for linha in el.payload]
+                elementos.append(Elemento(el.tipo, linhas))
+            else:
+                elementos.append(el)
+        resultado.append(Secao(titulo=aplicar_placeholders(s.titulo, ctx), numero=s.numero, elementos=elementos))
+    return resultado
+
+# ==========================
+# Template interno (exemplo)
+# ==========================
+
+def template_interno_padrao() -> List[Secao]:
+    """Retorna seções do template interno. Aqui estão as 6 seções básicas
+    (ajuste conforme seu template real). Cada seção entra com um parágrafo
+    placeholder para que possam ser mescladas.
+    """
+    def s(num, titulo, texto):
+        return Secao(titulo=f"{num} {titulo}", numero=str(num).split()[0], elementos=[Elemento("p", texto)])
+
+    return [
+        Secao(titulo="1. DAS CONDIÇÕES GERAIS DA CONTRATAÇÃO", numero="1", elementos=[Elemento("p", "(Template interno) Detalhe completo da seção 1...")]),
+        Secao(titulo="2. DESCRIÇÃO DA NECESSIDADE DA CONTRATAÇÃO E FUNDAMENTAÇÃO LEGAL", numero="2", elementos=[Elemento("p", "(Template interno) Detalhe completo da seção 2...")]),
+        Secao(titulo="3. DESCRIÇÃO DA SOLUÇÃO COMO UM TODO CONSIDERADO O CICLO DE VIDA DO OBJETO E ESPECIFICAÇÃO DOS SERVIÇOS", numero="3", elementos=[Elemento("p", "(Template interno) Detalhe completo da seção 3...")]),
+        Secao(titulo="4. REQUISITOS DA CONTRATAÇÃO", numero="4", elementos=[Elemento("p", "(Template interno) Detalhe completo da seção 4...")]),
+        Secao(titulo="5. MODELO DE EXECUÇÃO CONTRATUAL", numero="5", elementos=[Elemento("p", "(Template interno) Detalhe completo da seção 5...")]),
+        Secao(titulo="6. CRITÉRIOS DE MEDIÇÃO", numero="6", elementos=[Elemento("p", "(Template interno) Detalhe completo da seção 6...")]),
+    ]
+
+# ======================================
+# Template interno detalhado por seções
+# ======================================
+
+def template_interno(secao: int, ctx: Dict[str, str]) -> List[Tuple[str, str]]:
+    """Retorna uma lista de tuplas (heading, body) para cada seção.
+    O conteúdo é detalhado, com subitens e narrativa robusta, baseado no modelo fornecido pelo usuário.
+    """
+    OBJ = ctx.get("OBJETO", "objeto")
+    MUN = ctx.get("MUNICIPIO", "Município")
+    MOD = ctx.get("MODALIDADE", "Pregão Eletrônico")
+    SRP = ctx.get("SRP", "Sim")
+    CRI = ctx.get("CRITERIO", "Menor preço por item")
+    VIG = ctx.get("VIGENCIA", "12")
+    DECR = ctx.get("DECRETO_LUXO", "03/2024")
+
+    blocks: List[Tuple[str, str]] = []
+
+    if secao == 1:
+        heading = "1. DAS CONDIÇÕES GERAIS DA CONTRATAÇÃO"
+        body = (
+            f"1.1 O presente termo de referência tem por objeto o REGISTRO DE PREÇO PARA FUTURA E EVENTUAL CONTRATAÇÃO DE EMPRESA ESPECIALIZADA EM {OBJ}, com sede localizada no município de {MUN}, em conformidade com as especificações de descrição e quantidade detalhadamente elencadas neste documento, amparada pelas disposições legais vigentes que regulam tal procedimento, visando atender as necessidades da Prefeitura Municipal de {MUN} e de suas Secretarias Municipais.\n\n"
+            f"1.2 O objeto desta contratação não se enquadra como sendo de bem de luxo, conforme Decreto Municipal nº {DECR}.\n\n"
+            f"1.3 O prazo de vigência da contratação é de {VIG} ( {VIG} ) meses, contados da data de assinatura da ARP (Ata de Registro de Preços) ou do Contrato conforme celebrado, na forma do artigo 105 da Lei nº 14.133/2021, podendo o mesmo ser prorrogado a critério da Administração Pública.\n\n"
+            "1.4 O prazo de vigência poderá ser prorrogado, desde que haja interesse de ambas as partes, na forma autorizada pelos artigos 106 e 107, da Lei nº 14.133/2021."
+        )
+        blocks.append((heading, body))
+
+    if secao == 2:
+        heading = "2. DESCRIÇÃO DA NECESSIDADE DA CONTRATAÇÃO E FUNDAMENTAÇÃO LEGAL"
+        body = (
+            f"2.1 A presente contratação se fundamenta na necessidade em possuir {OBJ} para atender as necessidades do Município de {MUN}, em todas as Secretarias Municipais, utilizados no desempenho de suas atividades e cumprimento de sua missão institucional.\n\n"
+            "2.2 A demanda se destina ao atendimento de servidores, profissionais, consultores, técnicos, representantes de órgãos públicos, fornecedores, prestadores de serviços e demais colaboradores envolvidos em atividades de interesse público (cursos, oficinas, treinamentos, execuções contratuais, inspeções, auditorias, reuniões técnicas e operacionais).\n\n"
+            f"2.3 A contratação justifica-se pelos princípios da eficiência, economicidade e continuidade do serviço público, assegurando condições adequadas de segurança, regularidade, conforto e conformidade legal na execução de {OBJ}.\n\n"
+            f"2.4 O procedimento licitatório adotará a modalidade {MOD}{' com utilização do Sistema de Registro de Preços (SRP)' if SRP=='Sim' else ''}, com critério de julgamento '{CRI}', conforme os arts. 6º, 28, 82 e seguintes da Lei nº 14.133/2021 e, quando aplicável, o Decreto Federal nº 11.462/2023 (SRP)."
+        )
+        blocks.append((heading, body))
+
+    if secao == 3:
+        heading = "3. DESCRIÇÃO DA SOLUÇÃO COMO UM TODO CONSIDERADO O CICLO DE VIDA DO OBJETO E ESPECIFICAÇÃO DOS SERVIÇOS"
+        body = (
+            f"3.1 O objetivo é selecionar a proposta mais vantajosa para {OBJ}, observando requisitos de qualidade, prazos e conformidade regulatória.\n\n"
+            f"3.2 Ciclo de vida do objeto: planejamento da demanda; seleção do fornecedor; formalização contratual; execução (fornecimento, logística, conferência, recebimento provisório/definitivo); avaliação de desempenho; e encerramento, com análise de indicadores e lições aprendidas.\n\n"
+            "3.3 Alternativas avaliadas:\n"
+            "• Solução 1 – Execução direta pela Administração: potencial controle direto, porém, em geral, inviável por ausência de equipe técnica, infraestrutura dedicada, riscos operacionais e custos de implantação/manutenção.\n"
+            "• Solução 2 – Execução indireta (terceirização/fornecedor especializado): transferência de riscos operacionais ao contratado, atendimento a normas técnicas e sanitárias, maior flexibilidade e agilidade, com necessidade de fiscalização permanente pela Administração.\n\n"
+            "Conclusão: a Solução 2 mostra-se mais eficiente, econômica e segura, em conformidade com a Lei nº 14.133/2021.\n\n"
+            f"3.4 Especificações resumidas do objeto (adaptar conforme {OBJ}):\n"
+            "• Qualidade e conformidade com normas técnicas aplicáveis;\n"
+            "• Garantia de fornecimento contínuo;\n"
+            "• Atendimento a padrões de segurança, saúde e meio ambiente, quando aplicável;\n"
+            "• Emissão de nota fiscal com detalhamento por item e período;\n"
+            "• Suporte e atendimento em dias úteis e, quando necessário, fins de semana e feriados."
+        )
+        blocks.append((heading, body))
+
+    if secao == 4:
+        heading = "4. REQUISITOS DA CONTRATAÇÃO"
+        body = (
+            "4.1 Requisitos legais e habilitação: CNPJ ativo; regularidade fiscal e trabalhista; inscrição em cadastros pertinentes; atendimento à LGPD quando aplicável; atestados de capacidade técnica compatíveis com o objeto; e demais documentos previstos em edital.\n\n"
+            f"4.2 Requisitos técnicos mínimos (adaptar ao {OBJ}): conformidade com normas da ABNT/INMETRO e/ou regulatórias; padrões de segurança e qualidade; logística de fornecimento; e comprovação de capacidade operacional para atendimento à demanda.\n\n"
+            "4.3 Requisitos funcionais: atendimento sob demanda, sem cota mínima; cumprimento de prazos; suporte adequado; emissão de comprovantes/documentos para fins de controle e fiscalização administrativos.\n\n"
+            "4.4 Sustentabilidade (quando aplicável): gestão eficiente de água e energia; produtos e insumos com menor impacto ambiental; destinação adequada de resíduos; acessibilidade e inclusão.\n\n"
+            "4.5 Conformidade legal: observância integral da Lei nº 14.133/2021, normas sanitárias, de segurança e ambientais aplicáveis, além de orientações dos órgãos de controle."
+        )
+        blocks.append((heading, body))
+
+    if secao == 5:
+        heading = "5. MODELO DE EXECUÇÃO CONTRATUAL"
+        body = (
+            "5.1 O contrato deverá ser executado fielmente pelas partes; comunicações preferencialmente por escrito; possibilidade de reunião inicial para apresentação do plano de fiscalização.\n\n"
+            "5.2 Fiscalização (art. 117 da Lei nº 14.133/2021): o(s) fiscal(is) acompanharão a execução, registrarão ocorrências, notificarão correções, verificarão manutenção das condições de habilitação, empenho, pagamentos, garantias e eventuais glosas.\n\n"
+            "5.3 Gestão do contrato: o gestor consolidará registros formais (ordens de serviço, ocorrências, alterações, prorrogações), avaliará desempenho com base em indicadores e proporá medidas saneadoras quando necessário; elaborará relatório final ao término.\n\n"
+            "5.4 Extinção contratual: observar Arts. 137 a 139 da Lei nº 14.133/2021, incluindo hipóteses por inadimplemento, caso fortuito/força maior, razões de interesse público, entre outras; prever consequências e direitos, inclusive devolução de garantia e pagamentos devidos, quando cabível."
+        )
+        blocks.append((heading, body))
+
+    if secao == 6:
+        heading = "6. CRITÉRIOS DE MEDIÇÃO"
+        body = (
+            f"6.1 A medição será mensal e baseada no serviço/bem efetivamente {('prestado' if 'serviço' in OBJ.lower() else 'fornecido')} e atestado pela Administração.\n\n"
+            "6.2 Unidade de medida: conforme item e especificações (ex.: unidade, litro, kg, diária), respeitando ordens de fornecimento/serviço.\n\n"
+            "6.3 Documentos de medição: relação detalhada dos itens/quantitativos; relatórios de execução/entrega; notas fiscais compatíveis com preços registrados; comprovação de autorização formal.\n\n"
+            "6.4 Conferência e atesto: o gestor/fiscal conferirá informações, atestará relatórios e validará notas para liberação de pagamento, se atendidas as exigências contratuais.\n\n"
+            "6.5 Penalidades por divergências: inconsistências sem justificativa poderão ensejar glosas proporcionais, suspensão de pagamento e aplicação de sanções, nos termos da Lei nº 14.133/2021."
+        )
+        blocks.append((heading, body))
+
+    return blocks
+
+# ======================================
+# Texto corrido (assistente e gerador simples)
+# ======================================
+
+def gerar_texto_tr(d: dict) -> str:
+    obj = d.get("objeto", "").strip()
+    sub = d.get("subcategoria", "")
+
+    # Cabeçalho institucional
+    partes = [
+        "PREFEITURA MUNICIPAL DE BRASNORTE - MT",
+        "SECRETARIA MUNICIPAL DE ADMINISTRAÇÃO",
+        "",
+        "TERMO DE REFERÊNCIA",
+        "",
+        "1. DAS CONDIÇÕES GERAIS DA CONTRATAÇÃO",
+        f"\n1.1 O presente termo de referência tem por objeto o {obj.upper() if obj else '[OBJETO NÃO INFORMADO]'}, com sede localizada no município de Brasnorte-MT, em conformidade com as especificações de descrição e quantidade detalhadamente elencadas neste documento, amparada pelas disposições legais vigentes que regulam tal procedimento, visando atender as necessidades da Prefeitura Municipal de Brasnorte-MT e de suas Secretarias Municipais;",
+        "\n1.2 O objeto desta contratação não se enquadra como sendo de bem de luxo, conforme Decreto Municipal nº 03/2024;",
+        f"\n1.3 O prazo de vigência da contratação é de {d.get('vigencia_meses',12)} (doze) meses, contados da data de assinatura da ARP (Ata de Registro de Preços) ou do Contrato, na forma do art. 105 da Lei nº 14.133/2021, podendo ser prorrogado a critério da Administração Pública.",
+        ("\n1.4 O prazo de vigência poderá ser prorrogado, desde que haja interesse de ambas as partes, nos termos dos arts. 106 e 107 da Lei nº 14.133/2021." if d.get("prorrogavel", True) else ""),
+        "",
+        "2. DESCRIÇÃO DA NECESSIDADE DA CONTRATAÇÃO E FUNDAMENTAÇÃO LEGAL",
+        f"\n2.1 A presente contratação se fundamenta na necessidade institucional de garantir o atendimento contínuo e eficiente relativo a {sub.lower()} para as unidades/secretarias do Município, assegurando a continuidade dos serviços públicos e o cumprimento da missão institucional.",
+        "\n2.2 A contratação tem por finalidade atender às Secretarias Municipais, promovendo suporte às atividades administrativas, operacionais e técnicas, conforme planejamento da gestão e demanda das unidades requisitantes;",
+        "\n2.3 Justifica-se pela inexistência de estrutura própria que permita a execução direta, sendo necessária a contratação especializada para garantir eficiência, economicidade e regularidade;",
+        f"\n2.4 O procedimento adotado será a modalidade {d.get('modalidade')} com critério de julgamento {d.get('criterio').lower()}, observado o disposto na Lei nº 14.133/2021." ,
+        ("\n2.5 Será adotado o Sistema de Registro de Preços (SRP), nos termos do Decreto Federal nº 11.462/2023, proporcionando flexibilidade e economicidade." if d.get("srp", True) else ""),
+        "",
+        "3. DESCRIÇÃO DA SOLUÇÃO COMO UM TODO CONSIDERADO O CICLO DE VIDA DO OBJETO E ESPECIFICAÇÃO",
+        f"\n3.1 {d.get('solucao_texto','')}",
+        f"\n3.2 Ciclo de vida do objeto: {d.get('ciclo_texto','')} ",
+        "",
+        "4. REQUISITOS DA CONTRATAÇÃO",
+        "\n4.1 A contratada deverá atender, no mínimo, aos seguintes requisitos:" ,
+    ]
+
+    # Lista de requisitos marcados
+    for i, r in enumerate(d.get("requisitos_marcados", []), start=1):
+        partes.append(f"\n4.1.{i} {r}.")
+    if d.get("requisitos_extra"):
+        partes.append(f"\n4.2 Requisitos adicionais: {d['requisitos_extra']}")
+
+    partes += [
+        "",
+        "5. MODELO DE EXECUÇÃO CONTRATUAL",
+        "\n5.1 A execução contratual se dará mediante ordens de fornecimento/serviço emitidas pela Administração, com fiscalização designada conforme a Lei nº 14.133/2021;",
+        "\n5.2 Os pagamentos ocorrerão após aceite formal, mediante apresentação de nota fiscal e relatório de entrega/execução, em conformidade com as especificações e quantitativos contratados;",
+        "\n5.3 A gestão e a fiscalização observarão os arts. 117 a 124 da Lei nº 14.133/2021, incluindo registros de ocorrências, notificações e relatórios de acompanhamento;",
+        "",
+        "6. CRITÉRIOS DE MEDIÇÃO",
+        f"\n6.1 {d.get('medicao_texto','Medição baseada em entregas/serviços atestados pelo fiscal, com pagamento após aceite.')}",
+    ]
+
+    # Cláusulas inseridas a partir da biblioteca de TRs anteriores (busca_trs.py)
+    if d.get("clausulas_extras"):
+        partes += ["", "7. CLÁUSULAS COMPLEMENTARES"]
+        for i, c in enumerate(d["clausulas_extras"], start=1):
+            partes.append(f"\n7.{i} {c['texto']}")
+
+    partes += [
+        "",
+        f"**Brasnorte - MT, {date.today().strftime('%d/%m/%Y')}**",
+        "\n---\n",
+        "Este documento é gerado automaticamente com base nas diretrizes legais vigentes e poderá ser personalizado conforme peculiaridades do objeto. Recomenda-se revisão da Procuradoria Jurídica e do Controle Interno.",
+    ]
+
+    return "\n".join([p for p in partes if p is not None and p != ""])
+
+
+def texto_termo(objeto: str) -> str:
+    """Texto completo do TR do gerador simples (TERMO.py) para o `objeto` informado."""
+    return f"""
+PREFEITURA MUNICIPAL DE BRASNORTE - MT
+SECRETARIA MUNICIONAL DE ADMINISTRAÇÃO
+
+TERMO DE REFERÊNCIA
+
+1. DAS CONDIÇÕES GERAIS DA CONTRATAÇÃO
+
+1.1 O presente termo de referência tem por objeto o {objeto.upper()}, com sede localizada no município de Brasnorte-MT, em conformidade com as especificações de descrição e quantidade detalhadamente elencadas neste documento, amparada pelas disposições legais vigentes que regulam tal procedimento, visando atender as necessidades da Prefeitura Municipal de Brasnorte-MT e de suas Secretarias Municipais;
+
+1.2 O objeto desta contratação não se enquadra como sendo de bem de luxo, conforme Decreto Municipal nº 03/2024;
+
+1.3 O prazo de vigência da contratação é de 12 (doze) meses, contados da data de assinatura da ARP (Ata Registro de Preço) ou do Contrato conforme celebrado, na forma do artigo 105 da Lei n° 14.133/2021, podendo o mesmo ser prorrogado a critério da Administração Pública.
+
+1.4 O prazo de vigência poderá ser prorrogado, desde que haja interesse de ambas as partes, na forma autorizada pelos artigos 106 e 107, da Lei nº 14.133/2021.
+
+2. DESCRIÇÃO DA NECESSIDADE DA CONTRATAÇÃO E FUNDAMENTAÇÃO LEGAL
+
+2.1 A presente contratação se fundamenta na necessidade institucional de garantir o fornecimento contínuo de bens ou a prestação de serviços essenciais relacionados ao objeto {objeto.lower()}, indispensáveis ao funcionamento e à continuidade dos serviços públicos municipais.
+
+2.2 A contratação tem por finalidade atender às Secretarias Municipais, promovendo suporte às atividades administrativas, operacionais e técnicas essenciais à execução das políticas públicas locais;
+
+2.3 Justifica-se pela inexistência de estrutura própria que permita a realização direta do fornecimento ou execução do objeto, de forma a garantir eficiência, economicidade e regularidade dos serviços;
+
+2.4 A contratação será formalizada por meio de procedimento licitatório na modalidade de Pregão Eletrônico, com critério de julgamento por menor preço por item, nos termos do artigo 82 e seguintes da Lei nº 14.133/2021.
+
+2.5 Será adotado o Sistema de Registro de Preços, regido conforme Decreto Federal nº 11.462/2023, proporcionando maior flexibilidade, economicidade e planejamento orçamentário.
+
+3. DESCRIÇÃO DA SOLUÇÃO COMO UM TODO CONSIDERADO O CICLO DE VIDA DO OBJETO E ESPECIFICAÇÃO DOS SERVIÇOS
+
+3.1 O ciclo de vida do objeto abrange as fases de planejamento da demanda, seleção do fornecedor, formalização contratual, execução, acompanhamento da entrega, fiscalização e encerramento contratual, incluindo avaliação da qualidade e desempenho.
+
+3.2 Foram analisadas as seguintes soluções:
+
+Solução 1: Execução direta pela Administração Pública – inviável por ausência de estrutura, equipe técnica, equipamentos e logística adequada.
+
+Solução 2: Contratação de empresa especializada via licitação – viável e recomendada, possibilita controle de qualidade, cumprimento de prazos e maior eficiência administrativa.
+
+3.3 Conclusão: Opta-se pela execução indireta, por meio de licitação, com contratação de empresa especializada, conforme previsto na Lei nº 14.133/2021, garantindo atendimento das necessidades públicas com qualidade, regularidade e economicidade.
+
+4. REQUISITOS DA CONTRATAÇÃO
+
+4.1 A contratada deverá comprovar:
+- Regularidade fiscal e trabalhista;
+- Capacidade técnica compatível com o objeto;
+- Equipe técnica qualificada;
+- Atendimento contínuo conforme demanda;
+- Atendimento às normas de segurança, qualidade e meio ambiente;
+- Disponibilidade de infraestrutura compatível com o serviço ou fornecimento;
+- Responsabilidade socioambiental.
+
+4.2 A prestação dos serviços ou fornecimentos deverá respeitar todas as exigências estabelecidas no edital, plano de trabalho e cronograma físico-financeiro aprovado.
+
+5. MODELO DE EXECUÇÃO CONTRATUAL
+
+5.1 A execução contratual se dará por meio de ordens de fornecimento ou serviço emitidas pela Administração, com acompanhamento do fiscal designado.
+
+5.2 Os pagamentos serão realizados após aceite formal, com apresentação de nota fiscal, relatório de entrega ou execução, e comprovação da conformidade com os critérios técnicos e quantitativos definidos no contrato.
+
+5.3 A gestão e fiscalização do contrato observará o disposto nos artigos 117 a 124 da Lei nº 14.133/2021, incluindo a designação de fiscais, emissão de notificações, e elaboração de relatórios de acompanhamento.
+
+6. CRITÉRIOS DE MEDIÇÃO
+
+6.1 A medição será feita com base em documentos comprobatórios de execução (relatórios, notas fiscais, ordens de serviço, comprovantes de entrega etc.), validados pelo fiscal designado.
+
+6.2 O pagamento será condicionado à entrega efetiva e ao cumprimento dos padrões de qualidade, prazos e especificações técnicas estabelecidas no edital e contrato.
+
+**Brasnorte - MT, Julho de 2025**
+
+---
+
+Este documento é gerado automaticamente com base nas diretrizes legais vigentes e poderá ser personalizado conforme peculiaridades do objeto. Recomenda-se revisão da Procuradoria Jurídica e do Controle Interno.
+"""
+
+# ==========================
+# Combinação de seções
+# ==========================
+
+@rastreado(medir=lambda secoes, *_, **__: {"secoes": len(secoes)})
+def combinar_secoes(
+    secoes_modelo: List[Secao],
+    secoes_template: List[Secao],
+    modo: str = "complementar",
+    casar_titulos: bool = True,
+    limiar: float = LIMIAR_PADRAO,
+) -> List[Secao]:
+    """Combina seções do DOCX de modelo com o template interno.
+
+    modo:
+      - 'modelo'       -> retorna somente `secoes_modelo`.
+      - 'template'     -> retorna somente `secoes_template`.
+      - 'complementar' -> base = modelo; se uma numeração do template **não existir** no modelo,
+                          a seção do template é **inserida** (na ordem numérica). Vale também
+                          para subseções: um 4.3 do template entra entre o 4.2 e o 5 do modelo.
+
+    Números repetidos no modelo não se sobrescrevem: as repetições são mantidas logo após a
+    primeira ocorrência e geram um aviso `NumeracaoDuplicada` (ver `arvore_secoes.py`).
+
+    Com `casar_titulos`, uma seção do template que o modelo já tem com **outro número**
+    (ex.: "CRITÉRIOS DE MEDIÇÃO" em 7 em vez de 6) não é inserida de novo, nem as suas
+    subseções. Os títulos são comparados por `titulos.corresponder_secoes` (`limiar` de 0 a 1).
+    """
+    if modo == "modelo":
+        return secoes_modelo
+    if modo == "template":
+        return secoes_template
+
+    # complementar
+    if casar_titulos and secoes_modelo:
+        casadas = corresponder_secoes(secoes_modelo, secoes_template, limiar)
+        cobertos = {caminho_numerico(secoes_template[j].numero) for j in casadas.values()} - {None}
+        if cobertos:
+            secoes_template = [s for s in secoes_template if not _sob_algum(caminho_numerico(s.numero), cobertos)]
+    return mesclar_arvores(ArvoreSecoes(secoes_modelo), ArvoreSecoes(secoes_template))
+
+
+def _sob_algum(caminho, raizes) -> bool:
+    return caminho is not None and any(caminho[:n] in raizes for n in range(1, len(caminho) + 1))
+
+
+@dataclass
+class FonteSecoes:
+    nome: str  # ex.: "TR 2024", "Modelo TCE", "template"
+    secoes: List[Secao]
+    prioridade: int = 0  # maior vence quando duas fontes têm o mesmo número
+
+
+def _ordenada_por_numero(fonte: FonteSecoes):
+    """Seções numeradas da fonte como (caminho, seção), em ordem numérica. Modelos
+    normalmente já vêm ordenados; só se ordena (uma vez) quando não vêm."""
+    itens = [(c, s) for s in fonte.secoes if (c := caminho_numerico(s.numero)) is not None]
+    if any(itens[i][0] > itens[i + 1][0] for i in range(len(itens) - 1)):
+        itens.sort(key=lambda item: item[0])
+    return itens
+
+
+@rastreado(medir=lambda secoes, *_, **__: {"secoes": len(secoes)})
+def combinar_fontes(
+    fontes: List[FonteSecoes],
+    substituicoes: Optional[Dict[str, str]] = None,
+) -> List[Secao]:
+    """Combina várias fontes de seções numa intercalação k-way, em ordem numérica.
+
+    - Para cada número, vale a fonte de maior `prioridade` que o tenha; as demais só
+      preenchem os números que faltam (como o modo "complementar", para k fontes).
+    - `substituicoes` fixa a fonte de uma seção **e de todas as suas subseções**, por
+      nome: ``{"4": "TR 2024", "6": "Modelo TCE"}``. Se a fonte indicada não tiver
+      nada sob aquele número, a regra é ignorada e vale a prioridade.
+    - Seções sem numeração entram no final, da fonte de maior prioridade para a menor,
+      sem repetir títulos.
+
+    As listas são consumidas em fluxo (`heapq.merge`): custo linear no total de seções
+    (mais log k por seção).
+    """
+    substituicoes = {
+        caminho: nome
+        for numero, nome in (substituicoes or {}).items()
+        if (caminho := caminho_numerico(numero)) is not None
+    }
+    ordem = sorted(range(len(fontes)), key=lambda i: -fontes[i].prioridade)
+    posto = {i: p for p, i in enumerate(ordem)}  # 0 = maior prioridade
+    nomes = {f.nome: i for i, f in enumerate(fontes)}
+    listas = [_ordenada_por_numero(f) for f in fontes]
+
+    # Regras cuja fonte tem algo sob o número indicado (um conjunto de caminhos por fonte).
+    caminhos = [{c for c, _ in itens} for itens in listas]
+    regras = {
+        raiz: nomes[nome]
+        for raiz, nome in substituicoes.items()
+        if nome in nomes and any(c[:len(raiz)] == raiz for c in caminhos[nomes[nome]])
+    }
+
+    def fonte_fixada(caminho) -> Optional[int]:
+        for tamanho in range(len(caminho), 0, -1):
+            indice = regras.get(caminho[:tamanho])
+            if indice is not None:
+                return indice
+        return None
+
+    def fluxo(i: int):
+        for seq, (caminho, secao) in enumerate(listas[i]):
+            yield caminho, posto[i], seq, secao
+
+    fluxos = [fluxo(i) for i in range(len(fontes))]
+    resultado: List[Secao] = []
+    grupo: list = []
+
+    def fechar_grupo() -> None:
+        caminho = grupo[0][0]
+        fixada = fonte_fixada(caminho)
+        escolhido = posto[fixada] if fixada is not None else grupo[0][1]
+        resultado.extend(s for _, p, _, s in grupo if p == escolhido)
+
+    for item in heapq.merge(*fluxos, key=lambda item: item[:3]):
+        if grupo and item[0] != grupo[0][0]:
+            fechar_grupo()
+            grupo = []
+        grupo.append(item)
+    if grupo:
+        fechar_grupo()
+
+    titulos_vistos: set = set()
+    for i in ordem:
+        sem_numero = [s for s in fontes[i].secoes if caminho_numerico(s.numero) is None]
+        resultado.extend(s for s in sem_numero if s.titulo.strip().lower() not in titulos_vistos)
+        titulos_vistos.update(s.titulo.strip().lower() for s in sem_numero)
+    return resultado
+
+# ==========================
+# Geração do DOCX final
+# ==========================
+
+def _vincular_secoes(doc: Document) -> None:
+    """Faz as seções seguintes herdarem cabeçalho e rodapé da primeira.
+
+    Assim há uma só parte de cabeçalho e uma de rodapé, e a imagem é referenciada (por
+    relacionamento) uma vez, em vez de uma cópia por seção. O python-docx já guarda
+    imagens idênticas numa só parte de mídia (pelo SHA-1), inclusive entre cabeçalho e
+    rodapé; isso só vale se os bytes forem os mesmos, daí o cache de `imagem_preparada`."""
+    for section in doc.sections[1:]:
+        section.header.is_linked_to_previous = True
+        section.footer.is_linked_to_previous = True
+
+
+def _add_header_image_if_exists(doc: Document, path: Optional[str]):
+    imagem = imagem_preparada(path, 6.0)
+    if imagem is None:
+        return
+    try:
+        section = doc.sections[0]
+        header = section.header
+        paragraph = header.paragraphs[0] if header.paragraphs else header.add_paragraph()
+        run = paragraph.add_run()
+        # Ajuste a largura conforme necessário
+        run.add_picture(BytesIO(imagem), width=Inches(6.0))
+        _vincular_secoes(doc)
+    except Exception:
+        pass
+
+
+def _add_footer_image_if_exists(doc: Document, path: Optional[str]):
+    imagem = imagem_preparada(path, 6.0)
+    if imagem is None:
+        return
+    try:
+        section = doc.sections[0]
+        footer = section.footer
+        paragraph = footer.paragraphs[0] if footer.paragraphs else footer.add_paragraph()
+        run = paragraph.add_run()
+        run.add_picture(BytesIO(imagem), width=Inches(6.0))
+        _vincular_secoes(doc)
+    except Exception:
+        pass
+
+
+def _tamanho_saida(saida) -> int:
+    if isinstance(saida, (str, os.PathLike)):
+        return os.path.getsize(saida)
+    return saida.getbuffer().nbytes if hasattr(saida, "getbuffer") else saida.tell()
+
+
+@rastreado(medir=lambda _, secoes, *__, **___: {"secoes": len(secoes)})
+def gerar_docx(
+    secoes: List[Secao],
+    caminho_saida: str,
+    header_img: Optional[str] = None,
+    footer_img: Optional[str] = None,
+) -> str:
+    """Gera um DOCX novo a partir das `secoes` combinadas.
+    - Recria parágrafos como texto.
+    - Para tabelas, replica o conteúdo (linhas/células) simples.
+    Retorna o caminho do arquivo gerado.
+    """
+    doc = Document()
+
+    _add_header_image_if_exists(doc, header_img)
+    _add_footer_image_if_exists(doc, footer_img)
+
+    for s in secoes:
+        # Título da seção
+        doc.add_paragraph(s.titulo)
+        # Conteúdo
+        for el in s.elementos:
+            if el.tipo == "p":
+                texto = str(el.payload).strip()
+                if texto:
+                    doc.add_paragraph(texto)
+            elif el.tipo == "table":
+                # Copiar estrutura básica da tabela
+                try:
+                    linhas = linhas_tabela(el.payload)
+                    rows = len(linhas)
+                    cols = max((len(linha) for linha in linhas), default=0)
+                    if rows > 0 and cols > 0:
+                        new_tbl = doc.add_table(rows=rows, cols=cols)
+                        for r, linha in enumerate(linhas):
+                            for c, texto in enumerate(linha):
+                                new_tbl.cell(r, c).text = texto
+                except Exception:
+                    # fallback: ignorar tabela se der erro
+                    pass
+        # espaço entre seções
+        doc.add_paragraph("")
+
+    with span("doc.save") as sp:
+        doc.save(caminho_saida)
+        sp.atributos["bytes"] = _tamanho_saida(caminho_saida)
+    return caminho_saida
+
+
+@rastreado(medir=lambda buffer, blocos, *_, **__: {"blocos": len(blocos), "bytes": buffer.getbuffer().nbytes})
+def gerar_docx_blocos(
+    blocos: List[Tuple[str, str]],
+    ctx: Dict[str, str],
+    logo_path: Optional[str] = LOGO_PATH,
+    rodape_path: Optional[str] = RODAPE_PATH,
+    itens=None,
+) -> BytesIO:
+    """Gera o DOCX do template detalhado (mod1.py) a partir de (heading, body).
+    `itens` (`itens_tr.TabelaItens`), se informado, entra ao final como planilha estimativa.
+    """
+    doc = Document()
+    section = doc.sections[0]
+
+    # Cabeçalho com logo
+    try:
+        header = section.header
+        header_para = header.paragraphs[0]
+        run = header_para.add_run()
+        logo = imagem_preparada(logo_path, 2.5)
+        if logo is not None:
+            run.add_picture(BytesIO(logo), width=Inches(2.5))
+    except Exception:
+        pass
+
+    # Título inicial (opcional)
+    doc.add_heading("TERMO DE REFERÊNCIA", level=0)
+    p_meta = doc.add_paragraph()
+    p_meta.add_run("Município: ").bold = True
+    p_meta.add_run(ctx.get("MUNICIPIO", ""))
+    p_meta.add_run("  |  Setor requisitante: ").bold = True
+    p_meta.add_run(ctx.get("SECRETARIA", ""))
+
+    # Corpo
+    for heading, body in blocos:
+        level = 1 if heading[:1].isdigit() else 2
+        doc.add_heading(heading, level=level)
+        for par in body.split("\n\n"):
+            doc.add_paragraph(par)
+
+    # Planilha de itens (opcional)
+    if itens is not None and len(itens):
+        from itens_tr import adicionar_tabela_itens
+
+        doc.add_heading("ANEXO – PLANILHA ESTIMATIVA DE ITENS E PREÇOS", level=1)
+        with span("tabela_itens", itens=len(itens)):
+            adicionar_tabela_itens(doc, itens)
+
+    # Rodapé com imagem
+    try:
+        footer = section.footer
+        footer_para = footer.paragraphs[0]
+        run_footer = footer_para.add_run()
+        rodape = imagem_preparada(rodape_path, 6.0)
+        if rodape is not None:
+            run_footer.add_picture(BytesIO(rodape), width=Inches(6))
+    except Exception:
+        pass
+
+    buffer = BytesIO()
+    with span("doc.save") as sp:
+        doc.save(buffer)
+        sp.atributos["bytes"] = buffer.tell()
+    buffer.seek(0)
+    return buffer
+
+
+@rastreado(medir=lambda buffer, *_, **__: {"bytes": buffer.getbuffer().nbytes})
+def gerar_docx_texto(texto: str, logo=None) -> BytesIO:
+    """Gera um DOCX com uma linha de `texto` por parágrafo (TERMO.py/TESTE.py).
+    `logo`, se informado, é inserido no topo do documento.
+    """
+    doc = Document()
+    if logo:
+        # Insere logotipo no topo (se o usuário enviou), no tamanho natural da imagem,
+        # limitado à largura útil da página; `preparar_imagem` reduz os pixels a esse tamanho.
+        dados = logo.getvalue() if hasattr(logo, "getvalue") else logo.read()
+        imagem = preparar_imagem(dados)
+        try:
+            largura = Inches(largura_natural_pol(imagem))
+        except Exception:
+            largura = None
+        doc.add_picture(BytesIO(imagem), width=largura)
+    for linha in texto.split("\n"):
+        doc.add_paragraph(linha)
+    buf = BytesIO()
+    with span("doc.save") as sp:
+        doc.save(buf)
+        sp.atributos["bytes"] = buf.tell()
+    buf.seek(0)
+    return buf
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+Módulo: itens_tr.py
+
+Planilha de itens do TR (item, unidade, quantidade, valor unitário estimado e total),
+agrupada por lote.
+
+- `TabelaItens` guarda as linhas em colunas NumPy: textos em arrays de objetos,
+  quantidades em ``float64`` e preços em **centavos** (``int64``), para que somas de
+  dezenas de milhares de itens não acumulem erro de ponto flutuante.
+- Totais por linha, subtotais por lote e total geral são calculados de uma vez sobre as
+  colunas (`totais_centavos`, `subtotais`, `total_centavos`); o total de cada linha é
+  arredondado ao centavo antes de ser somado, como numa planilha de preços.
+- `formatar_brl` e `formatar_quantidade` formatam colunas inteiras no padrão brasileiro
+  ("R$ 1.234,56", "2,5").
+- `adicionar_tabela_itens` insere a planilha num `Document` do python-docx. As linhas
+  são cópias de linhas-modelo montadas uma vez, com o texto trocado direto no XML: criar
+  célula a célula pela API do python-docx é quadrático no número de linhas.
+- `TabelaItens.de_csv` lê a planilha exportada do Excel/LibreOffice (``;`` ou ``,``,
+  números com vírgula decimal); `ler_planilha` é a mesma leitura em cache por conteúdo.
+"""
+from __future__ import annotations
+import csv
+import io
+import unicodedata
+from copy import deepcopy
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.oxml.ns import qn
+
+COLUNAS_DOCX = ("Item", "Descrição", "Unidade", "Quantidade", "Valor unitário (R$)", "Valor total (R$)")
+
+# Cabeçalhos aceitos no CSV (sem acentos, minúsculos, espaços como "_") -> coluna.
+_ALIASES_CSV = {
+    "lote": "lote",
+    "descricao": "descricao",
+    "item": "descricao",
+    "especificacao": "descricao",
+    "unidade": "unidade",
+    "und": "unidade",
+    "un": "unidade",
+    "quantidade": "quantidade",
+    "qtd": "quantidade",
+    "qtde": "quantidade",
+    "preco_unitario": "preco_unitario",
+    "valor_unitario": "preco_unitario",
+    "preco_unitario_estimado": "preco_unitario",
+    "valor_unitario_estimado": "preco_unitario",
+}
+
+# ==========================
+# Formatação vetorizada
+# ==========================
+
+def _agrupar_milhares(inteiros: np.ndarray) -> np.ndarray:
+    """Inteiros não negativos como texto com "." entre os milhares: 1234567 -> "1.234.567"."""
+    # `astype(str)` + `zfill` sai bem mais barato que `np.char.mod("%03d", ...)`.
+    grupo = (inteiros % 1000).astype(str)
+    texto = np.where(inteiros >= 1000, np.char.zfill(grupo, 3), grupo)
+    resto = inteiros // 1000
+    while resto.any():
+        grupo = (resto % 1000).astype(str)
+        grupo = np.where(resto >= 1000, np.char.zfill(grupo, 3), grupo)
+        texto = np.where(resto > 0, np.char.add(np.char.add(grupo, "."), texto), texto)
+        resto = resto // 1000
+    return texto
+
+
+def formatar_brl(centavos: np.ndarray) -> np.ndarray:
+    """Valores em centavos como "R$ 1.234,56" (negativos: "-R$ 1.234,56")."""
+    centavos = np.asarray(centavos, dtype=np.int64)
+    if not centavos.size:
+        return np.empty(0, dtype=str)  # as funções de `np.char` falham com arrays vazios
+    absolutos = np.abs(centavos)
+    texto = np.char.add(
+        np.char.add("R$ ", _agrupar_milhares(absolutos // 100)),
+        np.char.add(",", np.char.zfill((absolutos % 100).astype(str), 2)),
+    )
+    return np.where(centavos < 0, np.char.add("-", texto), texto)
+
+
+def formatar_quantidade(quantidades: np.ndarray, casas: int = 3) -> np.ndarray:
+    """Quantidades com vírgula decimal e até `casas` decimais, sem zeros à direita."""
+    quantidades = np.asarray(quantidades, dtype=np.float64)
+    if not quantidades.size:
+        return np.empty(0, dtype=str)
+    escala = 10 ** casas
+    escalados = np.rint(np.abs(quantidades) * escala).astype(np.int64)
+    fracao = np.char.rstrip(np.char.zfill((escalados % escala).astype(str), casas), "0")
+    texto = np.char.add(
+        _agrupar_milhares(escalados // escala),
+        np.where(fracao != "", np.char.add(",", fracao), ""),
+    )
+    return np.where((quantidades < 0) & (escalados > 0), np.char.add("-", texto), texto)
+
+
+def _numeros_br(textos: np.ndarray) -> np.ndarray:
+    """Textos como "1.234,56", "R$ 10", "1.000" ou "2.5" para ``float64``.
+
+    Com vírgula, o ponto é separador de milhar. Sem vírgula, também o é quando seguido de
+    exatamente três dígitos ("1.000" = mil); senão é o separador decimal ("2.5")."""
+    if not len(textos):
+        return np.empty(0, dtype=np.float64)
+    limpos = np.char.strip(np.char.replace(np.char.replace(textos.astype(str), "R$", ""), "\xa0", ""))
+    limpos = np.char.replace(limpos, " ", "")
+    com_virgula = np.char.find(limpos, ",") >= 0
+    depois_do_ponto = np.char.rpartition(limpos, ".")[..., 2]
+    milhar = (np.char.find(limpos, ".") >= 0) & (np.char.str_len(depois_do_ponto) == 3)
+    brasileiros = np.char.replace(np.char.replace(limpos, ".", ""), ",", ".")
+    limpos = np.where(com_virgula | milhar, brasileiros, limpos)
+    try:
+        return limpos.astype(np.float64)
+    except ValueError:
+        for indice, texto in enumerate(limpos):
+            try:
+                float(texto)
+            except ValueError:
+                raise ValueError(f"Linha {indice + 1}: número inválido {str(textos[indice])!r}.") from None
+        raise
+
+# ==========================
+# Tabela
+# ==========================
+
+class TabelaItens:
+    """Itens do TR em colunas. `lote` vazio ("") significa item sem lote."""
+
+    def __init__(
+        self,
+        descricao: Iterable[str],
+        unidade: Iterable[str],
+        quantidade: Iterable[float],
+        preco_centavos: Iterable[int],
+        lote: Optional[Iterable[str]] = None,
+    ):
+        self.descricao = np.asarray(list(descricao), dtype=object)
+        n = len(self.descricao)
+        self.unidade = np.asarray(list(unidade), dtype=object)
+        self.quantidade = np.asarray(quantidade, dtype=np.float64).reshape(-1)
+        self.preco_centavos = np.asarray(preco_centavos, dtype=np.int64).reshape(-1)
+        self.lote = np.asarray(list(lote) if lote is not None else [""] * n, dtype=object)
+        if not (len(self.unidade) == len(self.quantidade) == len(self.preco_centavos) == len(self.lote) == n):
+            raise ValueError("As colunas da tabela de itens têm tamanhos diferentes.")
+        if n and (self.quantidade < 0).any():
+            raise ValueError(f"Quantidade negativa no item {int(np.argmax(self.quantidade < 0)) + 1}.")
+        if n and (self.preco_centavos < 0).any():
+            raise ValueError(f"Preço negativo no item {int(np.argmax(self.preco_centavos < 0)) + 1}.")
+
+    def __len__(self) -> int:
+        return len(self.descricao)
+
+    @classmethod
+    def de_linhas(cls, linhas: Iterable[Dict]) -> "TabelaItens":
+        """A partir de dicts com ``descricao``, ``unidade``, ``quantidade``,
+        ``preco_unitario`` (em reais) e, opcionalmente, ``lote``."""
+        linhas = list(linhas)
+        precos = np.asarray([float(linha["preco_unitario"]) for linha in linhas], dtype=np.float64)
+        return cls(
+            descricao=[str(linha["descricao"]) for linha in linhas],
+            unidade=[str(linha.get("unidade", "")) for linha in linhas],
+            quantidade=[float(linha["quantidade"]) for linha in linhas],
+            preco_centavos=np.rint(precos * 100).astype(np.int64),
+            lote=[str(linha.get("lote", "") or "") for linha in linhas],
+        )
+
+    @classmethod
+    def de_csv(cls, dados: Union[bytes, str]) -> "TabelaItens":
+        """Lê a planilha em CSV; a primeira linha tem os nomes das colunas (ver `_ALIASES_CSV`)."""
+        if isinstance(dados, bytes):
+            try:
+                dados = dados.decode("utf-8-sig")
+            except UnicodeDecodeError:
+                dados = dados.decode("cp1252")
+        primeira = dados.split("\n", 1)[0]
+        delimitador = max(";,\t", key=primeira.count)
+        leitor = csv.reader(io.StringIO(dados), delimiter=delimitador)
+        cabecalho = next(leitor, [])
+        colunas: Dict[str, int] = {}
+        for indice, nome in enumerate(cabecalho):
+            decomposto = unicodedata.normalize("NFKD", nome.strip().lower())
+            chave = "".join(c for c in decomposto if not unicodedata.combining(c)).replace(" ", "_").replace(".", "")
+            if chave in _ALIASES_CSV:
+                colunas.setdefault(_ALIASES_CSV[chave], indice)
+        faltando = [c for c in ("descricao", "quantidade", "preco_unitario") if c not in colunas]
+        if faltando:
+            raise ValueError(f"Colunas ausentes no CSV: {', '.join(faltando)}.")
+        linhas = [linha for linha in leitor if any(campo.strip() for campo in linha)]
+        largura = len(cabecalho)
+        matriz = np.array([(linha + [""] * largura)[:largura] for linha in linhas], dtype=object).reshape(-1, largura)
+
+        def coluna(nome: str) -> np.ndarray:
+            if nome not in colunas:
+                return np.full(len(matriz), "", dtype=object)
+            return np.array([str(c).strip() for c in matriz[:, colunas[nome]]], dtype=object)
+
+        return cls(
+            descricao=coluna("descricao"),
+            unidade=coluna("unidade"),
+            quantidade=_numeros_br(coluna("quantidade")),
+            preco_centavos=np.rint(_numeros_br(coluna("preco_unitario")) * 100).astype(np.int64),
+            lote=coluna("lote"),
+        )
+
+    # ---------- totais ----------
+
+    def totais_centavos(self) -> np.ndarray:
+        """Total de cada linha (quantidade × preço), arredondado ao centavo."""
+        return np.rint(self.quantidade * self.preco_centavos).astype(np.int64)
+
+    def _grupos(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(lotes na ordem em que aparecem, índice do lote de cada linha nessa ordem)."""
+        if not len(self):
+            return np.empty(0, dtype=object), np.empty(0, dtype=np.int64)
+        unicos, primeira, inverso = np.unique(self.lote.astype(str), return_index=True, return_inverse=True)
+        ordem = np.argsort(primeira, kind="stable")
+        posicao = np.empty_like(ordem)
+        posicao[ordem] = np.arange(len(ordem))
+        return unicos[ordem].astype(object), posicao[inverso.reshape(-1)]
+
+    def subtotais(self) -> List[Tuple[str, int]]:
+        """[(lote, subtotal em centavos)], na ordem em que os lotes aparecem."""
+        lotes, grupo = self._grupos()
+        somas = np.zeros(len(lotes), dtype=np.int64)
+        np.add.at(somas, grupo, self.totais_centavos())
+        return [(str(lote), int(soma)) for lote, soma in zip(lotes, somas)]
+
+    def total_centavos(self) -> int:
+        return int(self.totais_centavos().sum())
+
+    # ---------- saída ----------
+
+    def linhas_formatadas(self) -> List[Tuple[str, Tuple[str, ...]]]:
+        """Linhas prontas para a tabela do DOCX, agrupadas por lote: [(tipo, textos)].
+
+        Tipos: ``"lote"`` (título do lote), ``"item"`` (as seis colunas de `COLUNAS_DOCX`),
+        ``"subtotal"`` e ``"total"`` (rótulo, valor). Sem lotes, só itens e total."""
+        lotes, grupo = self._grupos()
+        ordem = np.argsort(grupo, kind="stable")
+        grupo_ordenado = grupo[ordem]
+        inicios = np.searchsorted(grupo_ordenado, np.arange(len(lotes)))
+        sequencia = np.arange(len(ordem)) - inicios[grupo_ordenado] + 1
+        com_lotes = len(lotes) > 1 or (len(lotes) == 1 and lotes[0] != "")
+        if com_lotes:
+            numeros = np.char.add(np.char.add((grupo_ordenado + 1).astype(str), "."), sequencia.astype(str))
+        else:
+            numeros = sequencia.astype(str)
+        totais = self.totais_centavos()
+        colunas = (
+            numeros,
+            self.descricao[ordem],
+            self.unidade[ordem],
+            formatar_quantidade(self.quantidade[ordem]),
+            formatar_brl(self.preco_centavos[ordem]),
+            formatar_brl(totais[ordem]),
+        )
+        itens = list(zip(*(c.tolist() for c in colunas)))
+        subtotais = self.subtotais()
+        textos_subtotais = formatar_brl(np.array([s for _, s in subtotais], dtype=np.int64)).tolist()
+
+        linhas: List[Tuple[str, Tuple[str, ...]]] = []
+        if com_lotes:
+            fins = np.append(inicios[1:], len(ordem))
+            for indice, (lote, _) in enumerate(subtotais):
+                rotulo = lote or "Sem lote"
+                linhas.append(("lote", (rotulo,)))
+                linhas.extend(("item", item) for item in itens[inicios[indice]:fins[indice]])
+                linhas.append(("subtotal", (f"Subtotal – {rotulo}", textos_subtotais[indice])))
+        else:
+            linhas.extend(("item", item) for item in itens)
+        linhas.append(("total", ("VALOR TOTAL ESTIMADO", str(formatar_brl(np.array([self.total_centavos()]))[0]))))
+        return linhas
+
+
+@lru_cache(maxsize=8)
+def ler_planilha(dados: bytes) -> TabelaItens:
+    """`TabelaItens.de_csv` em cache por conteúdo: a página relê o upload a cada rerun.
+    A tabela devolvida é compartilhada; trate-a como somente leitura."""
+    return TabelaItens.de_csv(dados)
+
+# ==========================
+# DOCX
+# ==========================
+
+def _linha_modelo(table, mesclar_ate: Optional[int], negrito: bool, a_direita: Tuple[int, ...]):
+    """Cria uma linha na tabela, formata e a remove, devolvendo o ``w:tr`` para cópias.
+
+    Com `mesclar_ate`, as células 0..`mesclar_ate` viram uma só; `a_direita` indexa as
+    células resultantes. Cada célula fica com um único ``w:t`` (texto "x") a substituir."""
+    row = table.add_row()
+    cells = list(row.cells)
+    if mesclar_ate is not None:
+        cells = [cells[0].merge(cells[mesclar_ate])] + cells[mesclar_ate + 1:]
+    for indice, cell in enumerate(cells):
+        paragrafo = cell.paragraphs[0]
+        paragrafo.add_run("x").bold = negrito or None
+        if indice in a_direita:
+            paragrafo.alignment = WD_ALIGN_PARAGRAPH.RIGHT
+    tr = row._tr
+    tr.getparent().remove(tr)
+    return tr
+
+
+def adicionar_tabela_itens(doc, tabela: TabelaItens, estilo: Optional[str] = "Table Grid"):
+    """Acrescenta ao `doc` a planilha de itens (com subtotais por lote e total geral)."""
+    table = doc.add_table(rows=1, cols=len(COLUNAS_DOCX))
+    if estilo:
+        try:
+            table.style = estilo
+        except KeyError:
+            pass  # modelo sem o estilo: fica a tabela sem bordas
+    for cell, titulo in zip(table.rows[0].cells, COLUNAS_DOCX):
+        cell.paragraphs[0].add_run(titulo).bold = True
+    ultima = len(COLUNAS_DOCX) - 1
+    modelos = {
+        "item": _linha_modelo(table, None, False, (3, 4, 5)),
+        "lote": _linha_modelo(table, ultima, True, ()),
+        "subtotal": _linha_modelo(table, ultima - 1, True, (1,)),
+        "total": _linha_modelo(table, ultima - 1, True, (1,)),
+    }
+    tbl = table._tbl
+    for tipo, textos in tabela.linhas_formatadas():
+        tr = deepcopy(modelos[tipo])
+        for t, texto in zip(tr.iter(qn("w:t")), textos):
+            t.text = texto
+            if texto != texto.strip():
+                t.set(qn("xml:space"), "preserve")
+        tbl.append(tr)
+    return table
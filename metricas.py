@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""
+Módulo: metricas.py
+
+Métricas de produção no formato texto do Prometheus, sem dependências externas.
+
+- ``tr_geracoes_total{app, fonte, modo, resultado}``: documentos gerados por página (ou
+  "lote", para a geração em segundo plano, e "servico_http") (``fonte`` = interno/importado/fontes/secoes, ``modo`` = complementar/modelo/template ou
+  "nenhum" nas páginas sem combinação; ``resultado`` = ok/erro/recusado);
+- ``tr_geracao_segundos{app}`` e ``tr_leitura_segundos{variante}``: histogramas de latência
+  da geração (do clique ao DOCX, incluindo a espera na fila) e da leitura de modelos;
+- ``tr_docx_bytes{app}``: histograma do tamanho dos DOCX gerados;
+- ``tr_cache_acertos_total``/``tr_cache_faltas_total``/``tr_cache_taxa_acerto{cache}``: caches
+  do processo do servidor (os dos workers do pool não são visíveis daqui);
+- ``tr_admissao_geracoes{estado}`` e ``tr_pool_jobs_pendentes`` (no serviço HTTP,
+  ``tr_servico_jobs_ocupados``): profundidade das filas.
+
+Nas páginas, a geração fica dentro de ``with medir_geracao(app, fonte, modo) as m:``, com
+``m["bytes"] = len(docx)`` ao final. As métricas são servidas em
+``http://TR_METRICAS_HOST:TR_METRICAS_PORTA/metrics`` (padrão ``127.0.0.1:9464``; porta
+``0`` desliga) por uma thread do próprio servidor Streamlit, iniciada por `iniciar_servidor`.
+"""
+from __future__ import annotations
+import bisect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger("tr.metricas")
+
+LIMITES_SEGUNDOS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+LIMITES_BYTES = (16_384, 65_536, 262_144, 1_048_576, 4_194_304, 16_777_216)
+TIPO_CONTEUDO = "text/plain; version=0.0.4; charset=utf-8"
+
+_lock = threading.Lock()
+_metricas: List["_Metrica"] = []
+_coletores: List[Callable[[], List[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]]] = []
+
+# ==========================
+# Tipos de métrica
+# ==========================
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _rotulos(valores: Dict[str, str]) -> str:
+    if not valores:
+        return ""
+    return "{" + ",".join(f'{k}="{_escapar(v)}"' for k, v in valores.items()) + "}"
+
+
+def _numero(valor: float) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if not float(valor).is_integer() else str(int(valor))
+
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Tuple[str, ...] = ()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = rotulos
+        self._lock = threading.Lock()
+        with _lock:
+            _metricas.append(self)
+
+    def _chave(self, valores: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(valores.get(r, "")) for r in self.rotulos)
+
+    def cabecalho(self) -> List[str]:
+        return [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} {self.tipo}"]
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Tuple[str, ...] = ()):
+        super().__init__(nome, ajuda, rotulos)
+        self._valores: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, valor: float = 1.0, **rotulos) -> None:
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0.0) + valor
+
+    def linhas(self) -> List[str]:
+        with self._lock:
+            valores = dict(self._valores)
+        return self.cabecalho() + [
+            f"{self.nome}{_rotulos(dict(zip(self.rotulos, chave)))} {_numero(v)}"
+            for chave, v in sorted(valores.items())
+        ]
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Tuple[str, ...] = (), limites=LIMITES_SEGUNDOS):
+        super().__init__(nome, ajuda, rotulos)
+        self.limites = tuple(sorted(limites))
+        # Por série: contagem em cada faixa (não acumulada), soma e total.
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observar(self, valor: float, **rotulos) -> None:
+        chave = self._chave(rotulos)
+        faixa = bisect.bisect_left(self.limites, valor)
+        with self._lock:
+            serie = self._series.setdefault(chave, [[0] * (len(self.limites) + 1), 0.0, 0])
+            serie[0][faixa] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def linhas(self) -> List[str]:
+        with self._lock:
+            series = {k: ([*s[0]], s[1], s[2]) for k, s in self._series.items()}
+        saida = self.cabecalho()
+        for chave, (faixas, soma, total) in sorted(series.items()):
+            base = dict(zip(self.rotulos, chave))
+            acumulado = 0
+            for limite, n in zip(self.limites + (float("inf"),), faixas):
+                acumulado += n
+                saida.append(f"{self.nome}_bucket{_rotulos({**base, 'le': _numero(limite)})} {acumulado}")
+            saida.append(f"{self.nome}_sum{_rotulos(base)} {_numero(soma)}")
+            saida.append(f"{self.nome}_count{_rotulos(base)} {total}")
+        return saida
+
+
+def registrar_coletor(coletor: Callable[[], List[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]]) -> None:
+    """Coletor chamado a cada leitura das métricas; devolve (nome, tipo, ajuda, amostras),
+    com amostras = [(rótulos, valor)]. Usado para valores lidos na hora (filas, caches)."""
+    with _lock:
+        if coletor not in _coletores:
+            _coletores.append(coletor)
+
+# ==========================
+# Métricas do gerador
+# ==========================
+
+GERACOES = Contador("tr_geracoes_total", "Documentos gerados, por página, fonte, modo e resultado.",
+                    ("app", "fonte", "modo", "resultado"))
+GERACAO_SEGUNDOS = Histograma("tr_geracao_segundos", "Latência da geração (inclui a espera na fila).", ("app",))
+LEITURA_SEGUNDOS = Histograma("tr_leitura_segundos", "Latência da leitura de modelos DOCX.", ("variante",))
+DOCX_BYTES = Histograma("tr_docx_bytes", "Tamanho dos DOCX gerados.", ("app",), LIMITES_BYTES)
+CACHE_CONSULTAS = Contador("tr_cache_consultas_total", "Consultas aos caches instrumentados, por resultado.",
+                           ("cache", "resultado"))
+
+
+@contextmanager
+def medir_geracao(app: str, fonte: str, modo: str = "nenhum") -> Iterator[dict]:
+    """Conta a geração e mede a latência; ``m["bytes"]`` (opcional) vai para `DOCX_BYTES`.
+    `FilaCheia` (do controle de admissão ou do serviço HTTP) conta como "recusado"; outras
+    exceções, como "erro"."""
+    medida: dict = {}
+    inicio = time.perf_counter()
+    resultado = "erro"
+    try:
+        yield medida
+        resultado = "ok"
+    except BaseException as e:
+        if type(e).__name__ == "FilaCheia":
+            resultado = "recusado"
+        raise
+    finally:
+        GERACOES.inc(app=app, fonte=fonte, modo=modo, resultado=resultado)
+        if resultado == "ok":
+            GERACAO_SEGUNDOS.observar(time.perf_counter() - inicio, app=app)
+            if medida.get("bytes") is not None:
+                DOCX_BYTES.observar(medida["bytes"], app=app)
+
+
+def observar_leitura(variante: str, segundos: float) -> None:
+    LEITURA_SEGUNDOS.observar(segundos, variante=variante)
+
+
+def contar_cache(cache: str, acerto: bool) -> None:
+    CACHE_CONSULTAS.inc(cache=cache, resultado="acerto" if acerto else "falta")
+
+
+# Caches `lru_cache` do motor lidos na hora da coleta (nome -> módulo, atributo).
+_CACHES_LRU = {
+    "leitura_modelos": ("importacao_e_combinacao_tr", "_ler_modelo_cache"),
+    "imagens": ("importacao_e_combinacao_tr", "_ler_imagem_cache"),
+    "imagens_preparadas": ("importacao_e_combinacao_tr", "_imagem_preparada_cache"),
+    "planos": ("plano_tr", "_plano_por_hash"),
+    "planos_blocos": ("plano_tr", "plano_blocos_em_cache"),
+}
+
+
+def _coletar_caches():
+    import importlib
+
+    acertos, faltas = {}, {}
+    for nome, (modulo, atributo) in _CACHES_LRU.items():
+        info = getattr(importlib.import_module(modulo), atributo).cache_info()
+        acertos[nome], faltas[nome] = info.hits, info.misses
+    with CACHE_CONSULTAS._lock:
+        for (cache, resultado), valor in CACHE_CONSULTAS._valores.items():
+            alvo = acertos if resultado == "acerto" else faltas
+            alvo[cache] = alvo.get(cache, 0) + valor
+    return [
+        ("tr_cache_acertos_total", "counter", "Acertos dos caches do processo do servidor.",
+         [({"cache": c}, v) for c, v in sorted(acertos.items())]),
+        ("tr_cache_faltas_total", "counter", "Faltas dos caches do processo do servidor.",
+         [({"cache": c}, v) for c, v in sorted(faltas.items())]),
+        ("tr_cache_taxa_acerto", "gauge", "Acertos / consultas desde a subida do processo.",
+         [({"cache": c}, acertos[c] / (acertos[c] + faltas.get(c, 0))) for c in sorted(acertos)
+          if acertos[c] + faltas.get(c, 0)]),
+    ]
+
+
+registrar_coletor(_coletar_caches)
+
+# ==========================
+# Exposição
+# ==========================
+
+def exposicao() -> str:
+    """Todas as métricas no formato texto do Prometheus (versão 0.0.4)."""
+    with _lock:
+        metricas, coletores = list(_metricas), list(_coletores)
+    linhas: List[str] = []
+    for metrica in metricas:
+        if metrica is CACHE_CONSULTAS:
+            continue  # somado às séries de cache de `_coletar_caches`
+        linhas.extend(metrica.linhas())
+    for coletor in coletores:
+        try:
+            familias = coletor()
+        except Exception:
+            logger.exception("coletor de métricas falhou: %r", coletor)
+            continue
+        for nome, tipo, ajuda, amostras in familias:
+            linhas.append(f"# HELP {nome} {ajuda}")
+            linhas.append(f"# TYPE {nome} {tipo}")
+            linhas.extend(f"{nome}{_rotulos(r)} {_numero(v)}" for r, v in amostras)
+    return "\n".join(linhas) + "\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        corpo = exposicao().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", TIPO_CONTEUDO)
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, formato, *args):  # uma linha por scrape só polui o log
+        pass
+
+
+_servidor: Optional[ThreadingHTTPServer] = None
+_tentou = False
+
+
+def iniciar_servidor(host: Optional[str] = None, porta: Optional[int] = None) -> Optional[ThreadingHTTPServer]:
+    """Sobe (uma vez por processo) a thread que serve ``/metrics``. Retorna None se
+    desligado pela porta 0 ou se a porta já estiver em uso (ex.: outra réplica no host)."""
+    global _servidor, _tentou
+    host = host or os.environ.get("TR_METRICAS_HOST", "127.0.0.1")
+    porta = int(os.environ.get("TR_METRICAS_PORTA", 9464)) if porta is None else porta
+    with _lock:
+        if _tentou or not porta:
+            return _servidor
+        _tentou = True
+        try:
+            _servidor = ThreadingHTTPServer((host, porta), _Handler)
+        except OSError as e:
+            logger.warning("métricas não publicadas em %s:%s: %s", host, porta, e)
+            return None
+        _servidor.daemon_threads = True
+        threading.Thread(target=_servidor.serve_forever, name="tr-metricas", daemon=True).start()
+        return _servidor
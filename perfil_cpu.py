@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+Módulo: perfil_cpu.py
+
+Captura de perfil (cProfile) sob demanda, de uma sessão só, para investigar lentidão
+relatada por um usuário sem precisar reproduzir as entradas dele.
+
+Duas formas de ligar:
+
+- ``?perfil=1`` na URL: cada rerun da sessão é perfilado enquanto o parâmetro estiver lá;
+- pelo painel de administração (barra lateral, com ``?debug=1``, só para os usuários em
+  ``TR_PERFIL_ADMIN``; ver `rastreamento.administrador`): escolhe-se uma sessão
+  recente e arma-se a captura dos próximos reruns dela, até um que gere documento (no
+  máximo `MAX_RERUNS_ARMADOS`).
+
+O perfil cobre a thread do script da sessão (o cProfile é por thread: as outras sessões
+não são afetadas) e os jobs que ela envia ao pool de `tarefas.py`, perfilados no worker e
+somados à captura. Cada captura pode ser baixada como ``.prof`` (para ``pstats``,
+snakeviz etc.) ou como pilhas colapsadas (``flamegraph.pl``, speedscope). As pilhas são
+reconstruídas a partir dos pares chamador→chamado do cProfile, com o tempo repartido
+proporcionalmente: são uma aproximação.
+"""
+from __future__ import annotations
+import contextvars
+import cProfile
+import marshal
+import os
+import pstats
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, List, Optional
+
+MAX_RERUNS_ARMADOS = 10
+_MAX_CAPTURAS_POR_SESSAO = 5
+_SESSAO_EXPIRA_S = 3600
+_PROFUNDIDADE_MAX = 64
+_TEMPO_MIN_PILHA_S = 1e-5
+
+_lock = threading.Lock()
+_capturas: Dict[str, Deque[dict]] = {}
+_armadas: Dict[str, int] = {}
+_vistas: Dict[str, dict] = {}
+
+_remotos: contextvars.ContextVar[Optional[List[dict]]] = contextvars.ContextVar("tr_perfil_remotos", default=None)
+
+# ==========================
+# Seleção das sessões
+# ==========================
+
+def _pedido_na_url() -> bool:
+    try:
+        import streamlit as st
+        return st.query_params.get("perfil", "") not in ("", "0")
+    except Exception:
+        return False
+
+
+def armar(sessao: str) -> None:
+    """Perfila os próximos reruns de `sessao`, até um que gere documento."""
+    with _lock:
+        _armadas[sessao] = MAX_RERUNS_ARMADOS
+
+
+def desarmar(sessao: str) -> None:
+    with _lock:
+        _armadas.pop(sessao, None)
+
+
+def armada(sessao: str) -> bool:
+    with _lock:
+        return sessao in _armadas
+
+
+def sessoes_recentes() -> List[dict]:
+    """Sessões com rerun na última hora, da mais recente para a mais antiga."""
+    limite = time.time() - _SESSAO_EXPIRA_S
+    with _lock:
+        for sessao in [s for s, v in _vistas.items() if v["visto"] < limite]:
+            del _vistas[sessao]
+        return sorted(({"sessao": s, **v} for s, v in _vistas.items()), key=lambda v: -v["visto"])
+
+# ==========================
+# Captura
+# ==========================
+
+def capturando() -> bool:
+    """Verdadeiro dentro de um rerun perfilado (os jobs do pool também são perfilados)."""
+    return _remotos.get() is not None
+
+
+def estatisticas(perfil: cProfile.Profile) -> dict:
+    """Dicionário do pstats (serializável) de um perfil encerrado."""
+    perfil.create_stats()
+    return perfil.stats
+
+
+def incorporar(estatisticas_remotas: dict) -> None:
+    """Soma à captura em andamento o perfil de um job executado em outro processo."""
+    remotos = _remotos.get()
+    if remotos is not None:
+        remotos.append(estatisticas_remotas)
+
+
+class _Remoto:
+    # `pstats.Stats` aceita qualquer objeto com `create_stats()` e `stats`.
+    def __init__(self, stats: dict):
+        self.stats = stats
+
+    def create_stats(self) -> None:
+        pass
+
+
+@contextmanager
+def capturar_rerun(sessao: str, pagina: str = "") -> Iterator[None]:
+    """Envolve o rerun da sessão num cProfile, se ela pediu (URL) ou foi armada."""
+    with _lock:
+        _vistas[sessao] = {"pagina": pagina, "visto": time.time()}
+        armada_agora = sessao in _armadas
+    if not (armada_agora or _pedido_na_url()):
+        yield
+        return
+    perfil = cProfile.Profile()
+    remotos: List[dict] = []
+    try:
+        perfil.enable()
+    except ValueError:
+        # Outro profiler já ativo nesta thread (ex.: o servidor rodando sob um depurador).
+        perfil = None
+    if perfil is None:
+        yield
+        return
+    token = _remotos.set(remotos)
+    inicio = time.time()
+    relogio = time.perf_counter()
+    try:
+        yield
+    finally:
+        perfil.disable()
+        _remotos.reset(token)
+        _guardar(sessao, pagina, inicio, time.perf_counter() - relogio, perfil, remotos)
+        with _lock:
+            if sessao in _armadas:
+                _armadas[sessao] -= 1
+                if remotos or _armadas[sessao] <= 0:
+                    del _armadas[sessao]
+
+
+def _guardar(sessao: str, pagina: str, inicio: float, duracao: float,
+             perfil: cProfile.Profile, remotos: List[dict]) -> None:
+    stats = pstats.Stats(perfil)
+    for remoto in remotos:
+        stats.add(_Remoto(remoto))
+    captura = {
+        "id": uuid.uuid4().hex[:8],
+        "sessao": sessao,
+        "pagina": pagina,
+        "inicio": inicio,
+        "duracao_s": duracao,
+        "jobs": len(remotos),
+        "prof": marshal.dumps(stats.stats),
+        "colapsado": pilhas_colapsadas(stats.stats),
+        "top": _top(stats.stats),
+    }
+    with _lock:
+        _capturas.setdefault(sessao, deque(maxlen=_MAX_CAPTURAS_POR_SESSAO)).append(captura)
+
+
+def capturas(sessao: Optional[str] = None) -> List[dict]:
+    """Capturas guardadas (de uma sessão ou de todas), da mais recente para a mais antiga."""
+    with _lock:
+        todas = [c for s, fila in _capturas.items() if sessao is None or s == sessao for c in fila]
+    return sorted(todas, key=lambda c: -c["inicio"])
+
+# ==========================
+# Formatos de saída
+# ==========================
+
+def _rotulo(funcao: tuple) -> str:
+    arquivo, linha, nome = funcao
+    if arquivo == "~":
+        return nome
+    return f"{nome} ({os.path.basename(arquivo)}:{linha})"
+
+
+def _top(stats: dict, limite: int = 15) -> List[dict]:
+    ordenadas = sorted(stats.items(), key=lambda item: -item[1][3])[:limite]
+    return [
+        {"função": _rotulo(f), "chamadas": nc, "total_ms": round(ct * 1000, 1), "própria_ms": round(tt * 1000, 1)}
+        for f, (cc, nc, tt, ct, _) in ordenadas
+    ]
+
+
+def pilhas_colapsadas(stats: dict) -> str:
+    """Pilhas no formato "a;b;c microssegundos", uma por linha.
+
+    O cProfile só guarda, para cada função, o tempo gasto a partir de cada chamador. Cada
+    caminho a partir das raízes recebe a fração do tempo da função correspondente às
+    arestas percorridas; ciclos (recursão) são cortados.
+    """
+    filhos: Dict[tuple, List[tuple]] = defaultdict(list)
+    for funcao, (_, _, _, _, chamadores) in stats.items():
+        for chamador, (_, _, _, ct_aresta) in chamadores.items():
+            filhos[chamador].append((funcao, ct_aresta))
+    pilhas: Counter = Counter()
+
+    def visitar(funcao: tuple, caminho: List[tuple], fracao: float) -> None:
+        _, _, tt, _, _ = stats[funcao]
+        rotulos = ";".join(_rotulo(f) for f in caminho)
+        pilhas[rotulos] += tt * fracao
+        if len(caminho) >= _PROFUNDIDADE_MAX:
+            return
+        for filho, ct_aresta in filhos.get(funcao, ()):
+            ct_filho = stats[filho][3]
+            if filho in caminho or ct_filho <= 0:
+                continue
+            parcela = fracao * min(ct_aresta / ct_filho, 1.0)
+            if parcela * ct_filho >= _TEMPO_MIN_PILHA_S:
+                visitar(filho, caminho + [filho], parcela)
+
+    for funcao, (_, _, _, _, chamadores) in stats.items():
+        if not chamadores:
+            visitar(funcao, [funcao], 1.0)
+    return "".join(
+        f"{pilha} {round(segundos * 1e6)}\n"
+        for pilha, segundos in sorted(pilhas.items())
+        if round(segundos * 1e6) > 0
+    )
+
+# ==========================
+# Interface
+# ==========================
+
+def _botoes(captura: dict) -> None:
+    import streamlit as st
+
+    nome = f"perfil_{captura['sessao'][:8]}_{time.strftime('%H%M%S', time.localtime(captura['inicio']))}"
+    col1, col2 = st.columns(2)
+    col1.download_button("⬇️ .prof", captura["prof"], file_name=f"{nome}.prof",
+                         mime="application/octet-stream", key=f"perfil_prof_{captura['id']}")
+    col2.download_button("⬇️ pilhas", captura["colapsado"], file_name=f"{nome}.folded",
+                         mime="text/plain", key=f"perfil_pilhas_{captura['id']}")
+
+
+def _listar(lista: List[dict]) -> None:
+    import streamlit as st
+
+    for captura in lista:
+        st.markdown(
+            f"**{time.strftime('%H:%M:%S', time.localtime(captura['inicio']))}** · {captura['pagina']} · "
+            f"{captura['duracao_s'] * 1000:.0f} ms · {captura['jobs']} job(s) no pool · sessão {captura['sessao'][:8]}"
+        )
+        st.dataframe(captura["top"][:8], hide_index=True, use_container_width=True)
+        _botoes(captura)
+
+
+def painel(sessao: str, admin: bool = False) -> None:
+    """Expander da barra lateral: as capturas da própria sessão (com ``?perfil=1``) e, para
+    `admin`, o controle que arma a captura de outra sessão e as capturas de todas."""
+    import streamlit as st
+
+    proprias = capturas(sessao)
+    if not admin and not proprias:
+        return
+    with st.sidebar.expander("⏱️ Perfil de CPU"):
+        if proprias and not admin:
+            _listar(proprias)
+            return
+        recentes = [v for v in sessoes_recentes() if v["sessao"] != sessao]
+        if recentes:
+            rotulos = {
+                v["sessao"]: f"{v['sessao'][:8]} · {v['pagina']} · há {time.time() - v['visto']:.0f} s"
+                + (" · armada" if armada(v["sessao"]) else "")
+                for v in recentes
+            }
+            alvo = st.selectbox("Sessão", list(rotulos), format_func=rotulos.get, key="perfil_alvo")
+            col1, col2 = st.columns(2)
+            if col1.button("Perfilar próxima geração", key="perfil_armar"):
+                armar(alvo)
+                st.toast(f"Captura armada para a sessão {alvo[:8]}.")
+            if col2.button("Cancelar", key="perfil_desarmar"):
+                desarmar(alvo)
+        else:
+            st.caption("Nenhuma outra sessão ativa na última hora.")
+        _listar(capturas())
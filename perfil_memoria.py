@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+"""
+Módulo: perfil_memoria.py
+
+Modo de perfil de memória, para investigar o crescimento de RSS das réplicas.
+
+Ligado por ``TR_PERFIL_MEMORIA=1`` (``TR_PERFIL_MEMORIA_QUADROS`` = profundidade das
+pilhas guardadas, padrão 1: cada snapshot custa proporcionalmente a ela). Com ele:
+
+- o tracemalloc roda desde a importação do motor;
+- cada span de `rastreamento.py` (leitura, combinação, placeholders, geração...) tira um
+  snapshot antes e outro depois; a diferença vai para o span (``mem_delta_bytes``) e os
+  locais que mais alocaram se acumulam por etapa;
+- `registrar_sessao` mede, ao fim de cada rerun, quanto o ``st.session_state`` da sessão
+  retém, separado em categorias (resultado de leitura, imagens, DOCX gerados, objetos
+  python-docx, outros);
+- `caches_do_processo` mostra o que os caches de módulo (leitura de modelos, planos,
+  imagens, resultados do pool) estão segurando, e `docx_vivos` conta os objetos
+  python-docx ainda vivos no processo, com o tamanho das árvores XML que eles prendem.
+
+Os snapshots deixam a geração várias vezes mais lenta: é um modo de diagnóstico, para uma
+réplica separada. Desligado, nada disso roda: `ativo()` é falso e `medir_etapa` não faz nada.
+"""
+from __future__ import annotations
+import gc
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import types
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+_ATIVO = os.environ.get("TR_PERFIL_MEMORIA", "") not in ("", "0")
+_QUADROS = int(os.environ.get("TR_PERFIL_MEMORIA_QUADROS", "1"))
+_TOP_POR_ETAPA = 10
+_SESSAO_EXPIRA_S = 3600
+
+_lock = threading.Lock()
+_etapas: Dict[str, dict] = {}
+_sessoes: Dict[str, dict] = {}
+
+
+def ativo() -> bool:
+    return _ATIVO
+
+
+def iniciar() -> None:
+    if _ATIVO and not tracemalloc.is_tracing():
+        tracemalloc.start(_QUADROS)
+
+
+iniciar()
+
+# ==========================
+# Snapshots por etapa
+# ==========================
+
+_FILTROS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+]
+
+
+def _snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces(_FILTROS)
+
+
+def _local(estatistica: tracemalloc.StatisticDiff) -> str:
+    quadro = estatistica.traceback[0]
+    return f"{os.path.relpath(quadro.filename) if quadro.filename.startswith(os.getcwd()) else quadro.filename}:{quadro.lineno}"
+
+
+@contextmanager
+def medir_etapa(nome: str) -> Iterator[dict]:
+    """Snapshot antes e depois do bloco. O dict devolvido recebe, ao final,
+    ``mem_delta_bytes`` (memória Python retida pela etapa) e ``mem_top`` (3 maiores locais)."""
+    resultado: dict = {}
+    if not _ATIVO or not tracemalloc.is_tracing():
+        yield resultado
+        return
+    antes = _snapshot()
+    try:
+        yield resultado
+    finally:
+        depois = _snapshot()
+        todas = depois.compare_to(antes, "lineno")
+        delta = sum(d.size_diff for d in todas)
+        diferencas = [d for d in todas if d.size_diff > 0]
+        resultado["mem_delta_bytes"] = delta
+        resultado["mem_top"] = [f"{_local(d)} +{d.size_diff}" for d in diferencas[:3]]
+        with _lock:
+            etapa = _etapas.setdefault(nome, {"chamadas": 0, "delta_total": 0, "locais": Counter()})
+            etapa["chamadas"] += 1
+            etapa["delta_total"] += delta
+            for d in diferencas[:_TOP_POR_ETAPA]:
+                etapa["locais"][_local(d)] += d.size_diff
+
+
+def top_alocacoes(limite: int = 15, agrupar: str = "lineno") -> List[dict]:
+    """Locais que mais seguram memória agora (não a diferença, o total vivo)."""
+    if not tracemalloc.is_tracing():
+        return []
+    estatisticas = _snapshot().statistics(agrupar)[:limite]
+    return [
+        {"local": f"{e.traceback[0].filename}:{e.traceback[0].lineno}", "bytes": e.size, "blocos": e.count}
+        for e in estatisticas
+    ]
+
+# ==========================
+# Memória retida por sessão
+# ==========================
+
+_ASSINATURAS_IMAGEM = (b"\x89PNG", b"\xff\xd8\xff", b"GIF8", b"BM")
+
+
+def _modulo(tipo: type) -> str:
+    modulo = getattr(tipo, "__module__", "")
+    return modulo if isinstance(modulo, str) else ""
+
+
+def _categoria(obj) -> Optional[str]:
+    tipo = type(obj)
+    modulo = _modulo(tipo)
+    if modulo.startswith("docx.") or modulo.startswith("lxml."):
+        return "python-docx"
+    if tipo.__name__ in ("Secao", "Elemento", "SecaoPlano", "PlanoTR", "ResultadoBusca"):
+        return "leitura"
+    if isinstance(obj, (bytes, bytearray)):
+        if obj[:4].startswith(_ASSINATURAS_IMAGEM):
+            return "imagens"
+        if obj[:2] == b"PK":
+            return "docx gerados/enviados"
+    if tipo.__name__ in ("BytesIO", "UploadedFile"):
+        return "docx gerados/enviados"
+    return None
+
+
+def _tamanho_xml(elemento) -> int:
+    try:
+        from lxml import etree
+        return len(etree.tostring(elemento))
+    except Exception:
+        return 0
+
+
+# Código e estruturas do interpretador: compartilhados, não são "retidos" por ninguém.
+_NAO_PERCORRER = (
+    type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType,
+    types.FrameType, types.CodeType, threading.Lock().__class__,
+)
+
+
+def retido_por_categoria(raiz) -> Dict[str, int]:
+    """Bytes alcançáveis a partir de `raiz` (sys.getsizeof), atribuídos à categoria do
+    primeiro ancestral reconhecido. As árvores XML do python-docx (memória do lxml, em C)
+    entram pelo tamanho serializado de cada raiz, uma vez."""
+    totais: Counter = Counter()
+    vistos = set()
+    raizes_xml = set()
+    pilha = [(raiz, "outros")]
+    while pilha:
+        obj, herdada = pilha.pop()
+        if id(obj) in vistos or isinstance(obj, _NAO_PERCORRER):
+            continue
+        vistos.add(id(obj))
+        categoria = _categoria(obj) or herdada
+        try:
+            totais[categoria] += sys.getsizeof(obj)
+        except TypeError:
+            continue
+        elemento = getattr(obj, "_element", None)
+        if elemento is not None and hasattr(elemento, "getroottree"):
+            raiz_xml = elemento.getroottree().getroot()
+            if id(raiz_xml) not in raizes_xml:
+                raizes_xml.add(id(raiz_xml))
+                totais["python-docx"] += _tamanho_xml(raiz_xml)
+            continue  # a árvore em si já foi contada
+        if hasattr(obj, "getbuffer") and not isinstance(obj, (bytes, bytearray)):
+            try:
+                totais[categoria] += obj.getbuffer().nbytes
+            except Exception:
+                pass
+        pilha.extend((filho, categoria) for filho in gc.get_referents(obj))
+    return dict(totais)
+
+
+def registrar_sessao(sessao: str, estado) -> Dict[str, int]:
+    """Mede o que o estado da sessão (``st.session_state``) retém e guarda o resultado."""
+    if not _ATIVO:
+        return {}
+    valores = {chave: estado[chave] for chave in list(estado.keys())}
+    por_categoria = retido_por_categoria(valores)
+    agora = time.time()
+    with _lock:
+        _sessoes[sessao] = {"categorias": por_categoria, "total": sum(por_categoria.values()), "em": agora}
+        for antiga in [s for s, r in _sessoes.items() if agora - r["em"] > _SESSAO_EXPIRA_S]:
+            del _sessoes[antiga]
+    return por_categoria
+
+
+def caches_do_processo() -> Dict[str, Dict[str, int]]:
+    """Caches de módulo já carregados: nº de ``entradas`` e memória retida, em bytes por
+    categoria.
+
+    Dos ``lru_cache`` só as chaves são alcançáveis pelo gc (os nós da lista não são
+    rastreados); para eles vale o nº de ``entradas``, e os objetos python-docx que os
+    resultados prendem aparecem em `docx_vivos`."""
+    caches = {}
+    motor = sys.modules.get("importacao_e_combinacao_tr")
+    if motor is not None:
+        leituras = getattr(motor, "_ler_modelo_cache", None)
+        if leituras is not None:
+            caches["importacao_e_combinacao_tr._ler_modelo_cache"] = {
+                "entradas": leituras.cache_info().currsize, **retido_por_categoria(dict(leituras._itens)),
+            }
+        for nome in ("_ler_imagem_cache", "_imagem_preparada_cache"):
+            funcao = getattr(motor, nome, None)
+            if funcao is not None:
+                caches[f"importacao_e_combinacao_tr.{nome}"] = _conteudo_lru(funcao)
+    plano = sys.modules.get("plano_tr")
+    if plano is not None:
+        caches["plano_tr.plano_em_cache"] = _conteudo_lru(plano._plano_por_hash)
+        caches["plano_tr.plano_blocos_em_cache"] = _conteudo_lru(plano.plano_blocos_em_cache)
+    tarefas = sys.modules.get("tarefas")
+    if tarefas is not None:
+        caches["tarefas._modelos_lidos"] = {
+            "entradas": len(tarefas._modelos_lidos), **retido_por_categoria(dict(tarefas._modelos_lidos)),
+        }
+    diff = sys.modules.get("diff_secoes")
+    if diff is not None:
+        caches["diff_secoes._cache"] = {"entradas": len(diff._cache), **retido_por_categoria(dict(diff._cache))}
+    return caches
+
+
+def _conteudo_lru(funcao) -> Dict[str, int]:
+    # O dict interno do lru_cache é um dos referentes do wrapper.
+    internos = [r for r in gc.get_referents(funcao) if isinstance(r, dict) and r is not getattr(funcao, "__dict__", None)]
+    return {"entradas": funcao.cache_info().currsize, **retido_por_categoria(internos)}
+
+
+def docx_vivos() -> Dict[str, object]:
+    """Objetos python-docx vivos no processo, por tipo, e o tamanho (XML serializado) das
+    árvores distintas a que eles pertencem. Percorre todos os objetos do gc: só no perfil."""
+    por_tipo: Counter = Counter()
+    raizes = {}
+    for obj in gc.get_objects():
+        if not _modulo(type(obj)).startswith("docx."):
+            continue
+        # Só os proxies de documento (Document, Paragraph, Table...), não descritores e enums.
+        elemento = getattr(obj, "_element", None)
+        if elemento is None or not hasattr(elemento, "getroottree"):
+            continue
+        por_tipo[type(obj).__name__] += 1
+        raiz = elemento.getroottree().getroot()
+        raizes.setdefault(id(raiz), raiz)
+    return {
+        "objetos": dict(por_tipo.most_common(10)),
+        "arvores": len(raizes),
+        "xml_bytes": sum(_tamanho_xml(r) for r in raizes.values()),
+    }
+
+
+def relatorio() -> dict:
+    atual, pico = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+    with _lock:
+        etapas = {
+            nome: {
+                "chamadas": e["chamadas"],
+                "delta_total_bytes": e["delta_total"],
+                "top": [{"local": l, "bytes": b} for l, b in e["locais"].most_common(_TOP_POR_ETAPA)],
+            }
+            for nome, e in _etapas.items()
+        }
+        sessoes = {s: dict(r) for s, r in _sessoes.items()}
+    return {
+        "ativo": _ATIVO,
+        "tracemalloc_atual_bytes": atual,
+        "tracemalloc_pico_bytes": pico,
+        "etapas": etapas,
+        "sessoes": sessoes,
+        "caches": caches_do_processo(),
+        "docx_vivos": docx_vivos(),
+        "top_alocacoes": top_alocacoes(),
+    }
+
+
+def painel(sessao: str) -> None:
+    """Expander do Streamlit (barra lateral) com o relatório; a sessão atual em destaque."""
+    import json
+    import streamlit as st
+
+    rel = relatorio()
+    mib = 2 ** 20
+    with st.sidebar.expander("🧠 Perfil de memória"):
+        st.caption(
+            f"tracemalloc: {rel['tracemalloc_atual_bytes'] / mib:.1f} MiB vivos, "
+            f"pico {rel['tracemalloc_pico_bytes'] / mib:.1f} MiB."
+        )
+        propria = rel["sessoes"].get(sessao)
+        if propria:
+            st.markdown(f"**Esta sessão retém {propria['total'] / mib:.2f} MiB**")
+            st.dataframe(
+                [{"categoria": c, "MiB": round(b / mib, 3)} for c, b in sorted(propria["categorias"].items(), key=lambda x: -x[1])],
+                hide_index=True,
+            )
+        st.markdown("**Sessões** (MiB retidos)")
+        st.dataframe(
+            [{"sessão": s[:8], "MiB": round(r["total"] / mib, 3)} for s, r in sorted(rel["sessoes"].items(), key=lambda x: -x[1]["total"])],
+            hide_index=True,
+        )
+        st.markdown("**Caches do processo** (entradas e MiB por categoria)")
+        linhas = []
+        for nome, cat in rel["caches"].items():
+            por_categoria = {c: b for c, b in cat.items() if c != "entradas"}
+            linhas.append({
+                "cache": nome,
+                "entradas": cat.get("entradas"),
+                "MiB": round(sum(por_categoria.values()) / mib, 3),
+                **{f"{c} (MiB)": round(b / mib, 3) for c, b in por_categoria.items()},
+            })
+        st.dataframe(linhas, hide_index=True)
+        vivos = rel["docx_vivos"]
+        st.caption(
+            f"python-docx vivos: {sum(vivos['objetos'].values())} objeto(s) em {vivos['arvores']} árvore(s) XML "
+            f"(~{vivos['xml_bytes'] / mib:.2f} MiB serializados)."
+        )
+        st.markdown("**Etapas** (memória retida acumulada)")
+        st.dataframe(
+            [
+                {"etapa": nome, "chamadas": e["chamadas"], "MiB": round(e["delta_total_bytes"] / mib, 3),
+                 "maior local": e["top"][0]["local"] if e["top"] else ""}
+                for nome, e in rel["etapas"].items()
+            ],
+            hide_index=True,
+        )
+        st.download_button(
+            "Baixar relatório (.json)",
+            json.dumps(rel, ensure_ascii=False, indent=1, default=str),
+            file_name="perfil_memoria.json",
+            mime="application/json",
+        )
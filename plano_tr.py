@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Módulo: plano_tr.py
+
+Pipeline em duas fases para montar o TR:
+
+1) **Compilação** (não depende do ctx): leitura do modelo, combinação com o template,
+   renumeração opcional e pré-tokenização dos textos em partes literais e placeholders.
+   O resultado é um `PlanoTR` imutável, que registra de qual fonte veio cada seção e pode
+   ficar em cache (`plano_em_cache`, por conteúdo do modelo e opções).
+2) **Renderização** (barata): `plano.renderizar(ctx)` só junta as partes com os valores
+   do ctx e devolve seções prontas para `gerar_docx`.
+
+Assim, editar um campo da barra lateral, ou gerar as linhas de um lote com o mesmo modelo,
+não refaz a leitura nem a combinação.
+
+Os modelos lidos por headings (mod1.py: pares heading/corpo) passam pelo mesmo plano
+(`plano_blocos_em_cache` + `construir_blocos`). O template interno detalhado não: ele é
+código Python com condições sobre o ctx (ex.: SRP) e é montado a cada chamada.
+"""
+from __future__ import annotations
+import hashlib
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from arvore_secoes import renumerar_secoes
+from importacao_e_combinacao_tr import (
+    Elemento,
+    FonteSecoes,
+    Partes,
+    Secao,
+    combinar_fontes,
+    combinar_secoes,
+    compilar_texto,
+    ler_modelo_em_cache,
+    linhas_tabela,
+    renderizar_texto,
+    template_interno,
+    template_interno_padrao,
+)
+from rastreamento import rastreado
+
+# ==========================
+# Plano compilado
+# ==========================
+
+@dataclass(frozen=True)
+class SecaoPlano:
+    fonte: str  # "modelo", "template" ou o nome da fonte em `combinar_fontes`
+    numero: Optional[str]
+    titulo: Partes
+    # ("p", partes) ou ("table", linhas de células, cada célula em partes)
+    elementos: Tuple[Tuple[str, object], ...]
+
+
+@dataclass(frozen=True)
+class PlanoTR:
+    secoes: Tuple[SecaoPlano, ...]
+
+    @property
+    def chaves(self) -> FrozenSet[str]:
+        """Placeholders usados em qualquer ponto do plano."""
+        chaves = set()
+        for secao in self.secoes:
+            chaves.update(secao.titulo[1::2])
+            for tipo, conteudo in secao.elementos:
+                if tipo == "p":
+                    chaves.update(conteudo[1::2])
+                else:
+                    for linha in conteudo:
+                        for celula in linha:
+                            chaves.update(celula[1::2])
+        return frozenset(chaves)
+
+    def fontes(self) -> Dict[str, List[str]]:
+        """{fonte: títulos das seções que vieram dela}, para exibir a procedência."""
+        por_fonte: Dict[str, List[str]] = {}
+        for secao in self.secoes:
+            por_fonte.setdefault(secao.fonte, []).append("".join(secao.titulo))
+        return por_fonte
+
+    @rastreado("aplicar_placeholders", medir=lambda secoes, *_: {"secoes": len(secoes)})
+    def renderizar(self, ctx: Optional[Dict[str, str]] = None) -> List[Secao]:
+        ctx = ctx or {}
+        secoes: List[Secao] = []
+        for s in self.secoes:
+            elementos = []
+            for tipo, conteudo in s.elementos:
+                if tipo == "p":
+                    elementos.append(Elemento("p", renderizar_texto(conteudo, ctx)))
+                else:
+                    linhas = [[renderizar_texto(c, ctx) for c in linha] for linha in conteudo]
+                    elementos.append(Elemento(tipo, linhas))
+            secoes.append(Secao(titulo=renderizar_texto(s.titulo, ctx), numero=s.numero, elementos=elementos))
+        return secoes
+
+    def renderizar_blocos(self, ctx: Optional[Dict[str, str]] = None) -> List[Tuple[str, str]]:
+        """Como `renderizar`, mas em pares (heading, corpo), para `gerar_docx_blocos`."""
+        return [
+            (secao.titulo, "\n\n".join(str(el.payload) for el in secao.elementos if el.tipo == "p"))
+            for secao in self.renderizar(ctx)
+        ]
+
+
+def _compilar_secao(secao: Secao, fonte: str) -> SecaoPlano:
+    elementos = []
+    for el in secao.elementos:
+        if el.tipo == "p":
+            elementos.append(("p", compilar_texto(str(el.payload))))
+        else:
+            linhas = tuple(tuple(compilar_texto(c) for c in linha) for linha in linhas_tabela(el.payload))
+            elementos.append((el.tipo, linhas))
+    return SecaoPlano(fonte=fonte, numero=secao.numero, titulo=compilar_texto(secao.titulo), elementos=tuple(elementos))
+
+
+def _montar_plano(secoes: List[Secao], origem: Dict[int, str], renumerar: bool) -> PlanoTR:
+    # A procedência é lida antes da renumeração, que cria novas seções nas mesmas posições.
+    fontes = [origem.get(id(s), "?") for s in secoes]
+    if renumerar:
+        secoes = renumerar_secoes(secoes)
+    return PlanoTR(secoes=tuple(_compilar_secao(s, f) for s, f in zip(secoes, fontes)))
+
+
+def compilar_plano(
+    secoes_modelo: List[Secao],
+    secoes_template: List[Secao],
+    modo: str = "complementar",
+    renumerar: bool = False,
+) -> PlanoTR:
+    """Fase 1: combina modelo e template (`combinar_secoes`) e compila o resultado."""
+    origem = {id(s): "template" for s in secoes_template}
+    origem.update({id(s): "modelo" for s in secoes_modelo})
+    return _montar_plano(combinar_secoes(secoes_modelo, secoes_template, modo=modo), origem, renumerar)
+
+
+def compilar_plano_fontes(
+    fontes: List[FonteSecoes],
+    substituicoes: Optional[Dict[str, str]] = None,
+    renumerar: bool = False,
+) -> PlanoTR:
+    """Fase 1 para várias fontes (`combinar_fontes`)."""
+    origem = {id(s): f.nome for f in fontes for s in f.secoes}
+    return _montar_plano(combinar_fontes(fontes, substituicoes), origem, renumerar)
+
+
+def compilar_plano_blocos(blocos: List[Tuple[str, str]], fonte: str = "modelo") -> PlanoTR:
+    """Fase 1 para um modelo lido por headings: cada (heading, corpo) vira uma seção
+    com um único parágrafo."""
+    return PlanoTR(secoes=tuple(
+        SecaoPlano(fonte=fonte, numero=None, titulo=compilar_texto(heading), elementos=(("p", compilar_texto(corpo)),))
+        for heading, corpo in blocos
+    ))
+
+
+@lru_cache(maxsize=32)
+@rastreado("compilar_plano", medir=lambda plano, *_: {"secoes": len(plano.secoes)})
+def plano_blocos_em_cache(blocos: Tuple[Tuple[str, str], ...]) -> PlanoTR:
+    """`compilar_plano_blocos` em cache pelo conteúdo dos blocos (o modelo não muda entre
+    os reruns da página; só o ctx muda)."""
+    return compilar_plano_blocos(list(blocos))
+
+
+@rastreado(medir=lambda blocos, *_: {"blocos": len(blocos), "caracteres": sum(len(h) + len(b) for h, b in blocos)})
+def construir_blocos(modo: str, ctx: Dict[str, str], modelos_importados: Dict[str, List[Tuple[str, str]]], modelo_escolhido: str) -> List[Tuple[str, str]]:
+    """Retorna lista de (heading, body). modo: 'interno' ou 'importado'."""
+    if modo == "importado" and modelo_escolhido and modelo_escolhido in modelos_importados:
+        blocos = tuple(tuple(bloco) for bloco in modelos_importados[modelo_escolhido])
+        return plano_blocos_em_cache(blocos).renderizar_blocos(ctx)
+    # modo interno: monta 1..6
+    blocos = []
+    for i in range(1, 7):
+        blocos.extend(template_interno(i, ctx))
+    return blocos
+
+
+# Bytes do modelo da chamada em curso: o cache é indexado pelo hash, e o DOCX enviado só
+# é lido numa falta, sem ficar preso na chave.
+_modelo_em_compilacao = threading.local()
+
+
+@lru_cache(maxsize=32)
+@rastreado("compilar_plano", medir=lambda plano, *_: {"secoes": len(plano.secoes)})
+def _plano_por_hash(hash_modelo: Optional[bytes], modo: str, renumerar: bool) -> PlanoTR:
+    dados_modelo = _modelo_em_compilacao.dados
+    secoes_modelo = ler_modelo_em_cache(dados_modelo) if dados_modelo else []
+    return compilar_plano(secoes_modelo, template_interno_padrao(), modo=modo, renumerar=renumerar)
+
+
+def plano_em_cache(dados_modelo: Optional[bytes], modo: str = "complementar", renumerar: bool = False) -> PlanoTR:
+    """Plano do modelo (bytes do DOCX, ou None para só o template) com o template interno,
+    em cache pelo hash do conteúdo e pelas opções. O plano é imutável e pode ser
+    compartilhado."""
+    hash_modelo = hashlib.blake2b(dados_modelo, digest_size=16).digest() if dados_modelo else None
+    _modelo_em_compilacao.dados = dados_modelo
+    try:
+        return _plano_por_hash(hash_modelo, modo, renumerar)
+    finally:
+        _modelo_em_compilacao.dados = None
+
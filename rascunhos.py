@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+Módulo: rascunhos.py
+
+Armazenamento persistente dos rascunhos do assistente (TESTE.py) em SQLite (modo WAL).
+
+- Cada rascunho tem um id e pertence a um usuário; os campos de ``dados`` ficam um por
+  linha, então salvar grava **só os campos alterados**.
+- `AutoSalvamento` acompanha o ``dados`` da sessão: a cada rerun compara os campos com a
+  última versão gravada (sem serializar o rascunho inteiro) e grava as alterações no
+  máximo a cada ``intervalo`` segundos.
+- `listar(usuario)` devolve os rascunhos mais recentes pelo índice (usuario, atualizado_em);
+  `carregar` e `excluir` só atuam sobre rascunhos do próprio usuário.
+- Sem autenticação, o "usuário" é um id aleatório do navegador (cookie ``tr_visitante``),
+  e não um nome comum a todos os visitantes: cada navegador só vê os próprios rascunhos.
+
+Configuração: ``TR_RASCUNHOS_DB`` (padrão: ``rascunhos_tr.sqlite3`` na pasta do app).
+"""
+from __future__ import annotations
+import copy
+import json
+import os
+import re
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+CAMINHO_PADRAO = os.environ.get(
+    "TR_RASCUNHOS_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "rascunhos_tr.sqlite3")
+)
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS rascunhos (
+    id TEXT PRIMARY KEY,
+    usuario TEXT NOT NULL,
+    titulo TEXT NOT NULL DEFAULT '',
+    criado_em REAL NOT NULL,
+    atualizado_em REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rascunhos_por_usuario ON rascunhos (usuario, atualizado_em DESC);
+CREATE TABLE IF NOT EXISTS campos (
+    rascunho_id TEXT NOT NULL REFERENCES rascunhos (id) ON DELETE CASCADE,
+    campo TEXT NOT NULL,
+    valor TEXT NOT NULL,  -- JSON
+    PRIMARY KEY (rascunho_id, campo)
+) WITHOUT ROWID;
+"""
+
+
+def _titulo(dados: dict) -> str:
+    return (str(dados.get("objeto") or "").strip().splitlines() or ["(sem objeto)"])[0][:80]
+
+
+class ArmazemRascunhos:
+    def __init__(self, caminho: str = CAMINHO_PADRAO):
+        self.caminho = caminho
+        with self._conectar() as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.executescript(_ESQUEMA)
+
+    @contextmanager
+    def _conectar(self) -> Iterator[sqlite3.Connection]:
+        con = sqlite3.connect(self.caminho, timeout=10)
+        con.execute("PRAGMA foreign_keys=ON")
+        con.execute("PRAGMA synchronous=NORMAL")  # suficiente com WAL
+        try:
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    def criar(self, usuario: str, dados: Optional[dict] = None) -> str:
+        rascunho_id = uuid.uuid4().hex
+        agora = time.time()
+        with self._conectar() as con:
+            con.execute(
+                "INSERT INTO rascunhos (id, usuario, titulo, criado_em, atualizado_em) VALUES (?, ?, ?, ?, ?)",
+                (rascunho_id, usuario, _titulo(dados or {}), agora, agora),
+            )
+        if dados:
+            self.salvar_campos(rascunho_id, dados)
+        return rascunho_id
+
+    def salvar_campos(self, rascunho_id: str, alterados: Dict[str, object], titulo: Optional[str] = None) -> None:
+        """Grava apenas os campos em `alterados` (upsert) e atualiza a data do rascunho."""
+        if not alterados:
+            return
+        linhas = [(rascunho_id, campo, json.dumps(valor, ensure_ascii=False)) for campo, valor in alterados.items()]
+        with self._conectar() as con:
+            con.executemany(
+                "INSERT INTO campos (rascunho_id, campo, valor) VALUES (?, ?, ?) "
+                "ON CONFLICT (rascunho_id, campo) DO UPDATE SET valor = excluded.valor",
+                linhas,
+            )
+            if titulo is None and "objeto" in alterados:
+                titulo = _titulo(alterados)
+            if titulo is not None:
+                con.execute(
+                    "UPDATE rascunhos SET atualizado_em = ?, titulo = ? WHERE id = ?", (time.time(), titulo, rascunho_id)
+                )
+            else:
+                con.execute("UPDATE rascunhos SET atualizado_em = ? WHERE id = ?", (time.time(), rascunho_id))
+
+    def carregar(self, rascunho_id: str, usuario: str) -> Optional[dict]:
+        """Campos do rascunho, ou None se ele não existe ou não pertence a `usuario`."""
+        with self._conectar() as con:
+            dono = con.execute("SELECT 1 FROM rascunhos WHERE id = ? AND usuario = ?", (rascunho_id, usuario))
+            if dono.fetchone() is None:
+                return None
+            linhas = con.execute("SELECT campo, valor FROM campos WHERE rascunho_id = ?", (rascunho_id,)).fetchall()
+        return {campo: json.loads(valor) for campo, valor in linhas}
+
+    def listar(self, usuario: str, limite: int = 20) -> List[dict]:
+        """Rascunhos mais recentes do usuário: [{"id", "titulo", "atualizado_em"}]."""
+        with self._conectar() as con:
+            linhas = con.execute(
+                "SELECT id, titulo, atualizado_em FROM rascunhos WHERE usuario = ? ORDER BY atualizado_em DESC LIMIT ?",
+                (usuario, limite),
+            ).fetchall()
+        return [dict(zip(("id", "titulo", "atualizado_em"), l)) for l in linhas]
+
+    def excluir(self, rascunho_id: str, usuario: str) -> None:
+        with self._conectar() as con:
+            con.execute("DELETE FROM rascunhos WHERE id = ? AND usuario = ?", (rascunho_id, usuario))
+
+
+class AutoSalvamento:
+    """Salvamento incremental e espaçado de um dict de campos (o ``dados`` do assistente).
+
+    Guarde uma instância por sessão (ex.: em ``st.session_state``) e chame `registrar`
+    ao fim de cada rerun. `dados_salvos` é o estado de partida (o rascunho carregado ou os
+    valores padrão): o rascunho só é criado no banco na primeira alteração, já com todos
+    os campos.
+    """
+
+    def __init__(self, armazem: ArmazemRascunhos, usuario: str, rascunho_id: Optional[str] = None,
+                 dados_salvos: Optional[dict] = None, intervalo: float = 2.0):
+        self.armazem = armazem
+        self.usuario = usuario
+        self.rascunho_id = rascunho_id
+        self.intervalo = intervalo
+        self._salvo: Dict[str, object] = copy.deepcopy(dados_salvos or {})
+        self._pendente: Dict[str, object] = {}
+        self._ultimo = 0.0
+
+    def registrar(self, dados: dict, forcar: bool = False) -> bool:
+        """Anota os campos alterados desde o último salvamento e grava se o intervalo já
+        passou (ou se `forcar`). Retorna True se gravou."""
+        for campo, valor in dados.items():
+            if campo not in self._salvo or self._salvo[campo] != valor:
+                self._pendente[campo] = valor
+            else:
+                self._pendente.pop(campo, None)
+        if not self._pendente:
+            return False
+        if not forcar and time.monotonic() - self._ultimo < self.intervalo:
+            return False
+        return self.gravar()
+
+    def gravar(self) -> bool:
+        if not self._pendente:
+            return False
+        alterados = copy.deepcopy(self._pendente)
+        if self.rascunho_id is None:
+            self.rascunho_id = self.armazem.criar(self.usuario, {**self._salvo, **alterados})
+        else:
+            self.armazem.salvar_campos(self.rascunho_id, alterados)
+        self._salvo.update(alterados)
+        self._pendente.clear()
+        self._ultimo = time.monotonic()
+        return True
+
+    @property
+    def pendente(self) -> bool:
+        return bool(self._pendente)
+
+
+_armazem: Optional[ArmazemRascunhos] = None
+
+
+def obter_armazem() -> ArmazemRascunhos:
+    """Instância única do processo, no caminho de ``TR_RASCUNHOS_DB``."""
+    global _armazem
+    if _armazem is None:
+        _armazem = ArmazemRascunhos()
+    return _armazem
+
+
+_COOKIE_VISITANTE = "tr_visitante"
+_regex_visitante = re.compile(r"^[0-9a-f]{32}$")
+
+
+def _visitante() -> str:
+    """Id aleatório do navegador, guardado num cookie de um ano.
+
+    O Streamlit só lê cookies (``st.context.cookies``); a gravação é feita por um script
+    num componente HTML invisível, que roda na mesma origem da página. Até o cookie
+    existir (ou se o navegador o recusar), vale o id guardado na sessão."""
+    import streamlit as st
+
+    if "_tr_visitante" not in st.session_state:
+        token = st.context.cookies.get(_COOKIE_VISITANTE)
+        if not isinstance(token, str) or not _regex_visitante.match(token):
+            token = uuid.uuid4().hex
+            script = (
+                f"<script>window.parent.document.cookie = "
+                f"'{_COOKIE_VISITANTE}={token}; max-age=31536000; path=/; SameSite=Lax';</script>"
+            )
+            if hasattr(st, "iframe"):
+                st.iframe(script, height="content")
+            else:  # Streamlit anterior ao `st.iframe`
+                import streamlit.components.v1 as components
+                components.html(script, height=0)
+        st.session_state["_tr_visitante"] = token
+    return st.session_state["_tr_visitante"]
+
+
+def usuario_streamlit() -> str:
+    """E-mail do usuário autenticado no Streamlit; sem autenticação, "anonimo:<id do
+    navegador>" (ver `_visitante`). Fora do Streamlit, "anonimo"."""
+    try:
+        import streamlit as st
+        email = st.user.get("email")
+    except Exception:
+        return "anonimo"
+    return email or f"anonimo:{_visitante()}"
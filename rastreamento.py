@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+Módulo: rastreamento.py
+
+Rastreamento leve por etapa da geração (leitura, combinação, placeholders, DOCX).
+
+- ``with span("combinar_secoes", modo=modo) as sp: ...`` mede o tempo de relógio e o de
+  CPU da thread e aceita atributos, como o tamanho da saída (``sp.atributos["bytes"] = n``).
+  O decorador `rastreado` faz o mesmo em volta de uma função.
+- Cada span encerrado vira uma linha JSON no logger ``tr.rastreamento``.
+- Dentro de ``with coletar() as spans:`` os spans (inclusive os dos workers do pool, que
+  `tarefas.executar` traz de volta) também são acumulados na lista, para o painel de
+  depuração das páginas.
+
+Configuração: ``TR_RASTREIO_LOG`` = ``stderr`` ou caminho de arquivo liga as linhas JSON;
+ausente, vazio ou ``0`` (padrão) as desliga, para não inundar o log do servidor com um
+span por etapa. O painel aparece com ``TR_DEBUG=1`` ou ``?debug=1`` na URL, com ou sem log.
+"""
+from __future__ import annotations
+import contextvars
+import functools
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional
+
+import perfil_memoria
+
+logger = logging.getLogger("tr.rastreamento")
+
+
+def _configurar_log() -> None:
+    destino = os.environ.get("TR_RASTREIO_LOG", "").strip()
+    if not destino or destino == "0" or logger.handlers:
+        return
+    handler = logging.StreamHandler(sys.stderr) if destino == "stderr" else logging.FileHandler(destino, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+_configurar_log()
+
+_span_atual: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("tr_span_atual", default=None)
+_coletor: contextvars.ContextVar[Optional[List[dict]]] = contextvars.ContextVar("tr_coletor", default=None)
+
+
+@dataclass
+class Span:
+    nome: str
+    trace: str
+    id: str
+    pai: Optional[str]
+    atributos: Dict[str, object] = field(default_factory=dict)
+    inicio: float = 0.0  # epoch
+    wall_ms: float = 0.0
+    cpu_ms: float = 0.0
+
+    def registro(self) -> dict:
+        return {
+            "evento": "span",
+            "nome": self.nome,
+            "trace": self.trace,
+            "span": self.id,
+            "pai": self.pai,
+            "inicio": round(self.inicio, 6),
+            "wall_ms": round(self.wall_ms, 3),
+            "cpu_ms": round(self.cpu_ms, 3),
+            "pid": os.getpid(),
+            **self.atributos,
+        }
+
+
+@contextmanager
+def span(nome: str, **atributos) -> Iterator[Span]:
+    pai = _span_atual.get()
+    atual = Span(
+        nome=nome,
+        trace=pai.trace if pai else uuid.uuid4().hex[:16],
+        id=uuid.uuid4().hex[:8],
+        pai=pai.id if pai else None,
+        atributos=dict(atributos),
+    )
+    token = _span_atual.set(atual)
+    atual.inicio = time.time()
+    # Com TR_PERFIL_MEMORIA, a etapa também ganha snapshots do tracemalloc antes e depois
+    # (o custo deles fica fora da medição da própria etapa, mas não da etapa-mãe).
+    memoria: dict = {}
+    try:
+        with perfil_memoria.medir_etapa(nome) as memoria:
+            wall0, cpu0 = time.perf_counter(), time.thread_time()
+            try:
+                yield atual
+            except BaseException as e:
+                atual.atributos["erro"] = type(e).__name__
+                raise
+            finally:
+                atual.wall_ms = (time.perf_counter() - wall0) * 1000
+                atual.cpu_ms = (time.thread_time() - cpu0) * 1000
+                _span_atual.reset(token)
+    finally:
+        atual.atributos.update(memoria)
+        _emitir(atual.registro())
+
+
+def _emitir(registro: dict) -> None:
+    coletados = _coletor.get()
+    if coletados is not None:
+        coletados.append(registro)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps(registro, ensure_ascii=False, default=str))
+
+
+def rastreado(nome: Optional[str] = None, medir: Optional[Callable[..., Dict[str, object]]] = None):
+    """Decorador: executa a função dentro de um span. `medir(resultado, *args, **kwargs)`
+    devolve atributos extras (ex.: tamanho da saída)."""
+    def decorar(fn):
+        @functools.wraps(fn)
+        def envolvida(*args, **kwargs):
+            with span(nome or fn.__name__) as sp:
+                resultado = fn(*args, **kwargs)
+                if medir is not None:
+                    sp.atributos.update(medir(resultado, *args, **kwargs))
+                return resultado
+        return envolvida
+    return decorar
+
+
+@contextmanager
+def coletar() -> Iterator[List[dict]]:
+    """Acumula na lista devolvida os registros dos spans encerrados neste contexto."""
+    coletados: List[dict] = []
+    token = _coletor.set(coletados)
+    try:
+        yield coletados
+    finally:
+        _coletor.reset(token)
+
+
+def coletando() -> bool:
+    return _coletor.get() is not None
+
+
+def incorporar(registros: List[dict]) -> None:
+    """Junta ao coletor atual spans vindos de outro processo (já emitidos no log de lá)."""
+    coletados = _coletor.get()
+    if coletados is not None:
+        coletados.extend(registros)
+
+
+def contexto_atual() -> Optional[tuple]:
+    """(trace, span) em andamento, para continuar o rastro em outro processo."""
+    atual = _span_atual.get()
+    return (atual.trace, atual.id) if atual else None
+
+
+@contextmanager
+def continuar(contexto: Optional[tuple]) -> Iterator[None]:
+    """Faz os spans abertos aqui serem filhos do span `contexto` de outro processo."""
+    if contexto is None:
+        yield
+        return
+    token = _span_atual.set(Span(nome="remoto", trace=contexto[0], id=contexto[1], pai=None))
+    try:
+        yield
+    finally:
+        _span_atual.reset(token)
+
+
+def depuracao_ativa() -> bool:
+    """Painel de depuração ligado por ``TR_DEBUG=1`` ou ``?debug=1`` na URL."""
+    if os.environ.get("TR_DEBUG", "") not in ("", "0"):
+        return True
+    try:
+        import streamlit as st
+        return st.query_params.get("debug", "") not in ("", "0")
+    except Exception:
+        return False
+
+
+def administrador() -> bool:
+    """Acesso aos painéis de administração (perfil de CPU de outras sessões, perfil de
+    memória), decidido no servidor: ``TR_PERFIL_ADMIN`` lista os e-mails autorizados,
+    separados por vírgula, conferidos com o usuário logado (``st.user``); ``*`` libera a
+    todos, só para uma réplica de diagnóstico. ``?debug=1`` sozinho não dá acesso."""
+    permitidos = {e.strip().lower() for e in os.environ.get("TR_PERFIL_ADMIN", "").split(",") if e.strip()}
+    if not permitidos:
+        return False
+    if "*" in permitidos:
+        return True
+    try:
+        import streamlit as st
+        email = st.user.get("email")
+    except Exception:
+        return False
+    return isinstance(email, str) and email.lower() in permitidos
+
+
+def tabela(registros: List[dict]) -> List[dict]:
+    """Linhas para exibição: etapa (indentada pela profundidade), tempos e atributos."""
+    profundidade: Dict[str, int] = {}
+    linhas = []
+    for r in sorted(registros, key=lambda r: r["inicio"]):
+        nivel = profundidade.get(r["pai"], -1) + 1 if r["pai"] else 0
+        profundidade[r["span"]] = nivel
+        extras = {k: v for k, v in r.items() if k not in (
+            "evento", "nome", "trace", "span", "pai", "inicio", "wall_ms", "cpu_ms", "pid")}
+        linhas.append({
+            "etapa": "  " * nivel + r["nome"],
+            "wall_ms": r["wall_ms"],
+            "cpu_ms": r["cpu_ms"],
+            "pid": r["pid"],
+            "detalhes": ", ".join(f"{k}={v}" for k, v in extras.items()),
+        })
+    return linhas
+
+
+def painel_depuracao(registros: List[dict], titulo: str = "🐞 Depuração: tempo por etapa") -> None:
+    """Expander do Streamlit com a `tabela` dos spans, se a depuração estiver ativa."""
+    if not registros or not depuracao_ativa():
+        return
+    import streamlit as st
+    with st.expander(titulo):
+        st.dataframe(tabela(registros), use_container_width=True, hide_index=True)
+        raizes = [r for r in registros if r["pai"] is None]
+        st.caption(
+            f"Total: {sum(r['wall_ms'] for r in raizes):.1f} ms de relógio, "
+            f"{sum(r['cpu_ms'] for r in registros if r['pid'] == os.getpid() and r['pai'] is None):.1f} ms de CPU "
+            f"neste processo; spans dos workers do pool aparecem com o pid deles."
+        )
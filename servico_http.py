@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+"""
+Serviço: servico_http.py
+
+Serviço HTTP sem interface (somente biblioteca padrão) para gerar Termos de Referência a
+partir de outros sistemas (ex.: o ERP municipal), sem passar pelo Streamlit.
+
+Rotas
+-----
+- ``GET  /saude``    -> estado do serviço (workers, fila ocupada, limites).
+- ``GET  /metrics``  -> métricas no formato do Prometheus (`metricas.py`).
+- ``POST /parse``    -> corpo = DOCX do modelo; ``?variante=numeracao|headings``.
+                        Responde JSON com as seções lidas.
+- ``POST /merge``    -> corpo = DOCX do modelo (ou vazio); ``?modo=complementar|modelo|template``.
+                        Responde JSON com as seções combinadas com o template interno.
+- ``POST /generate`` -> corpo = DOCX do modelo (ou vazio), ou JSON ``{"secoes": [...]}`` já
+                        combinado; ``?modo=...&cabecalho=1&rodape=1``. Responde o DOCX final.
+
+Todo POST precisa de ``Content-Length`` (411 sem ele; 400 se não for um inteiro >= 0; 413
+acima do limite do corpo).
+
+O trabalho pesado (python-docx) roda num pool de processos criado e aquecido na subida:
+cada worker já tem o template interno e as imagens de cabeçalho/rodapé carregados. As
+requisições passam por uma fila limitada (``--fila``): quando cheia, a resposta é 503
+imediatamente; quando um job excede ``--timeout`` segundos, a resposta é 504 (o job
+continua ocupando a sua vaga até terminar no worker). Se um worker morrer, o pool é
+recriado e a requisição afetada recebe 503.
+
+Execução:
+    python servico_http.py --porta 8600 --workers 4 --fila 16 --timeout 60
+"""
+from __future__ import annotations
+import argparse
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeout
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from typing import List, Optional
+from urllib.parse import parse_qs, urlparse
+
+import metricas
+from importacao_e_combinacao_tr import (
+    LOGO_PATH,
+    RODAPE_PATH,
+    combinar_secoes,
+    gerar_docx,
+    imagem_preparada,
+    ler_modelo_em_cache,
+    secao_de_dict,
+    secao_para_dict,
+    template_interno_padrao,
+)
+
+MIME_DOCX = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+MODOS = ("complementar", "modelo", "template")
+TAMANHO_MAX_CORPO = 20 * 1024 * 1024  # 20 MB
+
+# ==========================
+# Lado do worker
+# ==========================
+
+_template: list = []
+_header_img: Optional[str] = None
+_footer_img: Optional[str] = None
+
+
+def _aquecer(header_img: Optional[str], footer_img: Optional[str]) -> None:
+    """Carrega template e imagens no processo atual (inicializador dos workers)."""
+    global _template, _header_img, _footer_img
+    _template = template_interno_padrao()
+    _header_img, _footer_img = header_img, footer_img
+    imagem_preparada(header_img, 6.0)
+    imagem_preparada(footer_img, 6.0)
+
+
+def _pronto(_indice: int) -> int:
+    return os.getpid()
+
+
+def _secoes_do_modelo(dados: bytes) -> list:
+    return ler_modelo_em_cache(dados) if dados else []
+
+
+def tarefa_parse(dados: bytes, variante: str) -> list:
+    secoes = ler_modelo_em_cache(dados, variante)
+    if variante == "headings":
+        return [{"titulo": h, "texto": t} for h, t in secoes]
+    return [secao_para_dict(s) for s in secoes]
+
+
+def tarefa_merge(dados: bytes, modo: str) -> list:
+    secoes = combinar_secoes(_secoes_do_modelo(dados), _template, modo=modo)
+    return [secao_para_dict(s) for s in secoes]
+
+
+def tarefa_generate(dados: bytes, secoes_json: Optional[list], modo: str, cabecalho: bool, rodape: bool) -> bytes:
+    if secoes_json is not None:
+        secoes = [secao_de_dict(s) for s in secoes_json]
+    else:
+        secoes = combinar_secoes(_secoes_do_modelo(dados), _template, modo=modo)
+    buffer = BytesIO()
+    gerar_docx(
+        secoes,
+        buffer,
+        header_img=_header_img if cabecalho else None,
+        footer_img=_footer_img if rodape else None,
+    )
+    return buffer.getvalue()
+
+# ==========================
+# Pool com fila limitada
+# ==========================
+
+class FilaCheia(Exception):
+    """Não há vaga na fila de jobs; o cliente deve tentar novamente mais tarde."""
+
+
+class PoolGeracao:
+    """Pool de processos pré-criados com admissão limitada e timeout por job."""
+
+    def __init__(self, workers: int, fila: int, timeout: float,
+                 header_img: Optional[str] = LOGO_PATH, footer_img: Optional[str] = RODAPE_PATH):
+        self.workers = workers
+        self.fila = fila
+        self.timeout = timeout
+        self._imagens = (header_img, footer_img)
+        # Carrega no pai também: com "fork" os workers herdam os caches já preenchidos.
+        _aquecer(header_img, footer_img)
+        self._vagas = threading.BoundedSemaphore(workers + fila)
+        self._lock = threading.Lock()
+        self._ocupadas = 0
+        self._executor = self._criar_executor()
+
+    def _criar_executor(self) -> ProcessPoolExecutor:
+        metodos = multiprocessing.get_all_start_methods()
+        contexto = multiprocessing.get_context("fork" if "fork" in metodos else None)
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=contexto,
+            initializer=_aquecer,
+            initargs=self._imagens,
+        )
+        # Sobe todos os workers agora, e não na primeira requisição.
+        list(executor.map(_pronto, range(self.workers)))
+        return executor
+
+    def _recriar(self, quebrado: ProcessPoolExecutor) -> None:
+        """Troca o executor depois que um worker morreu (só uma vez por quebra)."""
+        with self._lock:
+            if self._executor is not quebrado:
+                return
+            quebrado.shutdown(wait=False, cancel_futures=True)
+            self._executor = self._criar_executor()
+
+    @property
+    def ocupadas(self) -> int:
+        return self._ocupadas
+
+    def _liberar(self, _futuro=None) -> None:
+        with self._lock:
+            self._ocupadas -= 1
+        self._vagas.release()
+
+    def executar(self, fn, *args):
+        """Executa `fn(*args)` num worker. Levanta FilaCheia se não houver vaga,
+        concurrent.futures.TimeoutError se o job exceder o timeout e BrokenProcessPool
+        se o worker morrer (o pool é recriado para as próximas requisições).
+
+        A vaga só é devolvida quando o job termina de fato: um job que estourou o timeout
+        continua rodando no worker e segue contando no limite da fila."""
+        if not self._vagas.acquire(blocking=False):
+            raise FilaCheia()
+        with self._lock:
+            self._ocupadas += 1
+        executor = self._executor
+        try:
+            futuro = executor.submit(fn, *args)
+        except BaseException as e:
+            self._liberar()
+            if isinstance(e, BrokenProcessPool):
+                self._recriar(executor)
+            raise
+        futuro.add_done_callback(self._liberar)
+        try:
+            return futuro.result(timeout=self.timeout)
+        except FuturesTimeout:
+            # Só cancela se ainda estiver na fila; um job já em execução termina no worker.
+            futuro.cancel()
+            raise
+        except BrokenProcessPool:
+            self._recriar(executor)
+            raise
+
+    def encerrar(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+# ==========================
+# HTTP
+# ==========================
+
+class ServicoHandler(BaseHTTPRequestHandler):
+    pool: PoolGeracao  # atribuído em `criar_servidor`
+
+    def _responder(self, status: int, corpo: bytes, tipo: str, extras: Optional[dict] = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(corpo)))
+        for chave, valor in (extras or {}).items():
+            self.send_header(chave, valor)
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def _json(self, status: int, dados, extras: Optional[dict] = None) -> None:
+        corpo = json.dumps(dados, ensure_ascii=False).encode("utf-8")
+        self._responder(status, corpo, "application/json; charset=utf-8", extras)
+
+    def _erro(self, status: int, mensagem: str, extras: Optional[dict] = None) -> None:
+        self._json(status, {"erro": mensagem}, extras)
+
+    def _ler_corpo(self) -> Optional[bytes]:
+        """Corpo da requisição, ou None se já foi respondido um erro (411, 400 ou 413)."""
+        cabecalho = self.headers.get("Content-Length")
+        if cabecalho is None:
+            self._erro(411, "Informe o Content-Length (0 para corpo vazio).")
+            return None
+        try:
+            tamanho = int(cabecalho)
+        except ValueError:
+            tamanho = -1
+        if tamanho < 0:
+            self._erro(400, f"Content-Length inválido: {cabecalho!r}.")
+            return None
+        if tamanho > TAMANHO_MAX_CORPO:
+            self._erro(413, f"Corpo maior que {TAMANHO_MAX_CORPO} bytes.")
+            return None
+        return self.rfile.read(tamanho) if tamanho else b""
+
+    def do_GET(self):
+        rota = urlparse(self.path).path
+        if rota == "/metrics":
+            self._responder(200, metricas.exposicao().encode("utf-8"), metricas.TIPO_CONTEUDO)
+            return
+        if rota != "/saude":
+            self._erro(404, "Rota não encontrada.")
+            return
+        self._json(200, {
+            "workers": self.pool.workers,
+            "fila": self.pool.fila,
+            "ocupadas": self.pool.ocupadas,
+            "timeout": self.pool.timeout,
+        })
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        corpo = self._ler_corpo()
+        if corpo is None:
+            return
+
+        modo = params.get("modo", "complementar")
+        if modo not in MODOS:
+            self._erro(400, f"modo inválido: {modo!r} (use {', '.join(MODOS)}).")
+            return
+
+        try:
+            if url.path == "/parse":
+                variante = params.get("variante", "numeracao")
+                if variante not in ("numeracao", "headings"):
+                    self._erro(400, f"variante inválida: {variante!r}.")
+                    return
+                if not corpo:
+                    self._erro(400, "Envie o DOCX do modelo no corpo da requisição.")
+                    return
+                inicio = time.perf_counter()
+                secoes = self.pool.executar(tarefa_parse, corpo, variante)
+                metricas.observar_leitura(variante, time.perf_counter() - inicio)
+                self._json(200, {"secoes": secoes})
+            elif url.path == "/merge":
+                self._json(200, {"secoes": self.pool.executar(tarefa_merge, corpo, modo)})
+            elif url.path == "/generate":
+                secoes_json = None
+                if (self.headers.get("Content-Type") or "").startswith("application/json"):
+                    pedido = json.loads(corpo.decode("utf-8"))
+                    secoes = pedido.get("secoes", []) if isinstance(pedido, dict) else None
+                    if not isinstance(secoes, list) or not all(isinstance(x, dict) for x in secoes):
+                        self._erro(400, 'O JSON deve ser um objeto {"secoes": [...]}.')
+                        return
+                    secoes_json = secoes
+                    corpo = b""
+                fonte = "secoes" if secoes_json is not None else ("importado" if corpo else "interno")
+                with metricas.medir_geracao("servico_http", fonte, modo) as medida:
+                    docx = self.pool.executar(
+                        tarefa_generate, corpo, secoes_json, modo,
+                        params.get("cabecalho", "1") != "0",
+                        params.get("rodape", "1") != "0",
+                    )
+                    medida["bytes"] = len(docx)
+                self._responder(200, docx, MIME_DOCX, {
+                    "Content-Disposition": 'attachment; filename="TR_final.docx"',
+                })
+            else:
+                self._erro(404, "Rota não encontrada.")
+        except FilaCheia:
+            self._erro(503, "Fila de geração cheia; tente novamente.", {"Retry-After": "5"})
+        except FuturesTimeout:
+            self._erro(504, f"Tempo limite de {self.pool.timeout:g}s excedido.")
+        except BrokenProcessPool:
+            self._erro(503, "Um worker foi encerrado; o pool foi reiniciado, tente novamente.", {"Retry-After": "1"})
+        except (ValueError, KeyError) as e:
+            self._erro(400, f"Requisição inválida: {e}")
+        except Exception as e:
+            self._erro(500, f"Falha ao processar: {e}")
+
+
+def criar_servidor(host: str, porta: int, pool: PoolGeracao) -> ThreadingHTTPServer:
+    handler = type("Handler", (ServicoHandler,), {"pool": pool})
+    metricas.registrar_coletor(lambda: [
+        ("tr_servico_jobs_ocupados", "gauge", "Jobs em execução ou aguardando no pool do serviço.", [({}, pool.ocupadas)]),
+    ])
+    servidor = ThreadingHTTPServer((host, porta), handler)
+    servidor.daemon_threads = True
+    return servidor
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Serviço HTTP de geração de TR (DOCX).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8600)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--fila", type=int, default=16, help="Jobs aguardando além dos que estão em execução.")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Segundos por job.")
+    parser.add_argument("--cabecalho", default=LOGO_PATH, help="Imagem do cabeçalho.")
+    parser.add_argument("--rodape", default=RODAPE_PATH, help="Imagem do rodapé.")
+    args = parser.parse_args(argv)
+
+    pool = PoolGeracao(args.workers, args.fila, args.timeout, args.cabecalho, args.rodape)
+    servidor = criar_servidor(args.host, args.porta, pool)
+    print(f"Servindo em http://{args.host}:{args.porta} com {args.workers} worker(s).")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        pool.encerrar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+"""
+Módulo: tarefas.py
+
+Executa a leitura de modelos e a geração de DOCX num **pool de processos** compartilhado
+pelo servidor Streamlit, fora da thread do script. Assim o python-docx (que segura o GIL
+enquanto monta e salva o documento) não trava os reruns das outras sessões.
+
+API de jobs:
+- ``submeter(fn, *args)``  -> id do job;
+- ``consultar(job_id)``    -> "pendente" | "executando" | "concluido" | "erro" | "desconhecido";
+- ``resultado(job_id)``    -> valor retornado pelo job (levanta a exceção do job, se houve).
+
+As funções ``tarefa_*`` abaixo são as que rodam nos workers; recebem e devolvem apenas
+objetos serializáveis (bytes, str, dicts), nunca objetos python-docx.
+
+No app, o padrão é submeter o job e aguardar ``resultado`` dentro de ``st.spinner``:
+enquanto espera, a thread do script fica bloqueada sem segurar o GIL.
+
+Se um worker morrer, quem esperava por ele recebe BrokenProcessPool e o pool é descartado;
+o próximo job sobe um pool novo, em vez de todas as gerações falharem até reiniciar o
+servidor.
+
+Configuração: ``TR_WORKERS`` (padrão: número de CPUs).
+"""
+from __future__ import annotations
+import copy
+import cProfile
+import hashlib
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple
+
+from admissao import admitir, obter_controle
+from arvore_secoes import renumerar_secoes
+from importacao_e_combinacao_tr import (
+    FonteSecoes,
+    combinar_fontes,
+    gerar_docx,
+    gerar_docx_blocos,
+    gerar_docx_texto,
+    ler_modelo_em_cache,
+    secao_de_dict,
+    secao_para_dict,
+    template_interno_padrao,
+)
+from plano_tr import plano_em_cache
+import metricas
+import perfil_cpu
+import rastreamento
+
+MAX_JOBS_GUARDADOS = 256
+
+# ==========================
+# Tarefas executadas nos workers
+# ==========================
+
+def tarefa_ler_modelo(dados: bytes, variante: str = "numeracao") -> list:
+    """Lê o modelo; seções numeradas voltam na forma serializável (`secao_para_dict`)."""
+    secoes = ler_modelo_em_cache(dados, variante)
+    if variante == "headings":
+        return list(secoes)
+    return [secao_para_dict(s) for s in secoes]
+
+
+def tarefa_gerar_docx(
+    secoes: List[dict],
+    header_img: Optional[str] = None,
+    footer_img: Optional[str] = None,
+) -> bytes:
+    buffer = BytesIO()
+    gerar_docx([secao_de_dict(s) for s in secoes], buffer, header_img=header_img, footer_img=footer_img)
+    return buffer.getvalue()
+
+
+def tarefa_combinar_e_gerar(
+    dados_modelo: Optional[bytes],
+    modo: str,
+    header_img: Optional[str] = None,
+    footer_img: Optional[str] = None,
+    renumerar: bool = False,
+) -> bytes:
+    """Leitura + combinação com o template interno + geração, num único job. O plano
+    compilado (`plano_tr.plano_em_cache`) fica no cache do worker."""
+    secoes = plano_em_cache(dados_modelo, modo, renumerar).renderizar()
+    buffer = BytesIO()
+    gerar_docx(secoes, buffer, header_img=header_img, footer_img=footer_img)
+    return buffer.getvalue()
+
+
+def tarefa_combinar_fontes_e_gerar(
+    fontes: List[Tuple[str, Optional[bytes], int]],
+    substituicoes: Optional[Dict[str, str]] = None,
+    header_img: Optional[str] = None,
+    footer_img: Optional[str] = None,
+    renumerar: bool = False,
+) -> bytes:
+    """Combina várias fontes (nome, DOCX ou None = template interno, prioridade) com
+    `combinar_fontes` e gera o DOCX final."""
+    secoes = combinar_fontes(
+        [
+            FonteSecoes(nome, ler_modelo_em_cache(dados) if dados else template_interno_padrao(), prioridade)
+            for nome, dados, prioridade in fontes
+        ],
+        substituicoes,
+    )
+    if renumerar:
+        secoes = renumerar_secoes(secoes)
+    buffer = BytesIO()
+    gerar_docx(secoes, buffer, header_img=header_img, footer_img=footer_img)
+    return buffer.getvalue()
+
+
+def tarefa_gerar_docx_blocos(blocos: List[Tuple[str, str]], ctx: Dict[str, str], itens=None) -> bytes:
+    return gerar_docx_blocos(blocos, ctx, itens=itens).getvalue()
+
+
+def tarefa_gerar_docx_texto(texto: str, logo: Optional[bytes] = None) -> bytes:
+    return gerar_docx_texto(texto, logo=BytesIO(logo) if logo else None).getvalue()
+
+# ==========================
+# Pool e registro de jobs (um por processo do servidor)
+# ==========================
+
+_lock = threading.Lock()
+_executor: Optional[ProcessPoolExecutor] = None
+_jobs: "OrderedDict[str, Tuple[Future, ProcessPoolExecutor]]" = OrderedDict()  # id -> (futuro, pool)
+
+
+def _contexto_mp():
+    # "fork" dentro do servidor Streamlit (multithread) pode travar; o forkserver
+    # cria os workers a partir de um processo limpo, já com o motor importado.
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        contexto = multiprocessing.get_context("forkserver")
+        contexto.set_forkserver_preload(["importacao_e_combinacao_tr"])
+        return contexto
+    return multiprocessing.get_context("spawn")
+
+
+def _pronto(_indice: int) -> int:
+    return os.getpid()
+
+
+@contextmanager
+def _modulo_como_main():
+    # O Streamlit instala o script da página como `sys.modules["__main__"]`; os workers
+    # o reimportariam (e executariam a interface) ao subir. Enquanto os processos são
+    # criados, `__main__` aponta para este módulo, que não tem efeitos colaterais.
+    anterior = sys.modules.get("__main__")
+    sys.modules["__main__"] = sys.modules[__name__]
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = anterior
+
+
+def obter_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            workers = int(os.environ.get("TR_WORKERS", os.cpu_count() or 2))
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=_contexto_mp())
+            # Sobe todos os workers agora; depois disso o pool não cria novos processos.
+            with _modulo_como_main():
+                futuros = [executor.submit(_pronto, i) for i in range(workers)]
+            for futuro in futuros:
+                futuro.result()
+            _executor = executor
+        return _executor
+
+
+def descartar_executor(quebrado: ProcessPoolExecutor) -> None:
+    """Tira de uso um pool em que um worker morreu (OOM, segfault no lxml/Pillow); o
+    próximo `obter_executor` sobe outro. Se o pool já foi trocado, não faz nada."""
+    global _executor
+    with _lock:
+        if _executor is not quebrado:
+            return
+        _executor = None
+    quebrado.shutdown(wait=False, cancel_futures=True)
+
+
+def submeter(fn, *args) -> str:
+    """Envia `fn(*args)` ao pool e retorna o id do job.
+
+    Se o pool estiver quebrado, ele é descartado e o envio é refeito uma vez num pool novo
+    (o job ainda não tinha começado)."""
+    for tentativa in range(2):
+        executor = obter_executor()
+        try:
+            futuro = executor.submit(fn, *args)
+            break
+        except BrokenProcessPool:
+            descartar_executor(executor)
+            if tentativa:
+                raise
+    job_id = uuid.uuid4().hex
+    with _lock:
+        _jobs[job_id] = (futuro, executor)
+        # Descarta os jobs concluídos mais antigos que nunca foram coletados.
+        while len(_jobs) > MAX_JOBS_GUARDADOS:
+            antigo, (fut, _) = next(iter(_jobs.items()))
+            if not fut.done():
+                break
+            del _jobs[antigo]
+    return job_id
+
+
+def consultar(job_id: str) -> str:
+    with _lock:
+        futuro, _ = _jobs.get(job_id, (None, None))
+    if futuro is None:
+        return "desconhecido"
+    if futuro.running():
+        return "executando"
+    if not futuro.done():
+        return "pendente"
+    return "erro" if futuro.exception() is not None else "concluido"
+
+
+def resultado(job_id: str, timeout: Optional[float] = None):
+    """Aguarda e devolve o resultado do job, removendo-o do registro.
+
+    Levanta KeyError para ids desconhecidos, TimeoutError se `timeout` expirar (o job
+    continua registrado) e a própria exceção do job se ele falhou. BrokenProcessPool
+    (worker morto) também descarta o pool, que é recriado na próxima submissão.
+    """
+    with _lock:
+        futuro, executor = _jobs.get(job_id, (None, None))
+    if futuro is None:
+        raise KeyError(job_id)
+    try:
+        valor = futuro.result(timeout=timeout)
+    except BrokenProcessPool:
+        descartar_executor(executor)
+        with _lock:
+            _jobs.pop(job_id, None)
+        raise
+    with _lock:
+        _jobs.pop(job_id, None)
+    return valor
+
+
+def _executar_rastreado(contexto: Optional[tuple], fn, *args):
+    # No worker: os spans continuam o rastro de quem submeteu e voltam junto com o valor.
+    with rastreamento.continuar(contexto), rastreamento.coletar() as spans:
+        valor = fn(*args)
+    return valor, spans
+
+
+def _executar_perfilado(fn, *args):
+    # No worker: perfil do job, devolvido junto com o valor para a captura da sessão.
+    perfil = cProfile.Profile()
+    valor = perfil.runcall(fn, *args)
+    return valor, perfil_cpu.estatisticas(perfil)
+
+
+def executar(fn, *args, timeout: Optional[float] = None):
+    """Atalho: submete e aguarda o resultado. Dentro de `rastreamento.coletar()`, os
+    spans do worker são trazidos para o coletor de quem chamou; num rerun perfilado
+    (`perfil_cpu`), o perfil do job é somado à captura."""
+    if fn is not _executar_perfilado and perfil_cpu.capturando():
+        valor, estatisticas = executar(_executar_perfilado, fn, *args, timeout=timeout)
+        perfil_cpu.incorporar(estatisticas)
+        return valor
+    if not rastreamento.coletando():
+        return resultado(submeter(fn, *args), timeout=timeout)
+    with rastreamento.span("pool", tarefa=args[0].__name__ if fn is _executar_perfilado else fn.__name__):
+        valor, spans = resultado(submeter(_executar_rastreado, rastreamento.contexto_atual(), fn, *args), timeout=timeout)
+    rastreamento.incorporar(spans)
+    return valor
+
+
+def executar_admitido(sessao: str, fn, *args, ao_aguardar=None, timeout: Optional[float] = None):
+    """Como `executar`, mas só submete depois de passar pelo controle de admissão
+    (`admissao.py`). Levanta `admissao.FilaCheia` se o pedido for recusado."""
+    # O tempo na fila é a diferença entre este span e o do pool.
+    with rastreamento.span("admitido", tarefa=fn.__name__), admitir(sessao, timeout=timeout, ao_aguardar=ao_aguardar):
+        return executar(fn, *args)
+
+# ==========================
+# Leitura de modelos com cache no processo do servidor
+# ==========================
+
+_MAX_MODELOS = 32
+# Chave: (hash do conteúdo, variante). Valor: o que o worker devolveu (dicts/tuplas), para
+# não prender o DOCX enviado nem `Secao`s que os chamadores possam alterar.
+_modelos_lidos: "OrderedDict[Tuple[bytes, str], list]" = OrderedDict()
+
+
+def _secoes_do_pool(lidas: list, variante: str) -> list:
+    if variante == "headings":
+        return list(lidas)
+    return [secao_de_dict(copy.deepcopy(s)) for s in lidas]
+
+
+def ler_modelo_no_pool(arquivo, variante: str = "numeracao") -> list:
+    """Como `ler_modelo_em_cache`, mas a leitura roda num worker do pool.
+
+    `arquivo` pode ser bytes ou um objeto com `getvalue()` (ex.: `UploadedFile`).
+    Seções numeradas voltam como `Secao` com tabelas já convertidas em listas de linhas.
+    """
+    dados = bytes(arquivo) if isinstance(arquivo, (bytes, bytearray)) else arquivo.getvalue()
+    chave = (hashlib.blake2b(dados, digest_size=16).digest(), variante)
+    with _lock:
+        acerto = chave in _modelos_lidos
+        if acerto:
+            _modelos_lidos.move_to_end(chave)
+            lidas = _modelos_lidos[chave]
+    metricas.contar_cache("modelos_lidos_pool", acerto)
+    if acerto:
+        return _secoes_do_pool(lidas, variante)
+    inicio = time.perf_counter()
+    lidas = executar(tarefa_ler_modelo, dados, variante)
+    metricas.observar_leitura(variante, time.perf_counter() - inicio)
+    with _lock:
+        _modelos_lidos[chave] = lidas
+        while len(_modelos_lidos) > _MAX_MODELOS:
+            _modelos_lidos.popitem(last=False)
+    return _secoes_do_pool(lidas, variante)
+
+# ==========================
+# Métricas das filas (lidas a cada coleta)
+# ==========================
+
+def _metricas_filas():
+    controle = obter_controle()
+    with _lock:
+        pendentes = sum(1 for futuro, _ in _jobs.values() if not futuro.done())
+    return [
+        ("tr_admissao_geracoes", "gauge", "Gerações em execução e aguardando no controle de admissão.",
+         [({"estado": "executando"}, controle.ativos), ({"estado": "na_fila"}, controle.na_fila)]),
+        ("tr_pool_jobs_pendentes", "gauge", "Jobs submetidos ao pool ainda não concluídos.", [({}, pendentes)]),
+    ]
+
+
+metricas.registrar_coletor(_metricas_filas)
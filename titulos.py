@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Módulo: titulos.py
+
+Correspondência aproximada de títulos de seção, para combinar modelos que usam outra
+numeração (ex.: "7. CRITÉRIOS DE MEDIÇÃO" no modelo, "6. CRITÉRIOS DE MEDIÇÃO" no
+template).
+
+- `normalizar_titulo` tira o número, acentos, caixa, pontuação e palavras vazias
+  ("de", "da", "e", ...) e reduz plurais simples: "4.1 – Dos Requisitos" -> ("requisito",).
+- `IndiceTitulos` guarda os títulos num índice invertido token -> ids; uma consulta só
+  compara com os títulos que têm algum token em comum, então o custo acompanha o número
+  de candidatos e não o tamanho da biblioteca.
+- A similaridade é o coeficiente de Dice entre os conjuntos de tokens (0 a 1).
+"""
+from __future__ import annotations
+import re
+import unicodedata
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+
+from arvore_secoes import caminho_numerico
+
+LIMIAR_PADRAO = 0.6
+
+PALAVRAS_VAZIAS = frozenset(
+    "a o as os da das de do dos e em na nas no nos ou para pela pelas pelo pelos por "
+    "com sem um uma sobre ao aos que se sua seu suas seus".split()
+)
+
+_regex_numero_inicial = re.compile(r"^\s*\d+(?:\.\d+)*\.?\s*[-–—)]?\s*")
+_regex_token = re.compile(r"[a-z0-9]+")
+
+
+def normalizar_titulo(titulo: str) -> Tuple[str, ...]:
+    sem_numero = _regex_numero_inicial.sub("", titulo or "")
+    decomposto = unicodedata.normalize("NFKD", sem_numero.lower())
+    sem_acentos = "".join(c for c in decomposto if not unicodedata.combining(c))
+    tokens = []
+    for token in _regex_token.findall(sem_acentos):
+        if token in PALAVRAS_VAZIAS:
+            continue
+        if len(token) > 3 and token.endswith("s"):
+            token = token[:-1]
+        tokens.append(token)
+    return tuple(tokens)
+
+
+def similaridade(a: Tuple[str, ...], b: Tuple[str, ...]) -> float:
+    conj_a, conj_b = set(a), set(b)
+    if not conj_a or not conj_b:
+        return 0.0
+    return 2 * len(conj_a & conj_b) / (len(conj_a) + len(conj_b))
+
+
+class IndiceTitulos:
+    def __init__(self):
+        self._tokens: Dict[Hashable, Set[str]] = {}
+        self._postagens: Dict[str, List[Hashable]] = {}
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+    def adicionar(self, chave: Hashable, titulo: str) -> None:
+        tokens = set(normalizar_titulo(titulo))
+        self._tokens[chave] = tokens
+        for token in tokens:
+            self._postagens.setdefault(token, []).append(chave)
+
+    def candidatos(self, titulo: str, limiar: float = LIMIAR_PADRAO) -> List[Tuple[float, Hashable]]:
+        """Títulos com similaridade >= limiar, do mais parecido para o menos parecido."""
+        tokens = set(normalizar_titulo(titulo))
+        if not tokens:
+            return []
+        em_comum: Dict[Hashable, int] = {}
+        for token in tokens:
+            for chave in self._postagens.get(token, ()):
+                em_comum[chave] = em_comum.get(chave, 0) + 1
+        resultado = []
+        for chave, comum in em_comum.items():
+            nota = 2 * comum / (len(tokens) + len(self._tokens[chave]))
+            if nota >= limiar:
+                resultado.append((nota, chave))
+        resultado.sort(key=lambda item: -item[0])
+        return resultado
+
+    def melhor(self, titulo: str, limiar: float = LIMIAR_PADRAO) -> Optional[Hashable]:
+        candidatos = self.candidatos(titulo, limiar)
+        return candidatos[0][1] if candidatos else None
+
+
+def corresponder_secoes(secoes_modelo: list, secoes_template: list, limiar: float = LIMIAR_PADRAO) -> Dict[int, int]:
+    """Casa seções do modelo com seções do template pelo título, um para um.
+
+    Retorna {índice no modelo: índice no template}, atribuindo primeiro os pares mais
+    parecidos. Pares com o mesmo número são ignorados: a combinação por número já os trata.
+    """
+    indice = IndiceTitulos()
+    for j, secao in enumerate(secoes_template):
+        indice.adicionar(j, secao.titulo)
+
+    pares = []
+    for i, secao in enumerate(secoes_modelo):
+        for nota, j in indice.candidatos(secao.titulo, limiar):
+            if caminho_numerico(secao.numero) != caminho_numerico(secoes_template[j].numero):
+                pares.append((nota, i, j))
+    pares.sort(key=lambda par: -par[0])
+
+    correspondencia: Dict[int, int] = {}
+    usados: Set[int] = set()
+    for _, i, j in pares:
+        if i not in correspondencia and j not in usados:
+            correspondencia[i] = j
+            usados.add(j)
+    return correspondencia
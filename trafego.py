@@ -0,0 +1,449 @@
+# -*- coding: utf-8 -*-
+"""
+Módulo: trafego.py
+
+Captura anonimizada de gerações reais e reprodução offline, para avaliar mudanças do motor
+com a forma do tráfego de produção (os modelos sintéticos de `benchmark.py` não a têm).
+
+Captura (opcional): com ``TR_CAPTURA_DIR`` apontando para uma pasta, cada geração das
+páginas vira uma linha JSON em ``trafego_AAAAMMDD.jsonl`` (``TR_CAPTURA_AMOSTRA`` = fração
+das gerações capturadas, padrão 1). Nada do texto original é gravado:
+
+- todo texto (valores do ctx, ``dados`` do assistente, parágrafos, títulos e células dos
+  modelos) é trocado por enchimento do mesmo tamanho: letras viram letras, dígitos viram
+  "0", e espaços, pontuação, quebras de linha e placeholders ``{{CHAVE}}`` ficam;
+- dos modelos DOCX fica só a estrutura lida (seções com a numeração, parágrafos e tabelas
+  com as dimensões), que a reprodução transforma de novo num DOCX;
+- das imagens (logotipo, cabeçalho, rodapé) ficam as dimensões;
+- da planilha de itens ficam as linhas e os lotes (renomeados "Lote 1", "Lote 2"...), com os
+  textos anonimizados e, no lugar de quantidades e preços, números com o mesmo número de
+  dígitos.
+
+O enchimento é determinístico: textos iguais continuam iguais, e os caches se comportam
+na reprodução como em produção.
+
+Reprodução:
+
+    python trafego.py capturas/trafego_20261019.jsonl --repeticoes 3 --saida antes.json
+    python trafego.py --comparar antes.json depois.json
+
+Cada registro passa pelo mesmo caminho do worker (leitura, combinação, placeholders,
+geração do DOCX), no próprio processo, e os spans de `rastreamento.py` dão o tempo de cada
+etapa; o relatório traz, por etapa, contagem e percentis (p50, p95, máx.).
+"""
+from __future__ import annotations
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from io import BytesIO
+from typing import Dict, List, Optional
+
+logger = logging.getLogger("tr.trafego")
+
+VERSAO = 1
+_ENCHIMENTO = "loremipsumdolorsitametconsecteturadipiscingelitseddoeiusmodtempor"
+_PLACEHOLDER = re.compile(r"\{\{[A-Za-z0-9_]+\}\}")
+_NUMERO_SECAO = re.compile(r"^\s*\d+(?:\.\d+)*\.?\s*[-–—)]?\s+")
+PREAMBULO = "0. PREÂMBULO"
+# Opções da geração, gravadas como estão; qualquer outra entrada sem tratamento próprio
+# (ctx, dados, objeto, ou uma nova que uma página passe a enviar) é anonimizada.
+_OPCOES = ("modo", "renumerar")
+
+_lock = threading.Lock()
+
+# ==========================
+# Anonimização
+# ==========================
+
+def _encher(trecho: str) -> str:
+    saida = []
+    for i, c in enumerate(trecho):
+        if c.isalpha():
+            letra = _ENCHIMENTO[i % len(_ENCHIMENTO)]
+            saida.append(letra.upper() if c.isupper() else letra)
+        elif c.isdigit():
+            saida.append("0")
+        else:
+            saida.append(c)
+    return "".join(saida)
+
+
+def anonimizar_texto(texto: str) -> str:
+    """Mesmo tamanho, mesmos espaços e pontuação; placeholders ``{{CHAVE}}`` preservados."""
+    partes, inicio = [], 0
+    for m in _PLACEHOLDER.finditer(texto):
+        partes.append(_encher(texto[inicio:m.start()]))
+        partes.append(m.group())
+        inicio = m.end()
+    partes.append(_encher(texto[inicio:]))
+    return "".join(partes)
+
+
+def anonimizar(valor):
+    """Aplica `anonimizar_texto` a todas as strings de uma estrutura (dict/list); as
+    chaves dos dicts, números e booleanos ficam como estão."""
+    if isinstance(valor, str):
+        return anonimizar_texto(valor)
+    if isinstance(valor, dict):
+        return {k: anonimizar(v) for k, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [anonimizar(v) for v in valor]
+    return valor
+
+
+def _titulo_numerado(titulo: str) -> str:
+    # A numeração é estrutura (e o que a leitura usa para segmentar): fica intacta.
+    m = _NUMERO_SECAO.match(titulo)
+    corte = m.end() if m else 0
+    return titulo[:corte] + anonimizar_texto(titulo[corte:])
+
+
+def estrutura_numerada(secoes) -> List[dict]:
+    """Seções lidas (`Secao`) na forma de `secao_para_dict`, com os textos anonimizados.
+    O preâmbulo implícito (conteúdo antes da primeira seção) fica com título None."""
+    from importacao_e_combinacao_tr import secao_para_dict
+
+    estrutura = []
+    for secao in secoes:
+        d = secao_para_dict(secao)
+        implicito = d["numero"] == "0" and d["titulo"] == PREAMBULO
+        estrutura.append({
+            "titulo": None if implicito else _titulo_numerado(d["titulo"]),
+            "numero": d["numero"],
+            "elementos": [{"tipo": e["tipo"], "payload": anonimizar(e["payload"])} for e in d["elementos"]],
+        })
+    return estrutura
+
+
+def _grandeza(valor: float) -> float:
+    # Mesma ordem de grandeza (nº de dígitos na formatação) e parte fracionária nula ou não.
+    if not valor > 0:
+        return 0.0
+    base = 10.0 ** math.floor(math.log10(valor)) if valor >= 1 else 0.0
+    return base + (0.5 if valor != int(valor) else 0.0)
+
+
+def estrutura_itens(itens) -> Optional[dict]:
+    """Planilha de itens (`itens_tr.TabelaItens`) anonimizada, em colunas; None se vazia."""
+    if itens is None or not len(itens):
+        return None
+    # Lotes viram "Lote 1", "Lote 2"... pela ordem em que aparecem: o enchimento trocaria
+    # "Lote 1" e "Lote 2" pelo mesmo texto e juntaria os lotes.
+    lotes: Dict[str, str] = {"": ""}
+    for lote in itens.lote.tolist():
+        lotes.setdefault(lote, f"Lote {len(lotes)}")
+    return {
+        "descricao": anonimizar(itens.descricao.tolist()),
+        "unidade": anonimizar(itens.unidade.tolist()),
+        "lote": [lotes[lote] for lote in itens.lote.tolist()],
+        "quantidade": [_grandeza(q) for q in itens.quantidade.tolist()],
+        "preco_centavos": [int(_grandeza(p)) for p in itens.preco_centavos.tolist()],
+    }
+
+
+def _imagem(conteudo) -> Optional[dict]:
+    """Dimensões e tamanho de uma imagem (bytes ou caminho); None se não houver."""
+    if not conteudo:
+        return None
+    try:
+        if isinstance(conteudo, str):
+            if not os.path.exists(conteudo):
+                return None
+            with open(conteudo, "rb") as f:
+                conteudo = f.read()
+        from PIL import Image
+        with Image.open(BytesIO(conteudo)) as img:
+            return {"largura": img.width, "altura": img.height, "bytes": len(conteudo)}
+    except Exception:
+        return {"largura": 0, "altura": 0, "bytes": len(conteudo) if isinstance(conteudo, bytes) else 0}
+
+# ==========================
+# Captura
+# ==========================
+
+def _destino() -> str:
+    return os.environ.get("TR_CAPTURA_DIR", "").strip()
+
+
+def _registro(app: str, entradas: dict) -> dict:
+    from tarefas import ler_modelo_no_pool
+
+    registro: dict = {"versao": VERSAO, "quando": datetime.now().isoformat(timespec="seconds"), "app": app}
+    for chave, valor in entradas.items():
+        if chave == "modelo":
+            # DOCX com numeração manual: a leitura já está no cache do servidor.
+            registro[chave] = estrutura_numerada(ler_modelo_no_pool(valor)) if valor else None
+        elif chave == "modelo_headings":
+            registro[chave] = anonimizar([list(bloco) for bloco in valor]) if valor else None
+        elif chave == "fontes":
+            # Nomes de arquivo também são anonimizados, de forma consistente com `substituicoes`.
+            registro[chave] = [
+                {"nome": nome if nome == "template" else anonimizar_texto(nome),
+                 "modelo": estrutura_numerada(ler_modelo_no_pool(dados)) if dados else None,
+                 "prioridade": prioridade}
+                for nome, dados, prioridade in valor
+            ]
+        elif chave == "substituicoes":
+            registro[chave] = {numero: nome if nome == "template" else anonimizar_texto(nome) for numero, nome in valor.items()}
+        elif chave in ("logo", "cabecalho", "rodape"):
+            registro[chave] = _imagem(valor)
+        elif chave == "itens":
+            registro[chave] = estrutura_itens(valor)
+        elif chave in _OPCOES:
+            registro[chave] = valor
+        else:
+            registro[chave] = anonimizar(valor)
+    return registro
+
+
+def capturar(app: str, operacao: str, **entradas) -> None:
+    """Grava (anonimizada) a geração que acabou de acontecer, se a captura estiver ligada.
+
+    `operacao` ∈ {"blocos", "assistente", "termo", "combinar", "fontes"}; as entradas são as
+    da página (ctx, dados, modelo em bytes, modelo_headings, itens, fontes, logo, modo...). Erros
+    na captura só vão para o log: nunca atrapalham a geração."""
+    pasta = _destino()
+    if not pasta or random.random() >= float(os.environ.get("TR_CAPTURA_AMOSTRA", "1")):
+        return
+    try:
+        linha = json.dumps({**_registro(app, entradas), "operacao": operacao}, ensure_ascii=False)
+        os.makedirs(pasta, exist_ok=True)
+        caminho = os.path.join(pasta, f"trafego_{datetime.now():%Y%m%d}.jsonl")
+        with _lock, open(caminho, "a", encoding="utf-8") as f:
+            f.write(linha + "\n")
+    except Exception:
+        logger.exception("falha ao capturar a geração (%s/%s)", app, operacao)
+
+# ==========================
+# Reconstrução das entradas
+# ==========================
+
+def docx_numerado(estrutura: List[dict]) -> bytes:
+    """DOCX que `ler_modelo_docx` lê de volta com a mesma estrutura."""
+    from docx import Document
+
+    doc = Document()
+    for secao in estrutura:
+        if secao["titulo"] is not None:
+            doc.add_paragraph(secao["titulo"])
+        for el in secao["elementos"]:
+            if el["tipo"] == "table":
+                linhas = el["payload"]
+                colunas = max((len(l) for l in linhas), default=0)
+                if not linhas or not colunas:
+                    continue
+                tabela = doc.add_table(rows=len(linhas), cols=colunas)
+                for i, linha in enumerate(linhas):
+                    for j, texto in enumerate(linha):
+                        tabela.cell(i, j).text = texto
+            else:
+                doc.add_paragraph(el["payload"])
+    buffer = BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def docx_headings(blocos: List[List[str]]) -> bytes:
+    """DOCX que `ler_modelo_docx_headings` lê de volta com os mesmos blocos."""
+    from docx import Document
+
+    doc = Document()
+    for titulo, texto in blocos:
+        doc.add_paragraph(titulo, style="Heading 1")
+        for linha in texto.split("\n"):
+            doc.add_paragraph(linha)
+    buffer = BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def _png(dimensoes: Optional[dict]) -> Optional[bytes]:
+    if not dimensoes or not dimensoes.get("largura"):
+        return None
+    from PIL import Image
+    buffer = BytesIO()
+    Image.new("RGB", (dimensoes["largura"], dimensoes["altura"]), (30, 90, 160)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _arquivo_png(dimensoes: Optional[dict], pasta: str, nome: str) -> Optional[str]:
+    dados = _png(dimensoes)
+    if dados is None:
+        return None
+    caminho = os.path.join(pasta, nome)
+    with open(caminho, "wb") as f:
+        f.write(dados)
+    return caminho
+
+# ==========================
+# Reprodução
+# ==========================
+
+def preparar(registro: dict, pasta: str):
+    """Reconstrói as entradas e devolve uma função sem argumentos que refaz a geração,
+    pelo mesmo caminho dos workers de `tarefas.py`."""
+    import tarefas
+    from rastreamento import span
+    from plano_tr import construir_blocos
+    from itens_tr import TabelaItens
+    from importacao_e_combinacao_tr import (
+        gerar_docx_blocos,
+        gerar_docx_texto,
+        gerar_texto_tr,
+        ler_modelo_docx_headings,
+        texto_termo,
+    )
+
+    operacao = registro["operacao"]
+    if operacao == "blocos":
+        modelo = docx_headings(registro["modelo_headings"]) if registro.get("modelo_headings") else None
+        ctx = registro.get("ctx") or {}
+        itens = TabelaItens(**registro["itens"]) if registro.get("itens") else None
+
+        def refazer():
+            modelos = {}
+            if modelo:
+                # Esta leitura não tem span próprio no motor.
+                with span("ler_modelo_docx_headings"):
+                    modelos["modelo"] = ler_modelo_docx_headings(BytesIO(modelo))
+            blocos = construir_blocos(registro.get("modo", "interno"), ctx, modelos, "modelo" if modelo else None)
+            return gerar_docx_blocos(blocos, ctx, logo_path=None, rodape_path=None, itens=itens)
+        return refazer
+    if operacao == "assistente":
+        logo = _png(registro.get("logo"))
+        return lambda: gerar_docx_texto(gerar_texto_tr(registro["dados"]), logo=BytesIO(logo) if logo else None)
+    if operacao == "termo":
+        return lambda: gerar_docx_texto(texto_termo(registro["objeto"]).strip())
+    cabecalho = _arquivo_png(registro.get("cabecalho"), pasta, "cabecalho.png")
+    rodape = _arquivo_png(registro.get("rodape"), pasta, "rodape.png")
+    if operacao == "combinar":
+        modelo = docx_numerado(registro["modelo"]) if registro.get("modelo") else None
+        return lambda: tarefas.tarefa_combinar_e_gerar(
+            modelo, registro.get("modo", "complementar"), cabecalho, rodape, registro.get("renumerar", False))
+    if operacao == "fontes":
+        fontes = [(f["nome"], docx_numerado(f["modelo"]) if f["modelo"] else None, f["prioridade"]) for f in registro["fontes"]]
+        return lambda: tarefas.tarefa_combinar_fontes_e_gerar(
+            fontes, registro.get("substituicoes") or {}, cabecalho, rodape, registro.get("renumerar", False))
+    raise ValueError(f"operação desconhecida: {operacao}")
+
+
+def _percentil(valores: List[float], p: float) -> float:
+    ordenados = sorted(valores)
+    posicao = (len(ordenados) - 1) * p / 100
+    baixo = int(posicao)
+    alto = min(baixo + 1, len(ordenados) - 1)
+    return ordenados[baixo] + (ordenados[alto] - ordenados[baixo]) * (posicao - baixo)
+
+
+def _resumo(tempos: Dict[str, List[float]]) -> List[dict]:
+    return [
+        {"etapa": nome, "n": len(v), "total_ms": round(sum(v), 3), "p50_ms": round(_percentil(v, 50), 3),
+         "p95_ms": round(_percentil(v, 95), 3), "max_ms": round(max(v), 3)}
+        for nome, v in sorted(tempos.items())
+    ]
+
+
+def reproduzir(registros: List[dict], repeticoes: int = 1, saida=sys.stderr) -> dict:
+    """Refaz cada registro `repeticoes` vezes, na ordem da captura, e agrega os spans."""
+    from rastreamento import coletar
+
+    etapas: Dict[str, List[float]] = defaultdict(list)
+    por_operacao: Dict[str, List[float]] = defaultdict(list)
+    erros: List[str] = []
+    with tempfile.TemporaryDirectory(prefix="tr_reproducao_") as pasta:
+        for indice, registro in enumerate(registros):
+            chave = f"{registro.get('app', '?')}/{registro['operacao']}"
+            try:
+                refazer = preparar(registro, pasta)
+            except Exception as e:
+                erros.append(f"registro {indice} ({chave}): {type(e).__name__}: {e}")
+                continue
+            for _ in range(repeticoes):
+                inicio = time.perf_counter()
+                try:
+                    with coletar() as spans:
+                        refazer()
+                except Exception as e:
+                    erros.append(f"registro {indice} ({chave}): {type(e).__name__}: {e}")
+                    break
+                por_operacao[chave].append((time.perf_counter() - inicio) * 1000)
+                for span in spans:
+                    etapas[span["nome"]].append(span["wall_ms"])
+            print(f"{indice + 1}/{len(registros)} {chave}", file=saida)
+    return {
+        "registros": len(registros),
+        "repeticoes": repeticoes,
+        "operacoes": _resumo(por_operacao),
+        "etapas": _resumo(etapas),
+        "erros": erros[:20],
+    }
+
+
+def carregar(caminhos: List[str]) -> List[dict]:
+    registros = []
+    for caminho in caminhos:
+        with open(caminho, encoding="utf-8") as f:
+            registros.extend(json.loads(linha) for linha in f if linha.strip())
+    return [r for r in registros if r.get("versao") == VERSAO]
+
+
+def comparar(antes: dict, depois: dict) -> List[str]:
+    """Razão depois/antes da mediana e do p95 por etapa."""
+    base = {e["etapa"]: e for e in antes["etapas"]}
+    linhas = [f"{'etapa':<28} {'p50':>8} {'p95':>8}"]
+    for e in depois["etapas"]:
+        a = base.get(e["etapa"])
+        if a is None:
+            continue
+        p50 = e["p50_ms"] / a["p50_ms"] if a["p50_ms"] else float("nan")
+        p95 = e["p95_ms"] / a["p95_ms"] if a["p95_ms"] else float("nan")
+        linhas.append(f"{e['etapa']:<28} {p50:>7.2f}x {p95:>7.2f}x")
+    return linhas
+
+
+def _imprimir(tabela: List[dict], titulo: str) -> None:
+    print(f"{titulo:<28} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} {'máx ms':>9}")
+    for l in tabela:
+        print(f"{l['etapa']:<28} {l['n']:>5} {l['p50_ms']:>9.1f} {l['p95_ms']:>9.1f} {l['max_ms']:>9.1f}")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Reproduz offline o tráfego capturado (TR_CAPTURA_DIR).")
+    parser.add_argument("arquivos", nargs="*", help="arquivos trafego_*.jsonl")
+    parser.add_argument("--repeticoes", type=int, default=1)
+    parser.add_argument("--saida", help="grava o relatório em JSON")
+    parser.add_argument("--comparar", nargs=2, metavar=("ANTES", "DEPOIS"))
+    args = parser.parse_args(argv)
+
+    if args.comparar:
+        with open(args.comparar[0], encoding="utf-8") as fa, open(args.comparar[1], encoding="utf-8") as fd:
+            print("\n".join(comparar(json.load(fa), json.load(fd))))
+        return
+    if not args.arquivos:
+        parser.error("informe os arquivos capturados ou --comparar")
+
+    # Um span por etapa no log distorceria as medições; o relatório já os agrega.
+    os.environ.setdefault("TR_RASTREIO_LOG", "0")
+    relatorio = reproduzir(carregar(args.arquivos), args.repeticoes)
+    _imprimir(relatorio["operacoes"], "operação")
+    print()
+    _imprimir(relatorio["etapas"], "etapa")
+    for erro in relatorio["erros"]:
+        print(f"  erro: {erro}")
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(relatorio, f, ensure_ascii=False, indent=1)
+
+
+if __name__ == "__main__":
+    main()